@@ -0,0 +1,225 @@
+"""
+Benchmarks of the cleaning and matching steps on synthetic corpora (benchmarks/synthetic_corpus.py).
+
+Timed at each scale (number of names):
+    cleaning_id                   raw substance and supplier names (memoization cache cleared first)
+    clean_product_aggressively    substance names
+    clean_supplier_aggressively   supplier names
+    process_source1_item          --items source_1 substances against a source_2 of scale substances
+    candidates_pool / _cdist      full candidate generation of both engines, source_2 of scale substances
+                                  and source_1 of scale / --source-1-ratio substances
+
+Results are written as JSON (--output). With --baseline, each result is compared with the same
+benchmark and scale of a saved results file, the ones slower than (1 + --tolerance) x the baseline
+(and by more than --min-delta seconds) are flagged and the exit code is 1.
+
+Run from the mapping_suppliers folder:
+    python -m benchmarks.run_benchmarks --output benchmark_baseline.json
+    python -m benchmarks.run_benchmarks --baseline benchmark_baseline.json
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import main
+from benchmarks.synthetic_corpus import SyntheticCorpus
+from utils import config, fuzzy_matching, score_matrix, scoring_cascade, str_processing, tfidf_engine, token_index
+
+BENCHMARKS = ['cleaning_id', 'clean_product_aggressively', 'clean_supplier_aggressively', 'process_source1_item', 'candidates_pool', 'candidates_cdist', 'candidates_tfidf']
+
+
+def build_source_data(names, mapping_config: config.MappingConfig):
+    """Source data dict of generate_batch for a list of cleaned ids."""
+    clean_func = fuzzy_matching.clean_product_name_aggressively_pharma if mapping_config.mapping_type == config.MappingType.SUBSTANCE else fuzzy_matching.clean_supplier_name_aggressively_pharma
+    has_intermediate = [mapping_config.mapping_type == config.MappingType.SUBSTANCE and 'intermediate' in name.lower() for name in names]
+    return {
+        'orig_list': names,
+        'cleaned_list': [clean_func(name) for name in names],
+        'indices': list(range(len(names))),
+        'index_to_orig': dict(enumerate(names)),
+        'has_intermediate_list': has_intermediate,
+    }
+
+
+def timed(function, repeat):
+    """Best time of repeat runs, with the result of the last run."""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_scale(scale, args, mapping_config):
+    results = []
+    corpus = SyntheticCorpus(args.seed)
+
+    def record(name, seconds, items, **extra):
+        result = {'name': name, 'scale': scale, 'seconds': round(seconds, 6), 'items': items,
+                  'items_per_second': round(items / seconds, 1) if seconds > 0 else None, **extra}
+        results.append(result)
+        extra_text = ''.join(f", {key} {value}" for key, value in extra.items())
+        print(f"{name:<28} scale {scale:>7}: {seconds:9.3f}s ({result['items_per_second']} items/s{extra_text})")
+
+    substances = corpus.substance_names(scale)
+    suppliers = corpus.supplier_names(scale)
+
+    if 'cleaning_id' in args.benchmarks:
+        def clean_all():
+            str_processing._cleaning_id_str.cache_clear()
+            return [str_processing.cleaning_id(name) for name in substances + suppliers]
+        seconds, _ = timed(clean_all, args.repeat)
+        record('cleaning_id', seconds, len(substances) + len(suppliers))
+
+    cleaned_substances = [str_processing.cleaning_id(name) for name in substances]
+    cleaned_suppliers = [str_processing.cleaning_id(name) for name in suppliers]
+
+    if 'clean_product_aggressively' in args.benchmarks:
+        seconds, _ = timed(lambda: [fuzzy_matching.clean_product_name_aggressively_pharma(name) for name in cleaned_substances], args.repeat)
+        record('clean_product_aggressively', seconds, len(cleaned_substances))
+
+    if 'clean_supplier_aggressively' in args.benchmarks:
+        seconds, _ = timed(lambda: [fuzzy_matching.clean_supplier_name_aggressively_pharma(name) for name in cleaned_suppliers], args.repeat)
+        record('clean_supplier_aggressively', seconds, len(cleaned_suppliers))
+
+    matching = [benchmark for benchmark in ('process_source1_item', 'candidates_pool', 'candidates_cdist', 'candidates_tfidf') if benchmark in args.benchmarks]
+    if not matching:
+        return results
+
+    source_1_names, source_2_names = corpus.sources('substance', max(args.items, scale // args.source_1_ratio), scale)
+    source_1_names = list(dict.fromkeys(str_processing.cleaning_id(name) for name in source_1_names))
+    source_2_names = list(dict.fromkeys(str_processing.cleaning_id(name) for name in source_2_names))
+    source_1_data = build_source_data(source_1_names, mapping_config)
+    source_2_data = build_source_data(source_2_names, mapping_config)
+
+    if 'process_source1_item' in args.benchmarks:
+        # Same per-run state as a pool worker: token index and token lengths built once
+        worker_source_2_data = dict(source_2_data)
+        worker_source_2_data['token_index'] = token_index.TokenIndex(source_2_data['cleaned_list'])
+        worker_source_2_data['has_intermediate_list'] = np.array(source_2_data['has_intermediate_list'])
+        worker_source_2_data['cleaned_token_lengths'] = np.array([scoring_cascade.token_length(name) for name in source_2_data['cleaned_list']], dtype=np.int64)
+
+        def match_items():
+            candidates = []
+            for index_1 in range(args.items):
+                source_1_tuple = (index_1, source_1_data['orig_list'][index_1], source_1_data['cleaned_list'][index_1], source_1_data['has_intermediate_list'][index_1])
+                candidates.extend(main.process_source1_item(source_1_tuple, worker_source_2_data, mapping_config))
+            return candidates
+        seconds, candidates = timed(match_items, args.repeat)
+        record('process_source1_item', seconds, args.items, candidates=len(candidates), source_2=len(source_2_names))
+
+    if 'candidates_pool' in args.benchmarks:
+        seconds, (candidates, _) = timed(lambda: main.generate_candidates_pool(source_1_data, source_2_data, mapping_config, args.cores, args.multiproc_chunksize), args.repeat)
+        record('candidates_pool', seconds, len(source_1_names), candidates=len(candidates), source_2=len(source_2_names))
+
+    if 'candidates_cdist' in args.benchmarks:
+        seconds, candidates = timed(lambda: score_matrix.generate_candidates(
+            source_1_data, source_2_data,
+            threshold_orig=mapping_config.fuzzy_match_threshold,
+            threshold_cleaned=mapping_config.cleaned_fuzzy_match_threshold,
+            filter_intermediate=True,
+            scorers_cleaned=main.SCORERS_CLEANED,
+            scorers_orig=main.SCORERS_ORIG,
+            workers=args.cores
+        ), args.repeat)
+        record('candidates_cdist', seconds, len(source_1_names), candidates=len(candidates), source_2=len(source_2_names))
+
+    if 'candidates_tfidf' in args.benchmarks:
+        seconds, (candidates, _) = timed(lambda: main.generate_candidates_tfidf(
+            source_1_data, source_2_data, mapping_config,
+            tfidf_engine.DEFAULT_TOP_K, tfidf_engine.DEFAULT_BLOCK_ROWS, tfidf_engine.DEFAULT_MAX_DF, args.cores
+        ), args.repeat)
+        record('candidates_tfidf', seconds, len(source_1_names), candidates=len(candidates), source_2=len(source_2_names))
+
+    return results
+
+
+def compare_with_baseline(results, baseline_path, tolerance, min_delta):
+    """Prints the ratio to the baseline of every result, returns the number of regressions."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(result['name'], result['scale']): result for result in json.load(f)['results']}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (tolerance {tolerance * 100:.0f}%):")
+    for result in results:
+        reference = baseline.get((result['name'], result['scale']))
+        if reference is None or not reference['seconds']:
+            print(f"{result['name']:<28} scale {result['scale']:>7}: not in the baseline")
+            continue
+        ratio = result['seconds'] / reference['seconds']
+        flag = ''
+        # Timings of a few milliseconds are mostly noise, they need an absolute slowdown too
+        if ratio > 1 + tolerance and result['seconds'] - reference['seconds'] > min_delta:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - tolerance and reference['seconds'] - result['seconds'] > min_delta:
+            flag = '  faster'
+        print(f"{result['name']:<28} scale {result['scale']:>7}: {reference['seconds']:9.3f}s -> {result['seconds']:9.3f}s (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_benchmarks():
+    parser = argparse.ArgumentParser(description='Benchmarks of the cleaning and matching steps on synthetic corpora.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS, metavar='benchmark', help=f"Among {', '.join(BENCHMARKS)} (default: all).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per benchmark, the best time is kept.')
+    parser.add_argument('--items', type=int, default=20, help='source_1 items matched by the process_source1_item benchmark.')
+    parser.add_argument('--source-1-ratio', type=int, default=100, help='Candidate generation: source_1 has scale / ratio items.')
+    parser.add_argument('--cores', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--multiproc-chunksize', type=int, default=50)
+    parser.add_argument('--output', type=str, default=None, help='JSON results file (default: benchmark_results_<date>.json).')
+    parser.add_argument('--baseline', type=str, default=None, help='Results file to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Slowdown ratio over the baseline flagged as a regression.')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Slowdowns of less than this many seconds are never flagged.')
+    args = parser.parse_args()
+    unknown_benchmarks = [benchmark for benchmark in args.benchmarks if benchmark not in BENCHMARKS]
+    if unknown_benchmarks:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown_benchmarks)}")
+
+    mapping_config = config.get_mapping_config('substance_orange_book_to_usdmf')
+    results = []
+    for scale in args.scales:
+        results.extend(run_scale(scale, args, mapping_config))
+
+    output = args.output or f"benchmark_results_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.json"
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'git_commit': get_git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'cores': args.cores,
+                'seed': args.seed,
+                'repeat': args.repeat,
+            },
+            'results': results,
+        }, f, indent=4)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance, args.min_delta)
+        print(f"{regressions} regressions" if regressions else "No regression")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main_benchmarks()
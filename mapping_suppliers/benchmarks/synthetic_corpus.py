@@ -0,0 +1,166 @@
+"""
+Seeded generator of realistic substance and supplier names for the benchmarks.
+
+Substances: a base molecule (real INNs, then invented ones built from INN stems) with salts, hydrates,
+pharmacopeia suffixes, intermediates and spellings of other languages ("NAPROXENO SODICO", "Acidum ...").
+Suppliers: a core company name with geographic prefixes, industry terms, legal suffixes and site designators.
+The same seed always gives the same names.
+"""
+import random
+
+SUBSTANCE_BASES = [
+    'NAPROXEN', 'IBUPROFEN', 'DOCETAXEL', 'PACLITAXEL', 'PEMETREXED', 'ZOLEDRONIC ACID', 'METFORMIN', 'ATORVASTATIN',
+    'ROSUVASTATIN', 'SIMVASTATIN', 'AMLODIPINE', 'LOSARTAN', 'VALSARTAN', 'CANDESARTAN', 'LISINOPRIL', 'ENALAPRIL',
+    'RAMIPRIL', 'METOPROLOL', 'ATENOLOL', 'BISOPROLOL', 'OMEPRAZOLE', 'ESOMEPRAZOLE', 'PANTOPRAZOLE', 'LANSOPRAZOLE',
+    'CIPROFLOXACIN', 'LEVOFLOXACIN', 'MOXIFLOXACIN', 'AMOXICILLIN', 'AMPICILLIN', 'CEFTRIAXONE', 'CEFUROXIME',
+    'AZITHROMYCIN', 'CLARITHROMYCIN', 'DOXYCYCLINE', 'FLUCONAZOLE', 'ITRACONAZOLE', 'IMATINIB', 'GEFITINIB',
+    'ERLOTINIB', 'SUNITINIB', 'SERTRALINE', 'FLUOXETINE', 'PAROXETINE', 'CITALOPRAM', 'ESCITALOPRAM', 'DIAZEPAM',
+    'LORAZEPAM', 'ALPRAZOLAM', 'MORPHINE', 'OXYCODONE', 'FENTANYL', 'TRAMADOL', 'KETOROLAC', 'DICLOFENAC',
+    'PREDNISOLONE', 'DEXAMETHASONE', 'HYDROCORTISONE', 'TESTOSTERONE', 'ESTRADIOL', 'LEVOTHYROXINE', 'WARFARIN',
+    'CLOPIDOGREL', 'HEPARIN', 'INSULIN GLARGINE', 'SILDENAFIL', 'TADALAFIL', 'ONDANSETRON', 'METOCLOPRAMIDE',
+    'UREA (13C)', 'ACIDUM PICRINICUM', 'LOTEPREDNOL', 'ACITRETIN', 'ETIDOCAINE', 'GABAPENTIN', 'PREGABALIN',
+]
+# INN stems used to invent more bases than the list above
+BASE_PREFIXES = ['ami', 'bena', 'cara', 'dexa', 'eto', 'flu', 'gala', 'halo', 'ido', 'keto', 'lora', 'meta', 'nora',
+                 'oxa', 'pira', 'quina', 'rami', 'sima', 'tela', 'vala', 'zola', 'cefa', 'levo', 'proca', 'tri']
+BASE_MIDDLES = ['', 'bu', 'ci', 'do', 'fe', 'li', 'mo', 'ne', 'pa', 'ro', 'ta', 'xi']
+BASE_STEMS = ['olol', 'pril', 'sartan', 'azole', 'cillin', 'statin', 'oxacin', 'tinib', 'mab', 'dipine', 'prazole',
+              'tidine', 'setron', 'profen', 'caine', 'triptan', 'vudine', 'lukast', 'gliptin', 'parin']
+SALTS = ['SODIUM', 'POTASSIUM', 'CALCIUM', 'MAGNESIUM', 'HYDROCHLORIDE', 'HCL', 'HYDROBROMIDE', 'MESYLATE', 'MESILATE',
+         'BESYLATE', 'MALEATE', 'FUMARATE', 'TARTRATE', 'CITRATE', 'SULFATE', 'SULPHATE', 'PHOSPHATE', 'ACETATE',
+         'SUCCINATE', 'DISODIUM', 'NA', 'K', 'TROMETAMOL', 'ETABONATE', 'ENANTHATE', 'PROPIONATE']
+HYDRATES = ['MONOHYDRATE', 'DIHYDRATE', 'TRIHYDRATE', 'HEMIHYDRATE', 'SESQUIHYDRATE', '2.5-HYDRATE', 'ANHYDROUS', 'HYDRATE']
+PHARMACOPEIAS = ['USP', 'EP', 'BP', 'JP', 'PH. EUR.', 'USP/EP', 'MICRONIZED', 'STERILE', 'API', 'BASE']
+# Spelling of the salt in other languages (Spanish, French, German, Italian)
+SALT_TRANSLATIONS = {
+    'SODIUM': ['SODICO', 'SODIQUE', 'NATRIUM', 'SODICO'], 'POTASSIUM': ['POTASICO', 'POTASSIQUE', 'KALIUM', 'POTASSICO'],
+    'CALCIUM': ['CALCICO', 'CALCIQUE', 'CALCIUM', 'CALCICO'], 'HYDROCHLORIDE': ['CLORHIDRATO', 'CHLORHYDRATE', 'HYDROCHLORID', 'CLORIDRATO'],
+    'SULFATE': ['SULFATO', 'SULFATE', 'SULFAT', 'SOLFATO'], 'ACETATE': ['ACETATO', 'ACETATE', 'ACETAT', 'ACETATO'],
+}
+LANGUAGE_ENDINGS = ['O', 'E', 'UM', 'A']
+
+GEOGRAPHIC_PREFIXES = ['Zhejiang', 'Jiangsu', 'Shandong', 'Hubei', 'Sichuan', 'Chongqing', 'Shanghai', 'Beijing',
+                       'Hyderabad', 'Mumbai', 'Gujarat', 'Ahmedabad', 'Bangalore', 'Polfa', 'Lombardia', 'Bavaria']
+COMPANY_SYLLABLES = ['hua', 'hai', 'heng', 'rui', 'xin', 'jin', 'kang', 'tai', 'sun', 'aur', 'obin', 'dr', 'red',
+                     'lu', 'pin', 'ci', 'pla', 'cipla', 'zy', 'dus', 'tor', 'rent', 'bay', 'er', 'no', 'var', 'tis',
+                     'ab', 'bv', 'ie', 'al', 'ka', 'loid', 'med', 'chal', 'si', 'gma', 'ald', 'rich', 'te', 'va']
+INDUSTRY_TERMS = ['Pharmaceutical', 'Pharmaceuticals', 'Pharma', 'Chemicals', 'Chem', 'Laboratories', 'Labs',
+                  'Biotech', 'Life Sciences', 'Healthcare', 'Fine Chemicals', 'Drugs', 'Biopharma']
+LEGAL_SUFFIXES = ['Co., Ltd.', 'Co Ltd', 'Ltd', 'Limited', 'Inc', 'Inc.', 'LLC', 'GmbH', 'AG', 'S.p.A.', 'SpA',
+                  'S.A.', 'SAS', 'SL', 'Pvt Ltd', 'Private Limited', 'Corp', 'Corporation', 'PLC', 'B.V.', 'KG']
+SITE_DESIGNATORS = ['- Site {city}', 'Plant {number}', 'Unit {roman}', ', {city} Facility', '({city} Plant)',
+                    '- {city} Site', 'Site {letter}', 'Block {letter}']
+CITIES = ['Medchal', 'Ringaskiddy', 'Visakhapatnam', 'Taizhou', 'Linhai', 'Ankleshwar', 'Vapi', 'Basel', 'Leverkusen',
+          'Cork', 'Barcelona', 'Milano', 'Lyon', 'Ljubljana', 'Kalundborg', 'Puerto Rico']
+
+
+class SyntheticCorpus:
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    # --- Substances ---
+
+    def substance_base(self):
+        rng = self.rng
+        if rng.random() < 0.3:
+            return rng.choice(SUBSTANCE_BASES)
+        return (rng.choice(BASE_PREFIXES) + rng.choice(BASE_MIDDLES) + rng.choice(BASE_STEMS)).upper()
+
+    def substance_variant(self, base):
+        """One spelling of a substance of the given base molecule."""
+        rng = self.rng
+        salt = rng.choice(SALTS) if rng.random() < 0.55 else None
+        words = [base]
+        if rng.random() < 0.12:
+            # Spelling of another language: NAPROXENO SODICO, Acidum ...icum
+            language = rng.randrange(4)
+            if base.endswith('ACID'):
+                words = ['ACIDUM', base.split()[0] + 'UM']
+            else:
+                words = [(base[:-1] if base.endswith('E') else base) + LANGUAGE_ENDINGS[language]]
+            if salt in SALT_TRANSLATIONS:
+                salt = SALT_TRANSLATIONS[salt][language]
+        if salt:
+            words.append(salt)
+        if rng.random() < 0.2:
+            words.append(rng.choice(HYDRATES))
+        if rng.random() < 0.2:
+            words.append(rng.choice(PHARMACOPEIAS))
+        if rng.random() < 0.04:
+            words = [f"INTERMEDIATE FOR {' '.join(words)} API"] if rng.random() < 0.5 else words + ['INTERMEDIATE']
+        if rng.random() < 0.03:
+            words.append(f"D{rng.randint(1, 12)}")
+        name = ' '.join(words)
+        case = rng.random()
+        if case < 0.25:
+            name = name.title()
+        elif case < 0.35:
+            name = name.lower()
+        return name
+
+    def substance_names(self, count):
+        return [self.substance_variant(self.substance_base()) for _ in range(count)]
+
+    # --- Suppliers ---
+
+    def company_core(self):
+        rng = self.rng
+        return ''.join(rng.choice(COMPANY_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+    def supplier_variant(self, core):
+        """One spelling of a supplier of the given core company name."""
+        rng = self.rng
+        words = []
+        if rng.random() < 0.35:
+            words.append(rng.choice(GEOGRAPHIC_PREFIXES))
+        words.append(core)
+        if rng.random() < 0.7:
+            words.append(rng.choice(INDUSTRY_TERMS))
+        if rng.random() < 0.75:
+            words.append(rng.choice(LEGAL_SUFFIXES))
+        if rng.random() < 0.3:
+            words.append(rng.choice(SITE_DESIGNATORS).format(
+                city=rng.choice(CITIES), number=rng.randint(1, 9), roman=rng.choice(['I', 'II', 'III', 'IV', 'IX']),
+                letter=rng.choice('ABCDEF')
+            ))
+        name = ' '.join(words)
+        if rng.random() < 0.4:
+            name = name.upper()
+        return name
+
+    def supplier_names(self, count):
+        return [self.supplier_variant(self.company_core()) for _ in range(count)]
+
+    # --- Matching sources ---
+
+    def sources(self, kind, source_1_count, source_2_count, overlap=0.5):
+        """
+        Two lists of distinct names of the same kind ('substance' or 'supplier'). overlap of the source_1
+        names are other spellings of a source_2 entity, so the matching has candidates to find.
+        """
+        source_1, source_2, _ = self.labelled_sources(kind, source_1_count, source_2_count, overlap)
+        return source_1, source_2
+
+    def labelled_sources(self, kind, source_1_count, source_2_count, overlap=0.5):
+        """
+        sources() plus the labels: the (source_1 name, source_2 name) pairs spelling the same entity
+        (base molecule or core company name).
+        """
+        rng = self.rng
+        new_entity = self.substance_base if kind == 'substance' else self.company_core
+        variant = self.substance_variant if kind == 'substance' else self.supplier_variant
+        entities_2 = [new_entity() for _ in range(source_2_count)]
+        # Name -> entity of its first occurrence
+        source_2 = {}
+        for entity in entities_2:
+            source_2.setdefault(variant(entity), entity)
+        source_1 = {}
+        for _ in range(source_1_count):
+            entity = rng.choice(entities_2) if rng.random() < overlap else new_entity()
+            source_1.setdefault(variant(entity), entity)
+
+        source_2_by_entity = {}
+        for name, entity in source_2.items():
+            source_2_by_entity.setdefault(entity, []).append(name)
+        positive_pairs = {(name, name_2) for name, entity in source_1.items() for name_2 in source_2_by_entity.get(entity, ())}
+        return list(source_1), list(source_2), positive_pairs
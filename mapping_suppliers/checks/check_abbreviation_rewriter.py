@@ -0,0 +1,56 @@
+"""
+Differential check of fuzzy_matching.clean_product_name_aggressively_pharma against the previous
+implementation (one regex scan per SUBSTANCE_ABBREVIATIONS key) over a seeded synthetic corpus (tests/abbreviation_reference.py).
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_abbreviation_rewriter --size 200000
+"""
+import argparse
+import sys
+import time
+
+from tests.abbreviation_reference import generate_names, reference_clean_product_name, reference_rewrite
+from utils import fuzzy_matching
+
+
+def time_function(function, names, repeat=1):
+    """Best time of repeat runs over the names."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            function(name)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Differential check of the single-pass abbreviation rewriter.')
+    parser.add_argument('--size', type=int, default=200000, help='Number of synthetic names.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic corpus.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per function, the best one is kept.')
+    args = parser.parse_args()
+
+    names = generate_names(args.size, args.seed) + [None, 12, "", "   "]
+    print(f"Generated {len(names)} synthetic names (seed {args.seed}).")
+
+    mismatches = 0
+    for name in names:
+        expected = reference_clean_product_name(name)
+        actual = fuzzy_matching.clean_product_name_aggressively_pharma(name)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 20:
+                print(f"MISMATCH {name!r}: expected {expected!r}, got {actual!r}")
+    print(f"Mismatches: {mismatches} / {len(names)}")
+
+    prepared = [name.lower().replace('(', ' ').replace(')', ' ').replace('y', 'i') for name in names if isinstance(name, str)]
+    reference_time = time_function(reference_rewrite, prepared, args.repeat)
+    rewriter_time = time_function(fuzzy_matching.rewrite_substance_abbreviations, prepared, args.repeat)
+    print(f"Abbreviation rewrite: reference {reference_time:.2f}s, single pass {rewriter_time:.2f}s ({reference_time / rewriter_time:.1f}x)")
+
+    reference_time = time_function(reference_clean_product_name, names, args.repeat)
+    cleaner_time = time_function(fuzzy_matching.clean_product_name_aggressively_pharma, names, args.repeat)
+    print(f"clean_product_name_aggressively_pharma: reference {reference_time:.2f}s, current {cleaner_time:.2f}s ({reference_time / cleaner_time:.1f}x)")
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,140 @@
+"""
+Checks BatchGenUtil's background uploader against a local fake of the OpenAI client
+(slow uploads, transient failures, batch creations timing out after the batch was created): every file
+gets exactly one batch, the recap keeps the order of the files and the uploads overlap with the writing of
+the next files. A file whose upload always fails is reported, the recap keeps the batches of the others.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_batch_uploader
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from utils import batch_gen_util
+
+
+class FakeOpenAI:
+    def __init__(self, latency, failure_every, broken_file=None):
+        self.latency = latency
+        self.failure_every = failure_every
+        self.broken_file = broken_file
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.attempts = {}
+        self.uploaded = {}
+        self.batches_created = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.files = SimpleNamespace(create=self.create_file)
+        self.batches = SimpleNamespace(create=self.create_batch, list=self.list_batches)
+
+    def _call(self, key, before_failure=None):
+        """Every failure_every-th distinct call fails on its first attempt, after before_failure() when given."""
+        with self.lock:
+            self.calls += 1
+            if key not in self.attempts:
+                self.attempts[key] = [len(self.attempts), 0]
+            self.attempts[key][1] += 1
+            index, attempt = self.attempts[key]
+            failing = self.failure_every and index % self.failure_every == 0 and attempt == 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if failing:
+                if before_failure is not None:
+                    before_failure()
+                raise ConnectionError("fake transient error")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def create_file(self, file, purpose):
+        if self.broken_file is not None and file.name == self.broken_file:
+            raise ConnectionError("fake permanent error")
+        self._call(('file', file.name))
+        file_id = f"file-{os.path.basename(file.name)}"
+        with self.lock:
+            self.uploaded[file_id] = file.read()
+        return SimpleNamespace(id=file_id)
+
+    def create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        created = []
+
+        def create():
+            with self.lock:
+                batch = SimpleNamespace(id=f"batch-{len(self.batches_created)}", created_at=time.time(), metadata=metadata)
+                self.batches_created.append((batch.id, input_file_id, batch))
+            created.append(batch)
+        # A failing call times out after the batch was created
+        self._call(('batch', input_file_id), before_failure=create)
+        create()
+        return created[-1]
+
+    def list_batches(self, limit=20):
+        with self.lock:
+            return [batch for _, _, batch in reversed(self.batches_created)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check of the background batch uploader.')
+    parser.add_argument('--files', type=int, default=20, help='Number of batch files written.')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake API latency per call (seconds).')
+    parser.add_argument('--failure-every', type=int, default=5, help='Every n-th fake API call fails once.')
+    args = parser.parse_args()
+
+    client = FakeOpenAI(args.latency, args.failure_every)
+    errors = []
+    with tempfile.TemporaryDirectory() as folder:
+        util = batch_gen_util.BatchGenUtil(main_folder=folder, batch_size=10, client=client, retry_delay=0.01)
+        start = time.perf_counter()
+        written_files = []
+        for i in range(args.files * 10):
+            if util.current_file_path not in written_files:
+                written_files.append(util.current_file_path)
+            util.add_to_batch(json.dumps({"custom_id": f"request-{i}"}))
+        writing_time = time.perf_counter() - start
+        batches = util.conclude_session()
+        total_time = time.perf_counter() - start
+
+        if [batch['batch_input_file_path'] for batch in batches] != written_files:
+            errors.append("recap order differs from the order of the files")
+        if len(client.batches_created) != len(written_files):
+            errors.append(f"{len(client.batches_created)} batches created for {len(written_files)} files")
+        for batch in batches:
+            with open(batch['batch_input_file_path'], 'rb') as f:
+                if client.uploaded[batch['batch_input_file_id']] != f.read():
+                    errors.append(f"uploaded content differs for {batch['batch_input_file_path']}")
+        if any(set(batch) != {'batch_id', 'batch_input_file_id', 'batch_input_file_path'} for batch in batches):
+            errors.append("recap keys changed")
+
+    # --- One file never uploads: the other batches are in the recap, the error is raised after it is written ---
+    with tempfile.TemporaryDirectory() as folder:
+        util = batch_gen_util.BatchGenUtil(main_folder=folder, batch_size=10, client=FakeOpenAI(0, 0), max_attempts=2, retry_delay=0.01)
+        util.client.broken_file = util.current_file_path
+        for i in range(30):
+            util.add_to_batch(json.dumps({"custom_id": f"request-{i}"}))
+        recap_path = os.path.join(folder, 'batch_recap.json')
+        try:
+            util.conclude_session(recap_path)
+            errors.append("no BatchUploadError for the broken file")
+        except batch_gen_util.BatchUploadError as e:
+            print(f"Broken file reported: {e}")
+        with open(recap_path) as f:
+            recap = json.load(f)
+        if len(recap['batches']) != 2 or [failed['batch_input_file_path'] for failed in recap.get('failed_files', [])] != [util.client.broken_file]:
+            errors.append(f"recap with a broken file: {len(recap['batches'])} batches, failed files {recap.get('failed_files')}")
+
+    sequential_time = client.calls * args.latency
+    print(f"{len(written_files)} files, {client.calls} API calls (with retries), max {client.max_in_flight} in flight")
+    print(f"Writing returned after {writing_time:.2f}s, all batches created after {total_time:.2f}s "
+          f"(sequential calls alone: {sequential_time:.2f}s)")
+    for error in errors:
+        print(f"ERROR: {error}")
+    sys.exit(1 if errors else 0)
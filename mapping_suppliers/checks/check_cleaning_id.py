@@ -0,0 +1,111 @@
+"""
+Differential check of str_processing.cleaning_id / cleaning_id_series against the previous
+implementation (chained str.replace, regexes compiled on every call, unidecode on every value).
+Values come from the text columns of the input files plus generated strings with the replaced characters.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_cleaning_id
+"""
+import argparse
+import glob
+import random
+import re
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+from utils import str_processing
+
+
+# --- Previous implementation (reference) ---
+def reference_cleaning_id(id_str):
+    if id_str is None:
+        return None
+    if not isinstance(id_str, str):
+        id_str = str(id_str)
+    for pattern, replacement in str_processing._compiled_misspelled_abbrs.items():
+        id_str = pattern.sub(replacement, id_str)
+    cleaned_name = unidecode(id_str)
+    for old, new in str_processing._REPLACEMENTS.items():
+        cleaned_name = cleaned_name.replace(old, new)
+    cleaned_name = cleaned_name.replace('( ', '(').replace(' )', ')')
+    escaped_punctuation = re.escape(string.punctuation)
+    cleaned_name = re.sub(rf'([{escaped_punctuation}])(\w)', r'\1 \2', cleaned_name)
+    cleaned_name = re.sub(rf'(\w)([{escaped_punctuation}])', r'\1 \2', cleaned_name)
+    cleaned_name = re.sub(r'\s+', ' ', cleaned_name)
+    cleaned_name = re.sub(r'_{2,}', '_', cleaned_name)
+    return cleaned_name.strip()
+
+
+def load_input_values():
+    values = []
+    for path in sorted(glob.glob("inputs/*.csv")):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        for column in df.columns:
+            values.extend(df[column].tolist())
+    return values
+
+
+def generate_values(size, seed):
+    rng = random.Random(seed)
+    alphabet = (
+        list(string.ascii_letters + string.digits + string.punctuation + ' \t\n')
+        + list(str_processing._REPLACEMENTS) + list('éüöñçÅøİıſK中文') + list(str_processing.MISSPELLED)
+    )
+    words = ['acetaminofen', 'Adenosin', 'XENON -133', 'ACETAZOLAMIDE 500MG SRC', 'GmbH', 'S.p.A.', 'Co., Ltd']
+    values = []
+    for _ in range(size):
+        parts = [rng.choice(words) if rng.random() < 0.1 else rng.choice(alphabet) for _ in range(rng.randint(0, 30))]
+        values.append(''.join(parts))
+    return values
+
+
+def time_function(function, values):
+    start = time.perf_counter()
+    function(values)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Differential check of cleaning_id.')
+    parser.add_argument('--size', type=int, default=50000, help='Number of generated strings.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated strings.')
+    args = parser.parse_args()
+
+    values = load_input_values() + generate_values(args.size, args.seed) + [None, np.nan, 12345, 1.5, True, ""]
+    print(f"Checking {len(values)} values ({len(set(map(repr, values)))} distinct).")
+
+    mismatches = 0
+    for value in values:
+        expected = reference_cleaning_id(value)
+        actual = str_processing.cleaning_id(value)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 20:
+                print(f"MISMATCH {value!r}: expected {expected!r}, got {actual!r}")
+    print(f"cleaning_id mismatches: {mismatches} / {len(values)}")
+
+    series = pd.Series(values, dtype=object)
+    text_series = pd.Series([value for value in values if isinstance(value, str)] + [None])
+    for s in (series, text_series):
+        try:
+            pd.testing.assert_series_equal(s.apply(reference_cleaning_id), str_processing.cleaning_id_series(s))
+        except AssertionError as e:
+            mismatches += 1
+            print(f"cleaning_id_series differs from apply ({s.dtype}): {e}")
+
+    str_processing._cleaning_id_str.cache_clear()
+    reference_time = time_function(lambda s: s.apply(reference_cleaning_id), text_series)
+    str_processing._cleaning_id_str.cache_clear()
+    apply_time = time_function(lambda s: s.apply(str_processing.cleaning_id), text_series)
+    str_processing._cleaning_id_str.cache_clear()
+    series_time = time_function(str_processing.cleaning_id_series, text_series)
+    print(f"{len(text_series)} values: reference apply {reference_time:.2f}s, "
+          f"cleaning_id apply {apply_time:.2f}s ({reference_time / apply_time:.1f}x), "
+          f"cleaning_id_series {series_time:.2f}s ({reference_time / series_time:.1f}x)")
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,107 @@
+"""
+Runs the batch loop (BatchGenUtil -> local stand-in -> BatchRetUtil) offline on synthetic pairs and checks the
+stand-in of utils/local_openai.py: every batch gets completed or failed, complete answers validate against the
+response_format model of the mapping, injected truncations are salvaged or counted as corrupted.
+Prints the time of each step.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_local_openai
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import uuid
+
+from utils import batch_gen_util, batch_ret_util, config, local_openai, request_format
+
+
+def random_name(rng):
+    return ' '.join(''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 10))) for _ in range(rng.randint(1, 4)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the offline stand-in of the OpenAI batch API.')
+    parser.add_argument('--mapping', default='substance_orange_book_to_usdmf')
+    parser.add_argument('--pairs', type=int, default=20000)
+    parser.add_argument('--pairs-per-request', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--truncation-rate', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--api-failure-rate', type=float, default=0.2)
+    parser.add_argument('--batch-failure-rate', type=float, default=0.1)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    mapping_config = config.get_mapping_config(args.mapping)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as folder:
+        client = local_openai.LocalOpenAI(
+            folder=os.path.join(folder, 'local_openai'), latency=args.latency, truncation_rate=args.truncation_rate,
+            failure_rate=args.failure_rate, api_failure_rate=args.api_failure_rate, batch_failure_rate=args.batch_failure_rate,
+        )
+        run_folder = os.path.join(folder, 'batches', '2000_01_01_00_00_00')
+        inputs_folder = os.path.join(run_folder, 'inputs')
+        os.makedirs(inputs_folder)
+
+        # --- -g: write and upload ---
+        start_time = time.time()
+        generator = batch_gen_util.BatchGenUtil(inputs_folder, batch_size=args.batch_size, client=client, retry_delay=0.01)
+        template = request_format.RequestTemplate(mapping_config)
+        for i in range(0, args.pairs, args.pairs_per_request):
+            pairs = [{'item_1': random_name(rng), 'item_2': random_name(rng)} for _ in range(min(args.pairs_per_request, args.pairs - i))]
+            generator.add_to_batch(template.render(f'mappings-{uuid.uuid4()}', request_format.encode_pairs(pairs)), increment=len(pairs))
+        batches = generator.conclude_session()
+        with open(os.path.join(inputs_folder, 'batch_recap.json'), 'w') as f:
+            json.dump({'batches': batches}, f)
+        print(f"Generated and uploaded {len(batches)} batches in {time.time() - start_time:.2f}s")
+
+        # --- Batches still running, then completed ---
+        retriever = batch_ret_util.BatchRetUtil(os.path.join(folder, 'batches'), client=client, require_completed=False)
+        if any(batch_plus['batch'].status == 'completed' for batch_plus in retriever.batches_plus) and args.latency > 0:
+            print("FAIL: batches completed before the latency")
+            failures += 1
+        time.sleep(args.latency)
+
+        # --- -p: retrieve and parse ---
+        start_time = time.time()
+        retriever.refresh_batch_details()
+        statuses = [batch_plus['batch'].status for batch_plus in retriever.batches_plus]
+        if any(status not in ('completed', 'failed') for status in statuses):
+            print(f"FAIL: batches not finished after the latency: {statuses}")
+            failures += 1
+        stats = {}
+        contents = list(retriever.iter_contents(stats))
+        print(f"Retrieved {statuses.count('completed')} completed and {statuses.count('failed')} failed batches, "
+              f"{stats['total']} answers ({stats['corrupted']} truncated) in {time.time() - start_time:.2f}s")
+
+        completed_requests = sum(batch_plus['batch'].request_counts.completed for batch_plus in retriever.batches_plus if batch_plus['batch'].status == 'completed')
+        failed_requests = sum(batch_plus['batch'].request_counts.failed for batch_plus in retriever.batches_plus if batch_plus['batch'].status == 'completed')
+        print(f"Requests: {completed_requests} answered, {failed_requests} failed")
+        if stats['total'] != completed_requests:
+            print("FAIL: one answer per answered request expected")
+            failures += 1
+
+        for content in contents:
+            try:
+                mapping_config.response_format.model_validate(content)
+            except Exception as e:
+                print(f"FAIL: answer not valid for {mapping_config.response_format.__name__}: {e}")
+                failures += 1
+                break
+
+        if args.truncation_rate > 0 and stats['corrupted'] == 0:
+            print("FAIL: no truncated answer")
+            failures += 1
+
+    print("OK" if failures == 0 else f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Recall of the MinHash-LSH blocking (main.py --lsh, utils/minhash_lsh.py) against the exhaustive pool engine
+on a sample of source 1 items, with the scorer calls and candidates of both (same measures as
+checks/check_tfidf_recall.py) and the block sizes (source 2 names sharing a bucket with an item, mean,
+99th percentile and max over the sample). Several settings can be compared in one run:
+    python -m checks.check_lsh_recall --synthetic 20000 --bands 8 16 32 --rows 2 3
+    python -m checks.check_lsh_recall --shingle-kind char --shingle-size 3 4 --max-df 0.01 0.05
+    python -m checks.check_lsh_recall --mapping supplier_public_to_qf
+
+Run from the mapping_suppliers folder.
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+
+import numpy as np
+
+import main
+from benchmarks.run_benchmarks import build_source_data
+from benchmarks.synthetic_corpus import SyntheticCorpus
+from checks.check_tfidf_recall import load_mapping_sources
+from utils import config, minhash_lsh, scoring_cascade, token_index
+
+
+def optional_float(value):
+    return None if value.lower() == 'none' else float(value)
+
+
+def main_check():
+    parser = argparse.ArgumentParser(description='Recall of the MinHash-LSH blocking against the exhaustive engine.')
+    parser.add_argument('--mapping', type=str, default=None, help='Sources and labels of a mapping (default: synthetic supplier sources).')
+    parser.add_argument('--synthetic', type=int, default=20000, help='Synthetic source 2 size.')
+    parser.add_argument('--source-1-ratio', type=int, default=10, help='Synthetic source 1 has synthetic / ratio items.')
+    parser.add_argument('--sample', type=int, default=300, help='Source 1 items compared.')
+    parser.add_argument('--bands', type=int, nargs='+', default=[minhash_lsh.DEFAULT_BANDS])
+    parser.add_argument('--rows', type=int, nargs='+', default=[minhash_lsh.DEFAULT_ROWS])
+    parser.add_argument('--shingle-size', type=int, nargs='+', default=[minhash_lsh.DEFAULT_SHINGLE_SIZE])
+    parser.add_argument('--shingle-kind', choices=minhash_lsh.SHINGLE_KINDS, nargs='+', default=[minhash_lsh.DEFAULT_SHINGLE_KIND])
+    parser.add_argument('--max-df', type=optional_float, nargs='+', default=[minhash_lsh.DEFAULT_MAX_DF], help='Share of the names above which a shingle is left out ("none" keeps them all).')
+    parser.add_argument('--min-recall', type=float, default=0.9, help='Recall under which the check fails (default settings only).')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mapping:
+        mapping_config = config.get_mapping_config(args.mapping)
+        source_1_names, source_2_names, positive_pairs = load_mapping_sources(mapping_config)
+    else:
+        mapping_config = config.get_mapping_config('supplier_public_to_qf')
+        source_1_names, source_2_names, positive_pairs = SyntheticCorpus(args.seed).labelled_sources(
+            'supplier', max(args.sample, args.synthetic // args.source_1_ratio), args.synthetic
+        )
+    source_1_data = build_source_data(source_1_names, mapping_config)
+    source_2_data = build_source_data(source_2_names, mapping_config)
+    sample = sorted(random.Random(args.seed).sample(range(len(source_1_names)), min(args.sample, len(source_1_names))))
+    print(f"{len(source_1_names)} source 1 and {len(source_2_names)} source 2 names ({mapping_config.mapping_type.name}), sample of {len(sample)}")
+
+    worker_source_2_data = dict(source_2_data)
+    worker_source_2_data['token_index'] = token_index.TokenIndex(source_2_data['cleaned_list'])
+    worker_source_2_data['has_intermediate_list'] = np.array(source_2_data['has_intermediate_list'])
+    worker_source_2_data['cleaned_token_lengths'] = np.array([scoring_cascade.token_length(name) for name in source_2_data['cleaned_list']], dtype=np.int64)
+    sample_names = {source_1_data['orig_list'][index_1] for index_1 in sample}
+    sample_positives = {pair for pair in positive_pairs if pair[0] in sample_names}
+
+    def run(source_2_variant):
+        start_time = time.time()
+        stats = {}
+        candidates = set()
+        for index_1 in sample:
+            source_1_tuple = (index_1, source_1_data['orig_list'][index_1], source_1_data['cleaned_list'][index_1], source_1_data['has_intermediate_list'][index_1])
+            for mapping in main.process_source1_item(source_1_tuple, source_2_variant, mapping_config, stats):
+                candidates.add((mapping['item_1'], mapping['item_2']))
+        return candidates, stats.get('scorer_calls_made', 0), time.time() - start_time
+
+    current, current_calls, current_seconds = run(worker_source_2_data)
+    current_positives = sample_positives & current
+    print(f"Exhaustive: {len(current)} candidates in {current_seconds:.2f}s ({current_calls} scorer calls), "
+          f"{len(current_positives)} of {len(sample_positives)} labelled positive pairs")
+
+    passed = True
+    for kind, shingle_size, max_df, bands, rows in itertools.product(args.shingle_kind, args.shingle_size, args.max_df, args.bands, args.rows):
+        start_time = time.time()
+        lsh_index = minhash_lsh.MinHashLSHIndex(source_2_data['cleaned_list'], bands, rows, shingle_size, kind, max_df, args.seed)
+        index_seconds = time.time() - start_time
+        lsh, lsh_calls, lsh_seconds = run(dict(worker_source_2_data, lsh_index=lsh_index))
+        blocks = np.array([len(lsh_index.candidates(source_1_data['cleaned_list'][index_1])) for index_1 in sample])
+        candidate_recall = len(current & lsh) / len(current) if current else 1.0
+        recall = len(current_positives & lsh) / len(current_positives) if current_positives else candidate_recall
+        print(f"LSH {kind} {shingle_size}-shingles, max_df {max_df}, {bands:>3} bands x {rows} rows: {len(lsh)} candidates in {lsh_seconds:.2f}s, index {index_seconds:.2f}s "
+              f"({lsh_calls} scorer calls, {lsh_calls / max(current_calls, 1) * 100:.1f}%), blocks mean {blocks.mean():.0f} / p99 {np.percentile(blocks, 99):.0f} / max {blocks.max()}, "
+              f"candidate recall {candidate_recall * 100:.1f}%, labelled recall relative to the exhaustive engine {recall * 100:.1f}%")
+        if (kind, shingle_size, max_df, bands, rows) == (minhash_lsh.DEFAULT_SHINGLE_KIND, minhash_lsh.DEFAULT_SHINGLE_SIZE, minhash_lsh.DEFAULT_MAX_DF, minhash_lsh.DEFAULT_BANDS, minhash_lsh.DEFAULT_ROWS):
+            passed = recall >= args.min_recall
+
+    print("OK" if passed else f"FAIL: recall of the default settings under {args.min_recall * 100:.0f}%")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main_check()
@@ -7,6 +7,8 @@ import logging
 import multiprocessing
 from functools import partial
 import queue
+import shutil
+import tempfile
 from logging.handlers import QueueHandler, QueueListener
 
 # Assuming utils structure exists
@@ -14,6 +16,7 @@ try:
     from utils import str_processing
     from utils import config
     from utils import fuzzy_matching
+    from utils import pool_profiler
 except ImportError as e:
     print(f"CRITICAL: Failed to import utils. Ensure utils package is accessible. Error: {e}", file=sys.stderr)
     sys.exit(1)
@@ -30,7 +33,9 @@ SCORERS_CLEANED = [fuzz.token_sort_ratio, fuzz.token_set_ratio] # Scorers for in
 PROGRESS_UPDATE_INTERVAL = 100
 
 # --- Worker Process Logging Initializer ---
-def worker_log_init(log_queue):
+def worker_log_init(log_queue, profile_folder=None):
+    if profile_folder is not None:
+        pool_profiler.start_worker_profiler(profile_folder)
     qh = QueueHandler(log_queue)
     root = logging.getLogger()
     if root.handlers:
@@ -174,6 +179,8 @@ if __name__ == "__main__":
     parser.add_argument('mapping_name', type=str, help='The name of the mapping config to use.')
     parser.add_argument('--cores', type=int, default=multiprocessing.cpu_count(), help='Number of CPU cores to use.')
     parser.add_argument('--chunksize', type=int, default=50, help='Chunk size for multiprocessing.')
+    parser.add_argument('--profile', action='store_true', help='Profile the pool workers and write the merged stats and a top-N summary to outputs/.')
+    parser.add_argument('--profile-top', type=int, default=pool_profiler.DEFAULT_TOP, help='Number of functions of the --profile summary.')
     try: args = parser.parse_args()
     except SystemExit as e: print(f"Argparse exited: {e}", file=sys.stderr); sys.exit(e.code)
 
@@ -323,9 +330,10 @@ if __name__ == "__main__":
         logging.info("Creating partial function for worker process...")
         process_func = partial(process_source1_item, source_2_data=source_2_data, mapping_type=mapping_type, thresholds=thresholds)
 
+        profile_folder = tempfile.mkdtemp(prefix='candidates_diff_profile_') if args.profile else None
         logging.info(f"Creating multiprocessing Pool with {args.cores} workers...")
         # Use try-with-resources for the pool
-        with multiprocessing.Pool(processes=args.cores, initializer=worker_log_init, initargs=(log_queue,)) as pool:
+        with multiprocessing.Pool(processes=args.cores, initializer=worker_log_init, initargs=(log_queue, profile_folder)) as pool:
             logging.info(f"Pool created. Submitting tasks (Chunksize: {args.chunksize})...")
             # Use imap_unordered for potentially better performance if task order doesn't matter
             results_iterator = pool.imap_unordered(process_func, source_1_data_tuples, chunksize=args.chunksize)
@@ -351,7 +359,17 @@ if __name__ == "__main__":
                      start_prog = current_time # Reset timer for next interval update check
 
             logging.info("Finished iterating through all results.")
+            # Workers exit normally (and write their profile) instead of being terminated by the with block
+            pool.close()
+            pool.join()
         logging.info("Multiprocessing Pool closed.")
+
+        if profile_folder is not None:
+            os.makedirs("outputs", exist_ok=True)
+            profile_stats = pool_profiler.merge_profiles(profile_folder, os.path.join("outputs", f"{args.mapping_name}_candidates_diff_profile.pstats"))
+            shutil.rmtree(profile_folder, ignore_errors=True)
+            if profile_stats is not None:
+                pool_profiler.write_top_summary(profile_stats, os.path.join("outputs", f"{args.mapping_name}_candidates_diff_profile_top.txt"), args.profile_top)
         # --- End Parallel ---
 
         proc_time = time.time() - start_proc
@@ -0,0 +1,90 @@
+"""
+Checks the token-budget request packer on synthetic pairs (short substance names and long supplier names):
+the pairs keep their order, every request stays within the budget (unless a pair is alone), its answer within
+its max_tokens, a pair whose answer is over the output limit of the model is skipped, and the estimates follow
+the size of the serialized pairs and answers. Prints the packing report of each mapping.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_request_packer
+"""
+import argparse
+import json
+import random
+import string
+import sys
+
+from utils import config, request_format, request_packer
+
+
+def random_name(rng, min_words, max_words):
+    words = [''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 12))) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words)
+
+
+def get_answer(mapping_config, pairs):
+    """Answer of the size the model would give, with the placeholder values of the packer."""
+    mappings = []
+    for pair in pairs:
+        if mapping_config.mapping_type == config.MappingType.SUBSTANCE:
+            mappings.append({'active_substance_1': pair['item_1'], 'active_substance_2': pair['item_2'], 'have_same_base': False, 'have_same_form': False, 'is_diluted': False})
+        else:
+            mappings.append({'item_1': pair['item_1'], 'is_item_1_supplier_site': False, 'item_2': pair['item_2'], 'is_item_2_supplier_site': False,
+                             'confidence_score_match_site_level': 0.95, 'confidence_score_are_part_of_same_company': 0.95})
+    return json.dumps({'mappings': mappings})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the token-budget request packer.')
+    parser.add_argument('--pairs', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = 0
+    for mapping_name, (min_words, max_words) in {'substance_orange_book_to_usdmf': (1, 3), 'supplier_public_to_qf': (2, 12)}.items():
+        mapping_config = config.get_mapping_config(mapping_name)
+        candidates = [{'item_1': random_name(rng, min_words, max_words), 'item_2': random_name(rng, min_words, max_words)} for _ in range(args.pairs)]
+        # A pair larger than the budget on its own, and one whose answer can't fit in the output limit of the model
+        candidates[10]['item_2'] = 'X' * mapping_config.request_token_budget * request_packer.CHARS_PER_TOKEN
+        model_output_tokens = config.MODEL_MAX_OUTPUT_TOKENS.get(mapping_config.model, config.DEFAULT_MAX_OUTPUT_TOKENS)
+        candidates[20]['item_2'] = 'Y' * model_output_tokens * request_packer.CHARS_PER_TOKEN
+
+        packer = request_packer.RequestPacker(mapping_config)
+        requests, skipped_pairs, stats = packer.pack(candidates)
+        print(f"--- {mapping_name}")
+        request_packer.print_packing_report(stats, mapping_config.request_token_budget, mapping_config.request_item_size)
+
+        if skipped_pairs != [candidates[20]]:
+            print(f"FAIL: {len(skipped_pairs)} pairs skipped, expected the pair over the output limit of the model")
+            failures += 1
+        if [pair for request in requests for pair in request] != candidates[:20] + candidates[21:]:
+            print("FAIL: the pairs were not kept in order")
+            failures += 1
+        for request in requests:
+            tokens = sum(sum(packer.estimate_pair_tokens(pair, number)) for number, pair in enumerate(request, start=1))
+            if tokens > mapping_config.request_token_budget and len(request) > 1:
+                print(f"FAIL: request of {len(request)} pairs over the budget ({tokens} tokens)")
+                failures += 1
+            answer_tokens = len(get_answer(mapping_config, request)) / request_packer.CHARS_PER_TOKEN
+            max_tokens = packer.request_max_tokens(request)
+            if answer_tokens > max_tokens:
+                print(f"FAIL: answer of {len(request)} pairs over max_tokens ({answer_tokens:.0f} tokens, max_tokens {max_tokens})")
+                failures += 1
+            if max_tokens != mapping_config.request_output_token_budget:
+                print(f"Request of {len(request)} pair(s), answer ~{answer_tokens:.0f} tokens: max_tokens {max_tokens}")
+
+        # Estimates against the serialized sizes (characters / CHARS_PER_TOKEN)
+        sample = [request for request in requests if len(request) > 1][:20]
+        input_ratio = sum(len(request_format.encode_pairs(request)) for request in sample) / request_packer.CHARS_PER_TOKEN / sum(packer.estimate_pair_tokens(pair, number)[0] for request in sample for number, pair in enumerate(request, start=1))
+        output_ratio = sum(len(get_answer(mapping_config, request)) for request in sample) / request_packer.CHARS_PER_TOKEN / sum(packer.estimate_pair_tokens(pair)[1] for request in sample for pair in request)
+        print(f"Serialized / estimated tokens: input {input_ratio:.3f}, output {output_ratio:.3f}")
+        if not 0.9 <= input_ratio <= 1.1 or not 0.9 <= output_ratio <= 1.1:
+            print("FAIL: the estimates are more than 10% off the serialized sizes")
+            failures += 1
+
+    print("OK" if failures == 0 else f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Checks the precomputed request template: render gives the same line as serializing the whole request
+(names with quotes, backslashes and non-ASCII characters included) and compares the time to build
+the requests with the template and with a full serialization per request.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_request_template
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from utils import config, request_format
+
+NAMES = ['NAPROXEN SODIUM', 'Naproxène sódica', 'ACME "LABS" \\ PLANT 2', 'Ünïcödé – ß', '13C-UREA (r)']
+
+
+def serialize_full(mapping_config, custom_id, pairs, max_tokens=None):
+    """One request serialized from scratch, as generate_batch did before the template."""
+    completion = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": mapping_config.model,
+            "temperature": mapping_config.temperature,
+            "messages": request_format.get_messages(mapping_config, pairs),
+            "response_format": type_to_response_format_param(mapping_config.response_format),
+        }
+    }
+    if mapping_config.request_token_budget is not None:
+        completion["body"]["max_tokens"] = max_tokens or mapping_config.request_output_token_budget
+    return json.dumps(completion, indent=4).replace('\n', ' ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the precomputed request template.')
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--pairs-per-request', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    failures = 0
+    for mapping_config in config.possible_mappings:
+        template = request_format.RequestTemplate(mapping_config)
+        pairs = [{'item_1': rng.choice(NAMES), 'item_2': rng.choice(NAMES)} for _ in range(args.pairs_per_request)]
+        custom_id = f'mappings-{uuid.uuid4()}'
+        line = template.render(custom_id, request_format.encode_pairs(pairs))
+        if json.loads(line) != json.loads(serialize_full(mapping_config, custom_id, pairs)):
+            print(f"FAIL: {mapping_config.mapping_name}: the rendered request differs from the full serialization")
+            failures += 1
+        if mapping_config.request_token_budget is not None:
+            # Larger max_tokens of a pair with a long answer (RequestPacker.request_max_tokens)
+            max_tokens = mapping_config.request_output_token_budget + 1000
+            line = template.render(custom_id, request_format.encode_pairs(pairs), max_tokens)
+            if json.loads(line) != json.loads(serialize_full(mapping_config, custom_id, pairs, max_tokens)):
+                print(f"FAIL: {mapping_config.mapping_name}: the request rendered with max_tokens {max_tokens} differs from the full serialization")
+                failures += 1
+
+    mapping_config = config.get_mapping_config('supplier_public_to_qf')
+    template = request_format.RequestTemplate(mapping_config)
+    chunks = [[{'item_1': rng.choice(NAMES), 'item_2': rng.choice(NAMES)} for _ in range(args.pairs_per_request)] for _ in range(1000)]
+
+    start_time = time.time()
+    for i in range(args.requests):
+        template.render(f'mappings-{uuid.uuid4()}', request_format.encode_pairs(chunks[i % len(chunks)]))
+    template_time = time.time() - start_time
+
+    # The full serialization is timed on a sample and extrapolated
+    sample = min(args.requests, 5000)
+    start_time = time.time()
+    for i in range(sample):
+        serialize_full(mapping_config, f'mappings-{uuid.uuid4()}', chunks[i % len(chunks)])
+    full_time = (time.time() - start_time) * args.requests / sample
+
+    print(f"{args.requests} requests: {template_time:.2f}s with the template, ~{full_time:.2f}s with a full serialization per request ({full_time / template_time:.1f}x)")
+    print("OK" if failures == 0 else f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
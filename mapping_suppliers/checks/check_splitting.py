@@ -0,0 +1,103 @@
+"""
+Differential check of the vectorized str_processing.get_unique_items_df / get_splitted_rows_df against
+the row by row get_unique_items / get_splitted_rows, over every text column of the input files and
+generated values with parentheses, pipes and separators.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_splitting
+"""
+import argparse
+import glob
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import str_processing
+
+SEPARATORS = [',', ';']
+
+
+def generate_frame(size, seed):
+    rng = random.Random(seed)
+    words = ['ibuprofen', 'naproxen sodium', 'acid', '(s)', '(r,s)', '(a; b)', '(x|y)', 'salt', '(', ')', 'd4']
+    glue = [', ', ',', '; ', ';', ' | ', '|', '  ', ' ', ',\t', ';  ']
+    values = []
+    for _ in range(size):
+        if rng.random() < 0.05:
+            values.append(None)
+            continue
+        parts = [rng.choice(words)]
+        for _ in range(rng.randint(0, 6)):
+            parts.append(rng.choice(glue))
+            parts.append(rng.choice(words))
+        values.append(''.join(parts))
+    return pd.DataFrame({
+        'item': values,
+        'number': np.arange(size),
+        'ratio': np.linspace(0, 1, size),
+        'flag': [i % 3 == 0 for i in range(size)],
+    })
+
+
+def frames_to_check(size, seed):
+    for path in sorted(glob.glob("inputs/*.csv")):
+        df = pd.read_csv(path)
+        for column in df.columns:
+            if df[column].dtype != object and not pd.api.types.is_string_dtype(df[column]):
+                continue
+            yield f"{path}:{column}", df, column
+    yield "generated:item", generate_frame(size, seed), 'item'
+
+
+def compare(label, df, column, separator, prefix):
+    errors = []
+    expected_items = set(str_processing.get_unique_items(df, column, separator))
+    actual_items = str_processing.get_unique_items_df(df, column, separator)[column].tolist()
+    if len(actual_items) != len(set(actual_items)) or set(actual_items) != expected_items:
+        errors.append("unique items differ")
+
+    expected_rows = pd.DataFrame(str_processing.get_splitted_rows(df, column, prefix, separator))
+    actual_rows = str_processing.get_splitted_rows_df(df, column, prefix, separator)
+    if not (expected_rows.empty and actual_rows.empty):
+        try:
+            # Columns left with only NaN are float64 when rebuilt from dicts, the vectorized version keeps their dtype
+            pd.testing.assert_frame_equal(expected_rows, actual_rows, check_dtype=False)
+        except AssertionError as e:
+            errors.append(f"rows differ: {e}")
+    for error in errors:
+        print(f"MISMATCH {label} separator={separator!r} prefix={prefix!r}: {error}")
+    return len(errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Differential check of the vectorized splitting functions.')
+    parser.add_argument('--size', type=int, default=5000, help='Number of generated rows.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated rows.')
+    args = parser.parse_args()
+
+    mismatches = 0
+    checked = 0
+    for label, df, column in frames_to_check(args.size, args.seed):
+        for separator in SEPARATORS:
+            for prefix in (None, 'src'):
+                mismatches += compare(label, df, column, separator, prefix)
+                checked += 1
+        # Without separator get_splitted_rows only works without prefix
+        mismatches += compare(label, df, column, None, None)
+        checked += 1
+    print(f"Mismatches: {mismatches} / {checked} comparisons")
+
+    df = generate_frame(args.size * 10, args.seed)
+    start = time.perf_counter()
+    pd.DataFrame(str_processing.get_splitted_rows(df, 'item', None, ','))
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    str_processing.get_splitted_rows_df(df, 'item', None, ',')
+    vectorized_time = time.perf_counter() - start
+    print(f"get_splitted_rows on {len(df)} rows: row by row {reference_time:.2f}s, "
+          f"vectorized {vectorized_time:.2f}s ({reference_time / vectorized_time:.1f}x)")
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,75 @@
+"""
+Checks utils/substance_forms.py on the examples of the substance system prompt: every pair the rules
+answer must get the answer of the prompt, the others are left to the LLM. With --candidates, also reports
+how many pairs of a candidates CSV (item_1, item_2 columns) the rules resolve.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_substance_forms
+    python -m checks.check_substance_forms --candidates outputs/substance_orange_book_to_usdmf_candidates_combined.csv
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from utils import substance_forms
+
+# (item_1, item_2, (have_same_base, have_same_form, is_diluted)) of the system prompt
+PROMPT_EXAMPLES = [
+    ("NAPROXEN SODIUM", "Naproxen Na", (True, True, False)),
+    ("NAPROXEN SODIUM", "Naproxeno sodico", (True, True, False)),
+    ("NAPROXEN SODIUM", "Naproxeno HYDROCHLORIDE", (True, False, False)),
+    ("NAPROXEN SODIUM", "Naproxen base", (False, False, False)),
+    ("NAPROXEN SODIUM", "Ibuprofen", (False, False, False)),
+    ("NAPROXEN SODIUM", "Ketorolac", (False, False, False)),
+    ("NAPROXEN SODIUM", "Naproxen Sodium Monohydrate", (True, False, False)),
+    ("NAPROXEN SODIUM", "Naproxene Sódica", (True, True, False)),
+    ("Docetaxel", "Anhydrous Docetaxel", (True, False, False)),
+    ("Pemetrexed", "Pemetrexed disodium 2.5-hydrate", (True, False, False)),
+    ("Zoledronic Acid Monohydrate", "Zoledronic acid monohydrate", (True, True, False)),
+    ("Urea (13C)", "13c-Urea", (True, True, False)),
+    ("Naproxeno HYDROCHLORIDE", "Naproxeno HCL", (True, True, False)),
+    ("Naproxeno HYDROCHLORIDE", "Naproxeno NA", (True, False, False)),
+    ("Acidum Picrinicum D4", "Acidum picrinicum for homoeopathic preparations", (True, False, True)),
+    ("Docetaxel", "Docetaxel USP", (True, True, False)),
+    # Same base, forms of the tables
+    ("AMIODARONE HCL USP", "Amiodarone hydrochloride", (True, True, False)),
+    ("Imatinib mesylate", "IMATINIB METHANESULFONATE", (True, True, False)),
+    ("Amlodipine besylate", "Amlodipine", (True, False, False)),
+    # Leftover bases that are not the substance
+    ("Ethyl acetate", "Ethyl chloride", (False, False, False)),
+    ("Hydrogen peroxide", "Peroxide", (False, False, False)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the deterministic substance form resolver.')
+    parser.add_argument('--candidates', type=str, default=None, help='CSV of candidate pairs (item_1, item_2 columns).')
+    args = parser.parse_args()
+
+    failures = 0
+    resolver = substance_forms.SubstanceFormResolver()
+    for item_1, item_2, expected in PROMPT_EXAMPLES:
+        verdict = resolver.resolve(item_1, item_2)
+        if verdict is None:
+            print(f"LLM       {item_1!r} / {item_2!r}")
+            continue
+        answer = (verdict['have_same_base'], verdict['have_same_form'], verdict['is_diluted'])
+        status = "OK" if answer == expected else "FAIL"
+        if answer != expected:
+            failures += 1
+        print(f"{status:<9} {item_1!r} / {item_2!r}: {answer}, expected {expected}")
+    print(f"{sum(resolver.stats[key] for key in ('resolved_same_form', 'resolved_other_form'))} / {len(PROMPT_EXAMPLES)} examples resolved by the rules")
+
+    if args.candidates:
+        candidates = pd.read_csv(args.candidates)[['item_1', 'item_2']].dropna().to_dict('records')
+        candidate_resolver = substance_forms.SubstanceFormResolver()
+        verdicts, left = candidate_resolver.resolve_candidates(candidates)
+        print(f"Candidates: {len(verdicts)} / {len(candidates)} resolved by the rules ({candidate_resolver.stats}), {len(left)} left for the LLM")
+
+    print("OK" if failures == 0 else f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
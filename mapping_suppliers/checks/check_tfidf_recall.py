@@ -0,0 +1,130 @@
+"""
+Recall of the TF-IDF engine (main.generate_candidates_tfidf, utils/tfidf_engine.py) against the current
+engine (process_source1_item over the whole source 2) on a sample of source 1 items:
+    candidate recall   share of the candidates of the current engine also found by the TF-IDF engine
+    labelled recall    share of the labelled positive pairs of the sample found by each engine, and share of
+                       the ones found by the current engine also found by the TF-IDF engine (checked
+                       against --min-recall; the candidate recall is checked when there is no label)
+Labels: the entity of each name for --synthetic sources (benchmarks/synthetic_corpus.py), or the positive
+verdicts of a previous run (outputs/<mapping>_mapping.csv) for --mapping sources.
+
+Run from the mapping_suppliers folder:
+    python -m checks.check_tfidf_recall --synthetic 60000
+    python -m checks.check_tfidf_recall --kind supplier    (main.py runs the default engine for suppliers)
+    python -m checks.check_tfidf_recall --mapping substance_orange_book_to_usdmf
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import main
+from benchmarks.run_benchmarks import build_source_data
+from benchmarks.synthetic_corpus import SyntheticCorpus
+from utils import config, scoring_cascade, str_processing, tfidf_engine, token_index
+
+
+def load_mapping_sources(mapping_config: config.MappingConfig):
+    """Unique cleaned ids of both sources (as main.py -g) and the positive pairs of the mapping output, if any."""
+    names = []
+    for filename, column, separator in (
+        (mapping_config.source_1_filename, mapping_config.source_1_id_cleaned, mapping_config.source_1_separator),
+        (mapping_config.source_2_filename, mapping_config.source_2_id_cleaned, mapping_config.source_2_separator),
+    ):
+        path = f'inputs/{filename}' if os.path.exists(f'inputs/{filename}') else f'outputs/{filename}'
+        df_source = pd.read_csv(path)
+        df_unique = str_processing.get_unique_items_df(df_source, column, separator)
+        names.append([name for name in df_unique[column].tolist() if isinstance(name, str) and name])
+
+    positive_pairs = set()
+    output_path = f'outputs/{mapping_config.mapping_output_filename}'
+    if os.path.exists(output_path):
+        df_output = pd.read_csv(output_path)
+        positive_pairs = set(zip(df_output[mapping_config.source_1_mapping_column], df_output[mapping_config.source_2_mapping_column]))
+    return names[0], names[1], positive_pairs
+
+
+def main_check():
+    parser = argparse.ArgumentParser(description='Recall of the TF-IDF candidate engine against the current engine.')
+    parser.add_argument('--mapping', type=str, default=None, help='Sources and labels of a mapping (default: synthetic sources).')
+    parser.add_argument('--synthetic', type=int, default=20000, help='Synthetic source 2 size.')
+    parser.add_argument('--kind', choices=['supplier', 'substance'], default='substance', help='Synthetic names.')
+    parser.add_argument('--source-1-ratio', type=int, default=10, help='Synthetic source 1 has synthetic / ratio items.')
+    parser.add_argument('--sample', type=int, default=300, help='Source 1 items compared.')
+    parser.add_argument('--top-k', type=int, default=tfidf_engine.DEFAULT_TOP_K)
+    parser.add_argument('--block-rows', type=int, default=tfidf_engine.DEFAULT_BLOCK_ROWS)
+    parser.add_argument('--max-df', type=float, default=tfidf_engine.DEFAULT_MAX_DF)
+    parser.add_argument('--min-recall', type=float, default=0.9, help='Recall under which the check fails.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mapping:
+        mapping_config = config.get_mapping_config(args.mapping)
+        source_1_names, source_2_names, positive_pairs = load_mapping_sources(mapping_config)
+    else:
+        mapping_config = config.get_mapping_config('supplier_public_to_qf' if args.kind == 'supplier' else 'substance_orange_book_to_usdmf')
+        source_1_names, source_2_names, positive_pairs = SyntheticCorpus(args.seed).labelled_sources(
+            args.kind, max(args.sample, args.synthetic // args.source_1_ratio), args.synthetic
+        )
+    source_1_data = build_source_data(source_1_names, mapping_config)
+    source_2_data = build_source_data(source_2_names, mapping_config)
+    sample = sorted(random.Random(args.seed).sample(range(len(source_1_names)), min(args.sample, len(source_1_names))))
+    print(f"{len(source_1_names)} source 1 and {len(source_2_names)} source 2 names ({mapping_config.mapping_type.name}), sample of {len(sample)}")
+
+    worker_source_2_data = dict(source_2_data)
+    worker_source_2_data['token_index'] = token_index.TokenIndex(source_2_data['cleaned_list'])
+    worker_source_2_data['has_intermediate_list'] = np.array(source_2_data['has_intermediate_list'])
+    worker_source_2_data['cleaned_token_lengths'] = np.array([scoring_cascade.token_length(name) for name in source_2_data['cleaned_list']], dtype=np.int64)
+
+    def source_1_tuple(index_1):
+        return (index_1, source_1_data['orig_list'][index_1], source_1_data['cleaned_list'][index_1], source_1_data['has_intermediate_list'][index_1])
+
+    # --- Current engine ---
+    start_time = time.time()
+    current_stats = {}
+    current = set()
+    for index_1 in sample:
+        for mapping in main.process_source1_item(source_1_tuple(index_1), worker_source_2_data, mapping_config, current_stats):
+            current.add((mapping['item_1'], mapping['item_2']))
+    current_seconds = time.time() - start_time
+
+    # --- TF-IDF engine ---
+    start_time = time.time()
+    tfidf_index = tfidf_engine.TfidfIndex(source_2_data['cleaned_list'], max_df=args.max_df)
+    index_seconds = time.time() - start_time
+    sample_matrix = tfidf_index.transform([source_1_data['cleaned_list'][index_1] for index_1 in sample])
+    tfidf_stats = {}
+    tfidf = set()
+    for row, neighbours in tfidf_index.neighbours(sample_matrix, args.top_k, args.block_rows):
+        for mapping in main.process_source1_item(source_1_tuple(sample[row]), worker_source_2_data, mapping_config, tfidf_stats, candidate_indices=neighbours):
+            tfidf.add((mapping['item_1'], mapping['item_2']))
+    tfidf_seconds = time.time() - start_time
+
+    print(f"Current engine: {len(current)} candidates in {current_seconds:.2f}s ({current_stats.get('scorer_calls_made', 0)} scorer calls)")
+    print(f"TF-IDF engine:  {len(tfidf)} candidates in {tfidf_seconds:.2f}s, index {index_seconds:.2f}s ({tfidf_stats.get('scorer_calls_made', 0)} scorer calls, top {args.top_k})")
+    candidate_recall = len(current & tfidf) / len(current) if current else 1.0
+    print(f"Candidate recall: {candidate_recall * 100:.1f}% ({len(current - tfidf)} candidates of the current engine missed, {len(tfidf - current)} not found by it)")
+
+    sample_names = {source_1_data['orig_list'][index_1] for index_1 in sample}
+    sample_positives = {pair for pair in positive_pairs if pair[0] in sample_names}
+    recall = candidate_recall
+    if sample_positives:
+        print(f"Labelled recall on {len(sample_positives)} positive pairs: current engine {len(sample_positives & current) / len(sample_positives) * 100:.1f}%, "
+              f"TF-IDF engine {len(sample_positives & tfidf) / len(sample_positives) * 100:.1f}%")
+        current_positives = sample_positives & current
+        recall = len(current_positives & tfidf) / len(current_positives) if current_positives else 1.0
+        print(f"Labelled recall relative to the current engine: {recall * 100:.1f}% ({len(current_positives - tfidf)} positive pairs found by the current engine only)")
+    else:
+        print("No labelled positive pair in the sample.")
+
+    passed = recall >= args.min_recall
+    print("OK" if passed else f"FAIL: recall under {args.min_recall * 100:.0f}%")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main_check()
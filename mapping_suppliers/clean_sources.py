@@ -1,69 +1,156 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 from utils import str_processing
 
-a57_file = "inputs/a57_raw.csv"
-df_europe_base = pd.read_csv(a57_file)
-
-
-europe_rows = []
-for i, row in df_europe_base.iterrows():
-    items_for_row = []
-    
-    # print(row)
-    if not pd.isna(row['Route_of_admin']):
-        items_for_row = row['Route_of_admin'].split("|")
-
-        for item in items_for_row:
-            if item != "":
-                # Add the full row with the new item to the result and add the prefix to all column names
-                new_row = row.copy()
-                new_row['Route_of_admin'] = item.strip()
-                europe_rows.append(new_row.to_dict())
-
-df_europe_intermediate = pd.DataFrame(europe_rows)
-
-df_europe = pd.DataFrame(str_processing.get_splitted_rows(df_europe_intermediate, 'Active_substance', None, ','))
-print(df_europe.head())
-
-df_europe['Active_substance_cleaned'] = df_europe['Active_substance'].apply(str_processing.cleaning_id)
-df_europe['is_discontinued'] = False
-
-# write the cleaned file
-df_europe.to_csv("outputs/a57_cleaned.csv", index=False)
-
-cep_file = "inputs/cep_raw.csv"
-df_cep = pd.read_csv(cep_file)
-df_cep['certificateHolder_cleaned'] = df_cep['certificateHolder'].apply(str_processing.cleaning_id)
-df_cep['englishName_cleaned'] = df_cep['englishName'].apply(str_processing.cleaning_id)
-
-# write the cleaned file
-df_cep.to_csv("outputs/cep_cleaned.csv", index=False)
-
-ob_file = "inputs/ob.csv"
-df_ob_base = pd.read_csv(ob_file)
-df_ob = pd.DataFrame(str_processing.get_splitted_rows(df_ob_base, 'Ingredient', None, ';'))
-df_ob['Ingredient_cleaned'] = df_ob['Ingredient'].apply(str_processing.cleaning_id)
-df_ob['is_discontinued'] = df_ob['Type'].apply(lambda x: True if x == 'DISCN' else False)
-
-# write the cleaned file
-df_ob.to_csv("outputs/ob_cleaned.csv", index=False)
-
-usdmf_file = "inputs/us_dmf.csv"
-df_usdmf_base = pd.read_csv(usdmf_file)
-df_usdmf_base['SUBJECT_cleaned'] = df_usdmf_base['SUBJECT'].apply(str_processing.cleaning_id)
-df_usdmf_base['HOLDER_cleaned'] = df_usdmf_base['HOLDER'].apply(str_processing.cleaning_id)
-
-# write the cleaned file
-df_usdmf_base.to_csv("outputs/usdmf_cleaned.csv", index=False)
-
-
-qf = pd.read_csv("inputs/qf_supplier_sites_products.csv")
-qf['qf_supplier_site_audited_requested_product_cleaned'] = qf['qf_supplier_site_audited_requested_product'].apply(str_processing.cleaning_id)
-# save the dataframe to a csv file
-qf.to_csv("outputs/qf_supplier_sites_products_cleaned.csv", index=False)
-
 
-qf = pd.read_csv("inputs/qf_supplier_sites_names.csv")
-qf['qf_supplier_site_name_cleaned'] = qf['qf_supplier_site_name'].apply(str_processing.cleaning_id)
-# save the dataframe to a csv file
-qf.to_csv("outputs/qf_supplier_sites_names_cleaned.csv", index=False)
\ No newline at end of file
+# --- Chunk cleaning functions (run in the pool workers) ---
+
+def clean_a57_chunk(df_europe_base: pd.DataFrame) -> pd.DataFrame:
+    # One row per route of administration
+    df_europe_base = df_europe_base[df_europe_base['Route_of_admin'].notna()].reset_index(drop=True)
+    routes = df_europe_base['Route_of_admin'].str.split('|', regex=False).explode()
+    routes = routes[routes != '']
+    df_europe_intermediate = df_europe_base.loc[routes.index]
+    df_europe_intermediate['Route_of_admin'] = routes.str.strip().to_numpy()
+
+    df_europe = str_processing.get_splitted_rows_df(df_europe_intermediate, 'Active_substance', None, ',')
+    df_europe['Active_substance_cleaned'] = str_processing.cleaning_id_series(df_europe['Active_substance'])
+    df_europe['is_discontinued'] = False
+    return df_europe
+
+
+def clean_cep_chunk(df_cep: pd.DataFrame) -> pd.DataFrame:
+    df_cep['certificateHolder_cleaned'] = str_processing.cleaning_id_series(df_cep['certificateHolder'])
+    df_cep['englishName_cleaned'] = str_processing.cleaning_id_series(df_cep['englishName'])
+    return df_cep
+
+
+def clean_ob_chunk(df_ob_base: pd.DataFrame) -> pd.DataFrame:
+    df_ob = str_processing.get_splitted_rows_df(df_ob_base, 'Ingredient', None, ';')
+    df_ob['Ingredient_cleaned'] = str_processing.cleaning_id_series(df_ob['Ingredient'])
+    df_ob['is_discontinued'] = df_ob['Type'] == 'DISCN'
+    return df_ob
+
+
+def clean_usdmf_chunk(df_usdmf_base: pd.DataFrame) -> pd.DataFrame:
+    df_usdmf_base['SUBJECT_cleaned'] = str_processing.cleaning_id_series(df_usdmf_base['SUBJECT'])
+    df_usdmf_base['HOLDER_cleaned'] = str_processing.cleaning_id_series(df_usdmf_base['HOLDER'])
+    return df_usdmf_base
+
+
+def clean_qf_products_chunk(qf: pd.DataFrame) -> pd.DataFrame:
+    qf['qf_supplier_site_audited_requested_product_cleaned'] = str_processing.cleaning_id_series(qf['qf_supplier_site_audited_requested_product'])
+    return qf
+
+
+def clean_qf_names_chunk(qf: pd.DataFrame) -> pd.DataFrame:
+    qf['qf_supplier_site_name_cleaned'] = str_processing.cleaning_id_series(qf['qf_supplier_site_name'])
+    return qf
+
+
+# source name -> (raw file in inputs/, cleaned file in outputs/, chunk cleaning function)
+SOURCES = {
+    'a57': ('a57_raw.csv', 'a57_cleaned.csv', clean_a57_chunk),
+    'cep': ('cep_raw.csv', 'cep_cleaned.csv', clean_cep_chunk),
+    'ob': ('ob.csv', 'ob_cleaned.csv', clean_ob_chunk),
+    'usdmf': ('us_dmf.csv', 'usdmf_cleaned.csv', clean_usdmf_chunk),
+    'qf_products': ('qf_supplier_sites_products.csv', 'qf_supplier_sites_products_cleaned.csv', clean_qf_products_chunk),
+    'qf_names': ('qf_supplier_sites_names.csv', 'qf_supplier_sites_names_cleaned.csv', clean_qf_names_chunk),
+}
+
+
+# --- Streaming ---
+
+def get_whole_file_dtypes(input_file: str, chunksize: int) -> dict:
+    """
+    Pre-pass over the file: the dtype a whole-file read_csv would give to every column, passed to the chunked read.
+    Without it each chunk infers its own types: a column of integers with a missing value in one chunk only
+    would be written as 1 in the other chunks and as 1.0 in that one, and a text column holding '007' and
+    'X5' would be written as 7 by a chunk without any 'X5'. Numeric and boolean columns keep their
+    common dtype, the other columns are read as text, as the whole file gives them.
+    """
+    empty_chunks = [chunk.iloc[:0] for chunk in pd.read_csv(input_file, chunksize=chunksize)]
+    if not empty_chunks:
+        return {}
+    common_dtypes = pd.concat(empty_chunks).dtypes
+    return {
+        column: dtype if pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype) else str
+        for column, dtype in common_dtypes.items()
+    }
+
+
+def clean_source(source: str, pool, chunksize: int, max_pending: int, inputs_folder: str, outputs_folder: str):
+    """Reads one source chunk by chunk, cleans the chunks in the pool and writes them in order."""
+    input_filename, output_filename, clean_chunk = SOURCES[source]
+    input_file = os.path.join(inputs_folder, input_filename)
+    output_file = os.path.join(outputs_folder, output_filename)
+    start_time = time.time()
+
+    has_header = os.path.getsize(input_file) > 0
+    dtypes = get_whole_file_dtypes(input_file, chunksize) if has_header else {}
+    pending = deque()
+    rows_read = 0
+    rows_written = 0
+    chunks = 0
+    chunks_written = 0
+
+    def write_next():
+        nonlocal rows_written, chunks_written
+        df_cleaned = pending.popleft().get()
+        first_chunk = chunks_written == 0
+        df_cleaned.to_csv(output_file, index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+        chunks_written += 1
+        rows_written += len(df_cleaned)
+
+    for chunk in pd.read_csv(input_file, chunksize=chunksize, dtype=dtypes) if has_header else []:
+        rows_read += len(chunk)
+        chunks += 1
+        # Bounded number of chunks in flight: memory depends on the chunk size, not on the file size
+        if len(pending) >= max_pending:
+            write_next()
+        pending.append(pool.apply_async(clean_chunk, (chunk,)))
+    while pending:
+        write_next()
+    if chunks_written == 0 and has_header:
+        # No chunk read (header only input): the output still gets the header, with the columns the cleaning adds
+        pending.append(pool.apply_async(clean_chunk, (pd.read_csv(input_file, nrows=0, dtype=dtypes),)))
+        write_next()
+    elif not has_header:
+        # Empty input, not even a header: an empty output replaces the one of a previous run
+        open(output_file, 'w').close()
+
+    print(f"{source}: {rows_read} rows read in {chunks} chunks, {rows_written} rows written to {output_file} ({time.time() - start_time:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Add a clean version of the ids to the source files.')
+    parser.add_argument('sources', nargs='*', metavar='source', help=f"Sources to clean, among {', '.join(SOURCES)} (default: all).")
+    parser.add_argument('--chunksize', type=int, default=50000, help='Number of rows read and cleaned at once.')
+    parser.add_argument('--cores', type=int, default=multiprocessing.cpu_count(), help='Number of CPU cores to use.')
+    parser.add_argument('--max-pending', type=int, default=None, help='Chunks in flight per source (default: number of cores).')
+    parser.add_argument('--inputs-folder', type=str, default='inputs', help='Folder of the raw files.')
+    parser.add_argument('--outputs-folder', type=str, default='outputs', help='Folder of the cleaned files.')
+    args = parser.parse_args()
+
+    sources = args.sources or list(SOURCES)
+    unknown_sources = [source for source in sources if source not in SOURCES]
+    if unknown_sources:
+        parser.error(f"Unknown sources: {', '.join(unknown_sources)}")
+    max_pending = args.max_pending or args.cores
+    os.makedirs(args.outputs_folder, exist_ok=True)
+
+    with multiprocessing.Pool(processes=args.cores) as pool:
+        # Sources are independent: each one is read and written by its own thread, the cleaning is shared by the pool
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [
+                executor.submit(clean_source, source, pool, args.chunksize, max_pending, args.inputs_folder, args.outputs_folder)
+                for source in sources
+            ]
+            for future in futures:
+                future.result()
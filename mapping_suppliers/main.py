@@ -1,28 +1,47 @@
 import argparse
 import sys
 import pandas as pd
+import numpy as np
 
 from utils import str_processing
 from utils import config
 from utils import fuzzy_matching
 from utils import batch_gen_util, batch_ret_util
+from utils import score_matrix
+from utils import shared_corpus
+from utils import token_index
+from utils import scoring_cascade
+from utils import verdict_cache
+from utils import request_packer
+from utils import request_format
+from utils import local_openai
+from utils import run_report as run_report_util
+from utils import pool_profiler
+from utils import exact_match
+from utils import substance_forms
+from utils import tfidf_engine
+from utils import minhash_lsh
 
 import os
 import json
+import itertools
+import math
 import csv
+import time
 import uuid
-from openai.lib._parsing._completions import type_to_response_format_param
+import cProfile
+import shutil
+import tempfile
 
 import rapidfuzz.fuzz as fuzz
-import rapidfuzz.process as process
 import multiprocessing
-from functools import partial
+import multiprocessing.util
 
 SCORERS_ORIG = [fuzz.token_set_ratio, fuzz.ratio, fuzz.partial_ratio, fuzz.token_sort_ratio]
 SCORERS_CLEANED = [fuzz.token_sort_ratio, fuzz.token_set_ratio]
 
 
-def process_source1_item(source_1_tuple, source_2_data, mapping_config: config.MappingConfig):
+def process_source1_item(source_1_tuple, source_2_data, mapping_config: config.MappingConfig, stats=None, candidate_indices=None):
     """
     Processes a source_1 item against source_2.
     Compares two approaches:
@@ -30,6 +49,11 @@ def process_source1_item(source_1_tuple, source_2_data, mapping_config: config.M
     2. Matching Cleaned strings, then post-filtering with Original strings (Combined).
     Filters source_2 based on 'intermediate' status for SUBSTANCE mapping BEFORE matching.
     Returns discrepancy details between the two approaches & candidates from the Combined approach.
+    Scorer call counters are added to stats when a dict is given.
+    candidate_indices (sorted source_2 positions, e.g. the TF-IDF neighbours) restricts the matching to those
+    items and the first-word matches of the fallback. Without it, the MinHash-LSH index of source_2_data
+    (lsh_index), when set, restricts the matching the same way to the items sharing a bucket with the item.
+    source_2_data['token_index'] is built and stored on the first call when missing.
     """
     original_index_1, name_1_orig, name_1_cleaned, source1_has_intermediate = source_1_tuple
     threshold_orig = mapping_config.fuzzy_match_threshold
@@ -41,75 +65,76 @@ def process_source1_item(source_1_tuple, source_2_data, mapping_config: config.M
     s2_indices_full = source_2_data['indices']
     s2_has_intermediate_list = source_2_data['has_intermediate_list']
     s2_index_to_orig_full = source_2_data['index_to_orig']
+    # The token index is built once per run by generate_batch, standalone calls build it on their first item
+    # and keep it in source_2_data for the next ones
+    s2_token_index = source_2_data.get('token_index')
+    if s2_token_index is None:
+        s2_token_index = source_2_data['token_index'] = token_index.TokenIndex(s2_cleaned_list_full)
+    shortlist_size = source_2_data.get('shortlist_size')
+    s2_lsh_index = source_2_data.get('lsh_index')
+    s2_cleaned_token_lengths = source_2_data.get('cleaned_token_lengths')
+    cleaned_cascade = scoring_cascade.ScoringCascade(SCORERS_CLEANED, threshold_cleaned)
+    orig_cascade = scoring_cascade.ScoringCascade(SCORERS_ORIG, threshold_orig)
 
 
     matches_combined_approach_indices = set() # Stores results of Cleaned + Original Post-Filter
     item_candidates = [] # Candidates from the Combined approach
 
+    # --- Restrict Source 2 to the given candidates, the LSH buckets or the token shortlist (if enabled) ---
+    if candidate_indices is None and s2_lsh_index is not None:
+        candidate_indices = s2_lsh_index.candidates(name_1_cleaned)
+    if candidate_indices is not None:
+        candidate_orig_indices = np.union1d(candidate_indices, s2_token_index.first_token_matches(name_1_cleaned)).astype(np.int64)
+    elif shortlist_size and name_1_cleaned:
+        candidate_orig_indices = s2_token_index.candidates(name_1_cleaned, shortlist_size)
+    else:
+        candidate_orig_indices = np.arange(len(s2_orig_list_full))
+
     # --- Pre-filter Source 2 based on 'intermediate' status ---
     if mapping_config.mapping_type == config.MappingType.SUBSTANCE:
-        matching_status_orig_indices = [
-            idx for idx, status in enumerate(s2_has_intermediate_list)
-            if status == source1_has_intermediate
-        ]
+        s2_has_intermediate = np.asarray(s2_has_intermediate_list, dtype=bool)
+        matching_status_orig_indices = candidate_orig_indices[s2_has_intermediate[candidate_orig_indices] == source1_has_intermediate]
     else:
-        matching_status_orig_indices = list(range(len(s2_orig_list_full)))
+        matching_status_orig_indices = candidate_orig_indices
 
-    if not matching_status_orig_indices:
+    if len(matching_status_orig_indices) == 0:
         # logging.debug(f"Skipping '{name_1_orig}' - no source 2 items match 'intermediate' status.")
-        return None, []
-
-    # Create filtered lists and index mapping for the matching process
-    filtered_s2_orig_list = [s2_orig_list_full[i] for i in matching_status_orig_indices]
-    filtered_s2_cleaned_list = [s2_cleaned_list_full[i] for i in matching_status_orig_indices]
-    filtered_idx_to_orig_s2_df_idx = {
-        new_idx: s2_indices_full[orig_list_idx]
-        for new_idx, orig_list_idx in enumerate(matching_status_orig_indices)
-    }
+        return []
+
+    # The filtered positions are sorted, the filtered index of a source_2 position is found with np.searchsorted
     # --- End Pre-filtering ---
 
     try:
         # --- Approach Matching WITH Cleaning + Original Post-Filter (Combined) ---
-        if name_1_cleaned and name_1_cleaned != "" and filtered_s2_cleaned_list:
-            # cutoff_for_extract_cleaned = max(1, threshold_cleaned - 15)
-            cutoff_for_extract_cleaned = 0
-            # Step 2.1: Initial match using CLEANED names and CLEANED threshold
-            results_cleaned = process.extract(
-                name_1_cleaned,
-                filtered_s2_cleaned_list,
-                scorer=fuzz.token_set_ratio, # Example primary scorer for extraction
-                limit=None,
-                score_cutoff=cutoff_for_extract_cleaned
-            )
-
-            for choice_cleaned, score, idx_in_filtered_list in results_cleaned:
-                name_2_cleaned_filtered = filtered_s2_cleaned_list[idx_in_filtered_list]
-                if not name_2_cleaned_filtered or name_2_cleaned_filtered == "": continue
-
-                # Check *all* cleaned scorers against the CLEANED threshold
-                all_scores_cleaned = [scorer(name_1_cleaned, name_2_cleaned_filtered) for scorer in SCORERS_CLEANED]
-                name_1_split = name_1_cleaned.split()
-                name_2_cleaned_split = name_2_cleaned_filtered.split()
-                original_s2_df_index = filtered_idx_to_orig_s2_df_idx[idx_in_filtered_list]
-
-                # print(f"Cleaned match: '{name_1_cleaned}' vs '{name_2_cleaned_filtered}' - Scores: {all_scores_cleaned} - Index: {original_s2_df_index}")
-
-                if any(s >= threshold_cleaned for s in all_scores_cleaned):
-                    # This item passed the CLEANED match check. Now apply post-filter.
-                    name_2_orig = s2_index_to_orig_full[original_s2_df_index] # Get original name 2
-
-                    # Step 2.2: Post-filter using ORIGINAL names and ORIGINAL threshold
-                    all_scores_orig_postfilter = [scorer(name_1_orig.lower(), name_2_orig.lower()) for scorer in SCORERS_ORIG]
-
-                    if any(s >= threshold_orig for s in all_scores_orig_postfilter):
-                        # Passed BOTH cleaned match and original post-filter
-                        matches_combined_approach_indices.add(original_s2_df_index)
-
-                    # print(f"Post-filter match: '{name_1_orig}' vs '{name_2_orig}' - Scores: {all_scores_orig_postfilter} - Index: {original_s2_df_index}")
-                elif len(name_1_split) > 0 and len(name_2_cleaned_split) > 0 and name_1_split[0].lower() == name_2_cleaned_split[0].lower():
-                    # print("Need to check the first word of the cleaned name")
+        if name_1_cleaned and name_1_cleaned != "":
+            # Step 2.1: Initial match using CLEANED names and CLEANED threshold (any cleaned scorer),
+            # a shared source_2 column is decoded one tile at a time
+            cleaned_matched_filtered_indices = set()
+            for tile_start, s2_cleaned_tile in shared_corpus.tiles(s2_cleaned_list_full, matching_status_orig_indices):
+                tile_s2_cleaned_token_lengths = None
+                if s2_cleaned_token_lengths is not None:
+                    tile_s2_cleaned_token_lengths = s2_cleaned_token_lengths[matching_status_orig_indices[tile_start:tile_start + len(s2_cleaned_tile)]]
+                cleaned_matched_filtered_indices.update(
+                    tile_start + idx_in_tile for idx_in_tile in cleaned_cascade.extract_passing(name_1_cleaned, s2_cleaned_tile, tile_s2_cleaned_token_lengths)
+                )
+
+            for idx_in_filtered_list in cleaned_matched_filtered_indices:
+                # This item passed the CLEANED match check. Now apply post-filter.
+                original_s2_df_index = s2_indices_full[matching_status_orig_indices[idx_in_filtered_list]]
+                name_2_orig = s2_index_to_orig_full[original_s2_df_index] # Get original name 2
+
+                # Step 2.2: Post-filter using ORIGINAL names and ORIGINAL threshold
+                if orig_cascade.passes(name_1_orig.lower(), name_2_orig.lower()):
+                    # Passed BOTH cleaned match and original post-filter
                     matches_combined_approach_indices.add(original_s2_df_index)
 
+            # Fallback: items failing the CLEANED check are kept when they share the first word,
+            # they are looked up in the token index instead of being scored
+            first_token_orig_indices = np.intersect1d(s2_token_index.first_token_matches(name_1_cleaned), matching_status_orig_indices)
+            for orig_list_idx, idx_in_filtered_list in zip(first_token_orig_indices.tolist(), np.searchsorted(matching_status_orig_indices, first_token_orig_indices).tolist()):
+                if idx_in_filtered_list not in cleaned_matched_filtered_indices:
+                    matches_combined_approach_indices.add(s2_indices_full[orig_list_idx])
+
         # --- Collect Candidates based on the "Combined" approach results ---
         for original_s2_df_index in matches_combined_approach_indices:
             mapping = { "item_1": name_1_orig,
@@ -119,9 +144,191 @@ def process_source1_item(source_1_tuple, source_2_data, mapping_config: config.M
     except Exception as e:
         print(f"ERROR processing source_1 item {original_index_1} ('{name_1_orig}'): {e}", exc_info=True)
 
+    if stats is not None:
+        cleaned_cascade.add_stats(stats)
+        orig_cascade.add_stats(stats)
+
     return item_candidates
 
 
+# --- Pool worker state, set once per worker by init_pool_worker ---
+_worker_state = {}
+
+def init_pool_worker(corpus_name, corpus_layout, worker_mapping_config: config.MappingConfig, s2_token_index, shortlist_size, track_memory=False, profile_folder=None, lsh_params=None, tfidf_params=None):
+    """
+    Attaches the worker to the shared corpus, source_2 strings are decoded on access (shared_corpus.SharedStrings).
+    lsh_params (MinHashLSHIndex.params), when given, rebuilds the MinHash-LSH index on the bucket arrays of the corpus.
+    tfidf_params (top_k and matrix shapes), when given, attaches the TF-IDF matrices of the corpus for process_source1_block.
+    """
+    if profile_folder is not None:
+        pool_profiler.start_worker_profiler(profile_folder)
+    if track_memory:
+        run_report_util.start_memory_tracking()
+    _worker_state['track_memory'] = track_memory
+    corpus = shared_corpus.SharedCorpus.attach(corpus_name, corpus_layout)
+    # Lower exitpriority than the profile dump of pool_profiler: runs after it, with the other finalizers of the worker exit
+    multiprocessing.util.Finalize(None, close_pool_worker, exitpriority=5)
+    s2_orig_list = corpus.lazy_strings('s2_orig')
+    _worker_state['corpus'] = corpus
+    _worker_state['mapping_config'] = worker_mapping_config
+    _worker_state['s1_has_intermediate'] = corpus.flags('s1_has_intermediate')
+    s2_lsh_index = None
+    if lsh_params is not None:
+        s2_lsh_index = minhash_lsh.MinHashLSHIndex.from_arrays(lsh_params, {part: corpus.array(f's2_lsh_{part}') for part in minhash_lsh.ARRAYS})
+    _worker_state['source_2_data'] = {
+        'orig_list': s2_orig_list,
+        'cleaned_list': corpus.lazy_strings('s2_cleaned'),
+        'indices': range(len(s2_orig_list)), # Positions are the df_unique_source_2 index
+        'index_to_orig': s2_orig_list,
+        'has_intermediate_list': np.array(corpus.flags('s2_has_intermediate')),
+        'token_index': s2_token_index,
+        'shortlist_size': shortlist_size,
+        'lsh_index': s2_lsh_index,
+        'cleaned_token_lengths': corpus.array('s2_cleaned_token_lengths')
+    }
+    if tfidf_params is not None:
+        _worker_state['tfidf'] = {
+            'top_k': tfidf_params['top_k'],
+            's1_matrix': tfidf_engine.csr_from_arrays({part: corpus.array(f's1_tfidf_{part}') for part in tfidf_engine.CSR_PARTS}, tfidf_params['s1_shape']),
+            'matrix_t': tfidf_engine.csr_from_arrays({part: corpus.array(f's2_tfidf_t_{part}') for part in tfidf_engine.CSR_PARTS}, tfidf_params['s2_t_shape']),
+        }
+
+def close_pool_worker():
+    """Worker exit: the views on the shared corpus are dropped before closing it, an open view makes close() raise BufferError."""
+    corpus = _worker_state.get('corpus')
+    _worker_state.clear()
+    if corpus is not None:
+        corpus.close()
+
+def worker_source_1_tuple(index_1):
+    corpus = _worker_state['corpus']
+    return (
+        index_1,
+        corpus.string('s1_orig', index_1),
+        corpus.string('s1_cleaned', index_1),
+        bool(_worker_state['s1_has_intermediate'][index_1])
+    )
+
+def worker_result(candidates, stats):
+    if _worker_state['track_memory']:
+        stats[run_report_util.WORKER_MEMORY_KEY] = (os.getpid(), run_report_util.memory_sample())
+    return candidates, stats
+
+def process_source1_index(index_1):
+    """Pool task: only the source_1 position travels between processes. Returns (candidates, stats)."""
+    stats = {}
+    candidates = process_source1_item(worker_source_1_tuple(index_1), _worker_state['source_2_data'], _worker_state['mapping_config'], stats)
+    return worker_result(candidates, stats)
+
+def process_source1_block(block):
+    """Pool task of the TF-IDF engine: source_1 rows [start, end) matched on their TF-IDF neighbours. Returns (candidates, stats)."""
+    start, end = block
+    tfidf = _worker_state['tfidf']
+    stats = {}
+    candidates = []
+    for row, neighbours in tfidf_engine.block_neighbours(tfidf['s1_matrix'][start:end], tfidf['matrix_t'], tfidf['top_k']):
+        candidates.extend(process_source1_item(worker_source_1_tuple(start + row), _worker_state['source_2_data'], _worker_state['mapping_config'], stats, candidate_indices=neighbours))
+    return worker_result(candidates, stats)
+
+
+def generate_candidates_pool(source_1_data, source_2_data, mapping_config: config.MappingConfig, cores, chunksize, token_shortlist=None, worker_memory=None, profile_folder=None, lsh_params=None, tfidf=None):
+    """
+    Pool engine: every source_1 item is matched against source_2 by process_source1_item. Returns (candidates, scorer stats).
+    lsh_params (dict of MinHashLSHIndex arguments), when given, restricts the matching to the LSH buckets of each item.
+    tfidf (dict: s1_matrix, matrix_t, top_k, block_rows), when given, restricts it to the TF-IDF neighbours of each item,
+    the tasks are then blocks of block_rows source_1 rows (generate_candidates_tfidf).
+    worker_memory (dict), when given, receives the last memory sample of each worker by pid.
+    profile_folder, when given, receives the cProfile stats of each worker (utils/pool_profiler.py).
+    """
+    print("Building the source 2 token index...")
+    s2_token_index = token_index.TokenIndex(source_2_data['cleaned_list'])
+    s2_lsh_index = None
+    if lsh_params is not None:
+        print(f"Building the source 2 MinHash-LSH index ({lsh_params['bands']} bands of {lsh_params['rows']} rows, max_df {lsh_params.get('max_df')})...")
+        s2_lsh_index = minhash_lsh.MinHashLSHIndex(source_2_data['cleaned_list'], **lsh_params)
+    # The index arrays go to shared memory with the names: with the spawn start method the initializer
+    # arguments are pickled for every worker
+    index_columns = {}
+    worker_lsh_params = None
+    if s2_lsh_index is not None:
+        index_columns.update({f's2_lsh_{part}': array for part, array in s2_lsh_index.arrays().items()})
+        worker_lsh_params = s2_lsh_index.params()
+    tfidf_params = None
+    if tfidf is not None:
+        # Workers build CSR views on the arrays of the sparse matrices
+        for prefix, matrix in (('s1_tfidf', tfidf['s1_matrix']), ('s2_tfidf_t', tfidf['matrix_t'])):
+            index_columns.update({f'{prefix}_{part}': array for part, array in tfidf_engine.csr_arrays(matrix).items()})
+        tfidf_params = {'top_k': tfidf['top_k'], 's1_shape': tfidf['s1_matrix'].shape, 's2_t_shape': tfidf['matrix_t'].shape}
+
+    # Both sources are written once to shared memory, workers attach to it in the pool initializer
+    corpus = shared_corpus.SharedCorpus.create(
+        string_columns={
+            's1_orig': source_1_data['orig_list'],
+            's1_cleaned': source_1_data['cleaned_list'],
+            's2_orig': source_2_data['orig_list'],
+            's2_cleaned': source_2_data['cleaned_list'],
+        },
+        flag_columns={
+            's1_has_intermediate': source_1_data['has_intermediate_list'],
+            's2_has_intermediate': source_2_data['has_intermediate_list'],
+        },
+        array_columns={
+            's2_cleaned_token_lengths': np.array([scoring_cascade.token_length(name) for name in source_2_data['cleaned_list']], dtype=np.int64),
+            **index_columns
+        }
+    )
+    source_1_length = len(source_1_data['orig_list'])
+    mappings_candidate = []
+    scorer_stats = {}
+    with corpus:
+        with multiprocessing.Pool(processes=cores, initializer=init_pool_worker, initargs=(corpus.name, corpus.layout, mapping_config, s2_token_index, token_shortlist, worker_memory is not None, profile_folder, worker_lsh_params, tfidf_params)) as pool:
+                if tfidf is None:
+                    # Use imap_unordered for potentially better performance if task order doesn't matter
+                    results_iterator = pool.imap_unordered(process_source1_index, range(source_1_length), chunksize=chunksize)
+                    task_sizes = itertools.repeat(1)
+                else:
+                    # One sparse product per task, in order: the candidates come out as in a serial run.
+                    # Blocks are made smaller when there would be less than 4 per core
+                    block_rows = max(1, min(tfidf['block_rows'], math.ceil(source_1_length / (cores * 4))))
+                    blocks = [(start, min(start + block_rows, source_1_length)) for start in range(0, source_1_length, block_rows)]
+                    results_iterator = pool.imap(process_source1_block, blocks)
+                    task_sizes = (end - start for start, end in blocks)
+                progress = run_report_util.ProgressMeter(source_1_length, "Matching")
+                for task_size, (candidates, stats) in zip(task_sizes, results_iterator):
+                    if run_report_util.WORKER_MEMORY_KEY in stats:
+                        pid, sample = stats.pop(run_report_util.WORKER_MEMORY_KEY)
+                        worker_memory[pid] = sample
+                    if candidates:
+                        mappings_candidate.extend(candidates) # Collect candidates from the Combined approach
+                    for key, value in stats.items():
+                        scorer_stats[key] = scorer_stats.get(key, 0) + value
+                    progress.update(task_size)
+                # Workers exit normally (and write their profile) instead of being terminated by the with block
+                pool.close()
+                pool.join()
+    return mappings_candidate, scorer_stats
+
+
+def write_profile(run_inputs_folder):
+    """--profile: merges the parent and pool worker profiles into profile_<command>.pstats of the run folder, with a top-N summary."""
+    stats = pool_profiler.merge_profiles(worker_profile_folder, os.path.join(run_inputs_folder, f"profile_{run_report.command}.pstats"), parent_profiler)
+    shutil.rmtree(worker_profile_folder, ignore_errors=True)
+    if stats is not None:
+        pool_profiler.write_top_summary(stats, os.path.join(run_inputs_folder, f"profile_{run_report.command}_top.txt"), args.profile_top)
+
+
+def generate_candidates_tfidf(source_1_data, source_2_data, mapping_config: config.MappingConfig, top_k, block_rows, max_df, cores=1, worker_memory=None, profile_folder=None):
+    """
+    TF-IDF engine: process_source1_item on the top_k character-trigram neighbours of each source_1 item. Returns (candidates, scorer stats).
+    The blocks of block_rows source_1 rows are matched by the pool of generate_candidates_pool (cores processes).
+    """
+    print("Building the source 2 TF-IDF index...")
+    s2_tfidf_index = tfidf_engine.TfidfIndex(source_2_data['cleaned_list'], max_df=max_df)
+    s1_matrix = s2_tfidf_index.transform(source_1_data['cleaned_list'])
+    tfidf = {'s1_matrix': s1_matrix, 'matrix_t': s2_tfidf_index.matrix_t, 'top_k': top_k, 'block_rows': block_rows}
+    return generate_candidates_pool(source_1_data, source_2_data, mapping_config, cores, 1, worker_memory=worker_memory, profile_folder=profile_folder, tfidf=tfidf)
+
+
 def generate_batch():
     # Prep folders
     date_time_str = pd.Timestamp.now().strftime('%Y_%m_%d_%H_%M_%S')
@@ -129,15 +336,18 @@ def generate_batch():
     os.makedirs(batch_folder, exist_ok=True)
 
     inputs_folder = os.path.join(os.getcwd(), batch_folder)
-    Batch_Gen_Util = batch_gen_util.BatchGenUtil(main_folder=inputs_folder, batch_size=mapping_config.batch_size, dry_run=args.dry_run)
+    Batch_Gen_Util = batch_gen_util.BatchGenUtil(main_folder=inputs_folder, batch_size=mapping_config.batch_size, dry_run=args.dry_run, upload_workers=args.upload_workers)
 
+    run_report.start_stage('unique_items')
     print(f"Getting unique items from {mapping_config.source_1_filename} and {mapping_config.source_2_filename}...")
-    df_unique_source_1 = pd.DataFrame(str_processing.get_unique_items(df_source_1, mapping_config.source_1_id_cleaned, mapping_config.source_1_separator))
-    df_unique_source_2 = pd.DataFrame(str_processing.get_unique_items(df_source_2, mapping_config.source_2_id_cleaned, mapping_config.source_2_separator))
-    df_unique_source_1[mapping_config.source_1_id_cleaned] = df_unique_source_1[0]
-    df_unique_source_2[mapping_config.source_2_id_cleaned] = df_unique_source_2[0]
+    df_unique_source_1 = str_processing.get_unique_items_df(df_source_1, mapping_config.source_1_id_cleaned, mapping_config.source_1_separator)
+    df_unique_source_2 = str_processing.get_unique_items_df(df_source_2, mapping_config.source_2_id_cleaned, mapping_config.source_2_separator)
 
     print(f"Loaded {len(df_unique_source_1)} unique items from {mapping_config.source_1_filename} and {len(df_unique_source_2)} unique items from {mapping_config.source_2_filename}.")
+    run_report.add('source_1_items', len(df_unique_source_1))
+    run_report.add('source_2_items', len(df_unique_source_2))
+
+    run_report.start_stage('cleaning')
 
     if mapping_config.mapping_type == config.MappingType.SUBSTANCE:
         df_unique_source_1['has_intermediate'] = df_unique_source_1[mapping_config.source_1_id_cleaned].str.lower().str.contains('intermediate', na=False, regex=False)
@@ -158,12 +368,31 @@ def generate_batch():
     df_unique_source_1 = df_unique_source_1.reset_index(drop=True)
     df_unique_source_2 = df_unique_source_2.reset_index(drop=True)
 
-    source_1_data_tuples = list(zip(
-        df_unique_source_1.index,
-        df_unique_source_1[mapping_config.source_1_id_cleaned],
-        df_unique_source_1['aggressively_cleaned_name'],
-        df_unique_source_1['has_intermediate'] # Already computed or set to False
-    ))
+    exact_pairs = set()
+    if not args.no_exact_match:
+        # --- Pairs of identical canonical keys, accepted without LLM request and left out of the fuzzy engine ---
+        run_report.start_stage('exact_match')
+        exact_verdicts, exact_pairs, exact_positions_1, exact_positions_2 = exact_match.resolve_exact_pairs(
+            {'orig_list': df_unique_source_1[mapping_config.source_1_id_cleaned].tolist(), 'cleaned_list': df_unique_source_1['aggressively_cleaned_name'].tolist()},
+            {'orig_list': df_unique_source_2[mapping_config.source_2_id_cleaned].tolist(), 'cleaned_list': df_unique_source_2['aggressively_cleaned_name'].tolist()},
+            mapping_config
+        )
+        for provenance, verdicts in exact_verdicts.items():
+            verdict_cache.write_local_verdicts(f"{batch_folder}/{verdict_cache.LOCAL_VERDICTS_FILENAME}", verdicts, provenance=provenance)
+        df_unique_source_1 = df_unique_source_1.drop(index=list(exact_positions_1))
+        df_unique_source_2 = df_unique_source_2.drop(index=list(exact_positions_2))
+        print(f"Exact match: {len(exact_pairs)} pairs with identical canonical keys accepted, "
+              f"{len(exact_positions_1)} Source 1 and {len(exact_positions_2)} Source 2 items left out of the fuzzy engine.")
+        run_report.add('exact_pairs', len(exact_pairs))
+
+    df_unique_source_1 = df_unique_source_1.reset_index(drop=True)
+    df_unique_source_2 = df_unique_source_2.reset_index(drop=True)
+
+    source_1_data = {
+        'orig_list': df_unique_source_1[mapping_config.source_1_id_cleaned].tolist(),
+        'cleaned_list': df_unique_source_1['aggressively_cleaned_name'].tolist(),
+        'has_intermediate_list': df_unique_source_1['has_intermediate'].tolist() # Already computed or set to False
+    }
     source_2_data = {
         'orig_list': df_unique_source_2[mapping_config.source_2_id_cleaned].tolist(),
         'cleaned_list': df_unique_source_2['aggressively_cleaned_name'].tolist(),
@@ -171,70 +400,143 @@ def generate_batch():
         'index_to_orig': df_unique_source_2[mapping_config.source_2_id_cleaned].to_dict(), # Map df index to orig name
         'has_intermediate_list': df_unique_source_2['has_intermediate'].tolist() # Already computed or set to False
     }
-    source_1_length = len(source_1_data_tuples); source_2_length = len(source_2_data['orig_list'])
+    source_1_length = len(source_1_data['orig_list']); source_2_length = len(source_2_data['orig_list'])
     print(f"Prepared {source_1_length} Source 1 items and {source_2_length} Source 2 items.")
 
-    # --- Parallel Processing ---
+    run_report.start_stage('matching')
     mappings_candidate = []
-    process_func = partial(process_source1_item, source_2_data=source_2_data, mapping_config=mapping_config)
-
-    with multiprocessing.Pool(processes=args.cores) as pool:
-            # Use imap_unordered for potentially better performance if task order doesn't matter
-            results_iterator = pool.imap_unordered(process_func, source_1_data_tuples, chunksize=args.multiproc_chunksize)
-            for candidates in results_iterator:
-                if candidates:
-                    mappings_candidate.extend(candidates) # Collect candidates from the Combined approach
-
-    # --- End Parallel Processing ---
-    df_mappings_candidate = pd.DataFrame(mappings_candidate)
+    engine = args.engine
+    if engine == 'tfidf' and mapping_config.mapping_type == config.MappingType.SUPPLIER:
+        # The TF-IDF neighbours miss most of the supplier candidates of the exhaustive scan (utils/tfidf_engine.py)
+        print("WARNING: --engine tfidf is for SUBSTANCE mappings only, its supplier candidate recall is far below the default engine: running the pool engine.")
+        engine = 'pool'
+    if engine == 'cdist':
+        # --- Tiled score matrices (multi-threaded inside rapidfuzz) ---
+        mappings_candidate = score_matrix.generate_candidates(
+            source_1_data,
+            source_2_data,
+            threshold_orig=mapping_config.fuzzy_match_threshold,
+            threshold_cleaned=mapping_config.cleaned_fuzzy_match_threshold,
+            filter_intermediate=mapping_config.mapping_type == config.MappingType.SUBSTANCE,
+            scorers_cleaned=SCORERS_CLEANED,
+            scorers_orig=SCORERS_ORIG,
+            tile_memory_mb=args.tile_memory_mb,
+            workers=args.cores
+        )
+    elif engine == 'tfidf':
+        # --- Character-trigram TF-IDF neighbours, rapidfuzz checks on the neighbours only ---
+        worker_memory = {} if run_report.track_memory else None
+        mappings_candidate, scorer_stats = generate_candidates_tfidf(source_1_data, source_2_data, mapping_config, args.tfidf_top_k, args.tfidf_block_rows, args.tfidf_max_df, args.cores, worker_memory, worker_profile_folder)
+        if worker_memory:
+            run_report.add_worker_memory(worker_memory)
+        run_report.add('pairs_scored', scorer_stats.get('scorer_calls_made', 0))
+    else:
+        # --- Parallel Processing ---
+        worker_memory = {} if run_report.track_memory else None
+        lsh_params = {'bands': args.lsh_bands, 'rows': args.lsh_rows, 'shingle_size': args.lsh_shingle_size, 'shingle_kind': args.lsh_shingle_kind, 'max_df': args.lsh_max_df} if args.lsh else None
+        mappings_candidate, scorer_stats = generate_candidates_pool(source_1_data, source_2_data, mapping_config, args.cores, args.multiproc_chunksize, args.token_shortlist, worker_memory, worker_profile_folder, lsh_params)
+        if worker_memory:
+            run_report.add_worker_memory(worker_memory)
+
+        # --- End Parallel Processing ---
+        scorer_calls_made = scorer_stats.get('scorer_calls_made', 0); scorer_calls_avoided = scorer_stats.get('scorer_calls_avoided', 0)
+        run_report.add('pairs_scored', scorer_calls_made)
+        run_report.add('pairs_pruned', scorer_calls_avoided)
+        if scorer_calls_made + scorer_calls_avoided > 0:
+            print(f"Scorer calls: {scorer_calls_made} made, {scorer_calls_avoided} avoided ({scorer_calls_avoided / (scorer_calls_made + scorer_calls_avoided) * 100:.1f}%).")
     print(f"Generated {len(mappings_candidate)} potential mappings using the Combined approach.")
+    run_report.add('candidates_emitted', len(mappings_candidate))
+    if exact_pairs:
+        # An item kept for its exact pairs left to the LLM can find again a partner of a resolved pair
+        mappings_candidate = [mapping for mapping in mappings_candidate if (mapping['item_1'], mapping['item_2']) not in exact_pairs]
+
+    if mapping_config.mapping_type == config.MappingType.SUBSTANCE and not args.no_form_rules:
+        # --- Pairs of the same base answered by the salt / hydrate rules ---
+        run_report.start_stage('form_rules')
+        form_resolver = substance_forms.SubstanceFormResolver()
+        rules_verdicts, mappings_candidate = form_resolver.resolve_candidates(mappings_candidate)
+        verdict_cache.write_local_verdicts(f"{batch_folder}/{verdict_cache.LOCAL_VERDICTS_FILENAME}", rules_verdicts, provenance=substance_forms.RULES_PROVENANCE)
+        print(f"Form rules: {len(rules_verdicts)} pairs resolved locally ({form_resolver.stats['resolved_same_form']} same form, "
+              f"{form_resolver.stats['resolved_other_form']} other form), {len(mappings_candidate)} pairs left for the batch API.")
+        run_report.add('rules_verdicts', len(rules_verdicts))
+    run_report.checkpoint('mappings_candidate built')
+
+    if not args.no_verdict_cache:
+        run_report.start_stage('verdict_cache')
+        # --- Pairs already answered in previous runs are served from the verdict cache ---
+        cache = verdict_cache.VerdictCache(f'{mapping_config.mapping_name}/verdict_cache.sqlite')
+        cache.backfill_from_batches(f'{mapping_config.mapping_name}/batches', mapping_config)
+        cached_verdicts = cache.lookup(
+            [(mapping['item_1'], mapping['item_2']) for mapping in mappings_candidate],
+            verdict_cache.get_cache_context(mapping_config)
+        )
+        cache.close()
+        verdict_cache.write_local_verdicts(f"{batch_folder}/{verdict_cache.LOCAL_VERDICTS_FILENAME}", cached_verdicts.values(), provenance="cache")
+        mappings_candidate = [mapping for mapping in mappings_candidate if (mapping['item_1'], mapping['item_2']) not in cached_verdicts]
+        print(f"Verdict cache: {len(cached_verdicts)} pairs already answered, {len(mappings_candidate)} pairs left for the batch API.")
+        run_report.add('cached_verdicts', len(cached_verdicts))
+
+    run_report.start_stage('request_building')
+
+    if mapping_config.request_token_budget is not None:
+        # --- Requests packed up to the token budget ---
+        packer = request_packer.RequestPacker(mapping_config)
+        dfs_json, skipped_pairs, packing_stats = packer.pack(mappings_candidate)
+        run_report.checkpoint('requests packed (dfs_json)')
+        request_packer.print_packing_report(packing_stats, mapping_config.request_token_budget, mapping_config.request_item_size)
+        if skipped_pairs:
+            # Pairs whose answer can't fit in one request, left for a manual review
+            skipped_pairs_path = f"{batch_folder}/{request_packer.SKIPPED_PAIRS_FILENAME}"
+            pd.DataFrame(skipped_pairs).to_csv(skipped_pairs_path, index=False)
+            print(f"Skipped pairs written to {skipped_pairs_path}")
+            run_report.add('pairs_skipped', len(skipped_pairs))
+        requests_max_tokens = [packer.request_max_tokens(df_chunk) for df_chunk in dfs_json]
+    else:
+        dfs_json = [mappings_candidate[i:i + mapping_config.request_item_size] for i in range(0, len(mappings_candidate), mapping_config.request_item_size)]
+        requests_max_tokens = [None] * len(dfs_json)
 
-    df_chunks = [df_mappings_candidate.iloc[i:i + mapping_config.request_item_size] for i in range(0, len(df_mappings_candidate), mapping_config.request_item_size)]
-    dfs_json = [chunk.to_dict(orient='records') for chunk in df_chunks]
-    
     prev_batch_inc = None
+    pairs_prepped = 0
+    layout_stats = {'pairs': 0, 'previous_chars': 0, 'system_chars': 0, 'user_chars': 0}
+    # Static part of the requests, serialized once
+    request_template = request_format.RequestTemplate(mapping_config)
     for i in range(0, len(dfs_json)):
         df_chunk = dfs_json[i]
-        current_batch_inc = ((max((i - 1), 0) * mapping_config.request_item_size) + len(df_chunk)) // mapping_config.batch_size
+        current_batch_inc = pairs_prepped // mapping_config.batch_size
+        pairs_prepped += len(df_chunk)
         if prev_batch_inc is None or current_batch_inc != prev_batch_inc:
             prev_batch_inc = current_batch_inc
-            print(f"Prepping batch call {current_batch_inc + 1} / {len(dfs_json) * mapping_config.request_item_size // mapping_config.batch_size}") 
+            print(f"Prepping batch call {current_batch_inc + 1} / {math.ceil(len(mappings_candidate) / mapping_config.batch_size)}") 
             
-        messages = [
-            {
-                "role": "system",
-                "content": f"""
-{mapping_config.system_prompt}
-Here are the mappings (in JSON format):
-{json.dumps(df_chunk, indent=4).replace('\n', ' ')}
-"""
-            }
-        ]
-
-        completion = {
-            "custom_id": f'mappings-{uuid.uuid4()}',
-            "method": "POST",
-            "url": "/v1/chat/completions",
-            "body": {
-                "model": "gpt-4o",
-                "temperature": 0,
-                "messages": messages,
-                "response_format": type_to_response_format_param(mapping_config.response_format),
-            }
-        }
+        pairs_content = request_format.encode_pairs(df_chunk)
+        if args.dry_run:
+            layout_stats['pairs'] += len(df_chunk)
+            layout_stats['previous_chars'] += len(request_format.get_previous_layout_content(mapping_config, df_chunk))
+            layout_stats['system_chars'] += len(request_template.system_content)
+            layout_stats['user_chars'] += len(pairs_content)
 
         Batch_Gen_Util.add_to_batch(
-            data=json.dumps(completion, indent=4).replace('\n', ' '),
+            data=request_template.render(f'mappings-{uuid.uuid4()}', pairs_content, requests_max_tokens[i]),
             increment=len(df_chunk)
         )
 
-    batches = Batch_Gen_Util.conclude_session()
-    batch_recap = {
-        "batches": batches
-    }
+    if args.dry_run:
+        request_packer.print_layout_report(layout_stats, request_template.system_content)
 
-    with open(f"{batch_folder}/batch_recap.json", 'w') as f:
-        json.dump(batch_recap, f, indent=4)
+    # Uploads run in the background during the request building, this is the wait for the last ones
+    run_report.start_stage('upload')
+    # The recap gets every batch created, even when some files fail (BatchUploadError is raised after it is written)
+    batches = Batch_Gen_Util.conclude_session(f"{batch_folder}/batch_recap.json")
+
+    run_report.end_stage()
+    run_report.add('pairs_sent', pairs_prepped)
+    run_report.add('requests_written', len(dfs_json))
+    run_report.add('batch_files_written', len(Batch_Gen_Util.manifests))
+    run_report.add('bytes_written', sum(manifest['bytes'] for manifest in Batch_Gen_Util.manifests))
+    run_report.add('batches_created', len(batches))
+    run_report.write(batch_folder)
+    if args.profile:
+        write_profile(batch_folder)
 
 def merge_with_mapping_and_save_results(df_1, df_2, df_mappings, merge_strategy, mapping_config: config.MappingConfig):
     intermediate_df = pd.merge(
@@ -274,14 +576,14 @@ def merge_with_mapping_and_save_results(df_1, df_2, df_mappings, merge_strategy,
         print(f"\nError saving final data to {output_filename}: {e}")
 
 
-def process_batch(df_source_1, df_source_2, mapping_config: config.MappingConfig):
-    batch_folder = f'{mapping_config.mapping_name}/batches'
-    Batch_Ret_Util = batch_ret_util.BatchRetUtil(os.path.join(os.getcwd(), batch_folder))
-    contents = Batch_Ret_Util.get_contents()
-
-    print(f"Loaded {len(contents)} batches from {batch_folder}.")
+def get_final_mappings(contents, mapping_config: config.MappingConfig):
+    """
+    Keeps the positive verdicts of the parsed response contents, as rows of the mapping output.
+    The provenance column tells where the verdict comes from: "llm", or the one of the local verdicts ("cache", "exact", "exact_core", "rules").
+    """
     final_mappings = []
     for content in contents:
+        provenance = content.get('provenance', 'llm')
         for mapping in content['mappings']:
             if mapping_config.mapping_type == config.MappingType.SUBSTANCE:
                 if mapping['have_same_base'] is True or mapping['have_same_form'] is True or mapping['is_diluted'] is True:
@@ -293,6 +595,7 @@ def process_batch(df_source_1, df_source_2, mapping_config: config.MappingConfig
                     final_mapping['have_same_base'] = mapping['have_same_base']
                     final_mapping['have_same_form'] = mapping['have_same_form']
                     final_mapping['is_diluted'] = mapping['is_diluted']
+                    final_mapping['provenance'] = provenance
                     final_mappings.append(final_mapping)
             elif mapping_config.mapping_type == config.MappingType.SUPPLIER:
                 if mapping['confidence_score_match_site_level'] >= 0.7 or mapping['confidence_score_are_part_of_same_company'] >= 0.7:
@@ -305,19 +608,169 @@ def process_batch(df_source_1, df_source_2, mapping_config: config.MappingConfig
                     final_mapping[mapping_config.source_1_is_supplier_site_column] = mapping['is_item_2_supplier_site']
                     final_mapping['confidence_score_match_site_level'] = mapping['confidence_score_match_site_level']
                     final_mapping['confidence_score_are_part_of_same_company'] = mapping['confidence_score_are_part_of_same_company']
+                    final_mapping['provenance'] = provenance
                     final_mappings.append(final_mapping)
+    return final_mappings
+
+
+def append_final_mappings(output_path, final_mappings):
+    """Appends rows to the mapping output, the header is written when the file is created."""
+    if not final_mappings:
+        return
+    is_new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    with open(output_path, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(final_mappings[0].keys()))
+        if is_new_file:
+            writer.writeheader()
+        writer.writerows(final_mappings)
+
+
+WATCH_INITIAL_DELAY = 30
+WATCH_MAX_DELAY = 600
+
+def process_batch_incremental(mapping_config: config.MappingConfig, watch=False):
+    """
+    Ingests the batches of the latest run as they complete: only batches and custom_ids not in the run
+    checkpoint are read, their verdicts are appended to the mapping output.
+    With watch, polls with backoff until every batch is in a terminal state.
+    The run report (and the --profile output) is written to the run folder after each poll.
+    """
+    batch_folder = f'{mapping_config.mapping_name}/batches'
+    run_report.start_stage('retrieve_batches')
+    Batch_Ret_Util = batch_ret_util.BatchRetUtil(os.path.join(os.getcwd(), batch_folder), workers=args.retrieval_workers, require_completed=False)
+    run_inputs_folder = os.path.join(Batch_Ret_Util.latest_batch_path, 'inputs')
+    checkpoint = batch_ret_util.IngestionCheckpoint(os.path.join(Batch_Ret_Util.latest_batch_path, batch_ret_util.CHECKPOINT_FILENAME))
+    output_path = f'outputs/{mapping_config.mapping_output_filename}'
+    if not checkpoint.batch_ids and not checkpoint.local_verdicts and os.path.exists(output_path):
+        # First ingestion of this run: the output of a previous run is kept aside, this run starts from an empty file
+        previous_output_path = f"{output_path}.previous"
+        os.replace(output_path, previous_output_path)
+        print(f"WARNING: first ingestion of run {os.path.basename(Batch_Ret_Util.latest_batch_path)}, the existing {output_path} was moved to {previous_output_path}")
+
+    run_report.start_stage('local_verdicts')
+    if not checkpoint.local_verdicts:
+        # Verdicts served by the exact match and the verdict cache at generation time
+        local_verdicts = verdict_cache.read_local_verdicts(os.path.join(Batch_Ret_Util.latest_batch_path, 'inputs', verdict_cache.LOCAL_VERDICTS_FILENAME))
+        append_final_mappings(output_path, get_final_mappings(verdict_cache.get_local_contents(local_verdicts), mapping_config))
+        checkpoint.local_verdicts = True
+        checkpoint.save()
+        print(f"Ingested {len(local_verdicts)} local verdicts.")
+        run_report.add('local_verdicts', len(local_verdicts))
+
+    delay = WATCH_INITIAL_DELAY
+    while True:
+        run_report.start_stage('download_parse')
+        ready = [
+            batch_plus for batch_plus in Batch_Ret_Util.batches_plus
+            if batch_plus['batch'].id not in checkpoint.batch_ids
+            and batch_plus['batch'].status in batch_ret_util.TERMINAL_BATCH_STATUSES
+            and getattr(batch_plus['batch'], 'output_file_id', None)
+        ]
+        stats = {}
+        new_rows = 0
+        # Rows are appended batch by batch, the checkpoint is saved after each batch
+        current_batch_id = None
+        current_rows = []
+        for batch_id, custom_id, contents in Batch_Ret_Util.iter_batch_contents(ready, stats):
+            if batch_id != current_batch_id:
+                if current_batch_id is not None:
+                    append_final_mappings(output_path, current_rows)
+                    checkpoint.batch_ids.add(current_batch_id)
+                    checkpoint.save()
+                    new_rows += len(current_rows)
+                current_batch_id, current_rows = batch_id, []
+            if custom_id in checkpoint.custom_ids:
+                continue
+            current_rows.extend(get_final_mappings(contents, mapping_config))
+            checkpoint.custom_ids.add(custom_id)
+        if current_batch_id is not None:
+            append_final_mappings(output_path, current_rows)
+            checkpoint.batch_ids.add(current_batch_id)
+            checkpoint.save()
+            new_rows += len(current_rows)
+        # Terminal batches without output (e.g. failed) are done too
+        for batch_plus in Batch_Ret_Util.batches_plus:
+            if batch_plus['batch'].status in batch_ret_util.TERMINAL_BATCH_STATUSES and not getattr(batch_plus['batch'], 'output_file_id', None):
+                checkpoint.batch_ids.add(batch_plus['batch'].id)
+        checkpoint.save()
+        run_report.add('batches', len(ready))
+        run_report.add('answers', stats.get('total', 0))
+        run_report.add('corrupted_answers', stats.get('corrupted', 0))
+        run_report.add('mapping_rows', new_rows)
+        run_report.checkpoint('batches ingested')
+
+        if ready:
+            # The fresh verdicts are added to the cache for the next runs
+            run_report.start_stage('verdict_cache')
+            cache = verdict_cache.VerdictCache(f'{mapping_config.mapping_name}/verdict_cache.sqlite')
+            cache.backfill_from_batches(batch_folder, mapping_config)
+            cache.close()
+
+        pending = [batch_plus for batch_plus in Batch_Ret_Util.batches_plus if batch_plus['batch'].id not in checkpoint.batch_ids]
+        print(f"Ingested {len(ready)} batches ({new_rows} mapping rows, {stats.get('corrupted', 0)} corrupted contents), "
+              f"{len(checkpoint.batch_ids)} / {len(Batch_Ret_Util.batches_plus)} batches done.")
+        # Written after every poll, an interrupted --watch still leaves the report of what was ingested
+        run_report.write(run_inputs_folder)
+        if not watch or not pending:
+            break
+
+        delay = WATCH_INITIAL_DELAY if ready else min(delay * 2, WATCH_MAX_DELAY)
+        print(f"Waiting {delay}s for {len(pending)} batches...")
+        run_report.start_stage('watch_wait')
+        time.sleep(delay)
+        run_report.start_stage('retrieve_batches')
+        Batch_Ret_Util.refresh_batch_details(skip_batch_ids=checkpoint.batch_ids)
+
+    if args.profile:
+        write_profile(run_inputs_folder)
+
+
+def process_batch(df_source_1, df_source_2, mapping_config: config.MappingConfig):
+    batch_folder = f'{mapping_config.mapping_name}/batches'
+    run_report.start_stage('retrieve_batches')
+    Batch_Ret_Util = batch_ret_util.BatchRetUtil(os.path.join(os.getcwd(), batch_folder), workers=args.retrieval_workers)
+    run_report.start_stage('download_parse')
+    content_stats = {}
+    contents_count = 0
+    mapping_rows = 0
 
     # # prefix all source_1 keys with the mapping name
     # df_source_1 = df_source_1.rename(columns={col: f"{mapping_config.source_1_prefix}_{col}" for col in df_source_1.columns})
     # df_source_2 = df_source_2.rename(columns={col: f"{mapping_config.source_2_prefix}_{col}" for col in df_source_2.columns})
-     
 
+    # Rows are written as the output lines are parsed, only one answer is held in memory
     with open(f'outputs/{mapping_config.mapping_output_filename}', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = list(final_mappings[0].keys())
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
-        writer.writerows(final_mappings)
+        writer = None
+
+        def write_rows(contents):
+            nonlocal writer, mapping_rows
+            final_mappings = get_final_mappings(contents, mapping_config)
+            if not final_mappings:
+                return
+            if writer is None:
+                writer = csv.DictWriter(csvfile, fieldnames=list(final_mappings[0].keys()))
+                writer.writeheader()
+            writer.writerows(final_mappings)
+            mapping_rows += len(final_mappings)
+
+        for content in Batch_Ret_Util.iter_contents(content_stats, checkpoint=run_report.checkpoint):
+            write_rows([content])
+            contents_count += 1
+        print(f"Corrupted JSON count: {content_stats.get('corrupted', 0)} / {content_stats.get('total', 0)}")
+        run_report.add('batches', len(Batch_Ret_Util.batches_plus))
+        run_report.add('answers', content_stats.get('total', 0))
+        run_report.add('corrupted_answers', content_stats.get('corrupted', 0))
+        print(f"Loaded {contents_count} answers from {batch_folder}.")
+
+        # Verdicts served by the exact match and the verdict cache at generation time
+        run_report.start_stage('write_output')
+        local_verdicts = verdict_cache.read_local_verdicts(os.path.join(Batch_Ret_Util.latest_batch_path, 'inputs', verdict_cache.LOCAL_VERDICTS_FILENAME))
+        local_contents = verdict_cache.get_local_contents(local_verdicts)
+        write_rows(local_contents)
+        provenance_counts = ', '.join(f"{len(content['mappings'])} {content['provenance']}" for content in local_contents)
+        print(f"Merged {len(local_verdicts)} local verdicts with the batch results ({provenance_counts or 'none'}).")
+        for content in local_contents:
+            run_report.add(f"{content['provenance']}_verdicts", len(content['mappings']))
 
         # df_final_mappings = pd.DataFrame(final_mappings)
 
@@ -325,7 +778,17 @@ def process_batch(df_source_1, df_source_2, mapping_config: config.MappingConfig
         # merge_strategies = ["left"]
         # for merge_strategy in merge_strategies:
         #     merge_with_mapping_and_save_results(df_source_1, df_source_2, df_final_mappings, merge_strategy, mapping_config)
-    pass
+    run_report.add('mapping_rows', mapping_rows)
+    run_report.checkpoint('mapping output written')
+
+    # The fresh verdicts are added to the cache for the next runs
+    run_report.start_stage('verdict_cache')
+    cache = verdict_cache.VerdictCache(f'{mapping_config.mapping_name}/verdict_cache.sqlite')
+    cache.backfill_from_batches(batch_folder, mapping_config)
+    cache.close()
+    run_report.write(os.path.join(Batch_Ret_Util.latest_batch_path, 'inputs'))
+    if args.profile:
+        write_profile(os.path.join(Batch_Ret_Util.latest_batch_path, 'inputs'))
 
 def merge_direct_and_save_results(df_1, df_2, merge_strategy, mapping_config: config.MappingConfig):
     final_merged_df = pd.merge(
@@ -369,6 +832,29 @@ if __name__ == "__main__":
     parser.add_argument('-p', '--process', action='store_true', help='Process the batch files needed for the mapping.')
     parser.add_argument('-d', '--dry-run', action='store_true', help='Perform a dry run without executing the mapping.')
     parser.add_argument('--multiproc-chunksize', type=int, default=50, help='Chunk size for multiprocessing.')
+    parser.add_argument('--engine', choices=['pool', 'cdist', 'tfidf'], default='pool', help='Candidate engine: per-item matching in a process pool, tiled cdist score matrices, or matching on the character-trigram TF-IDF neighbours only (SUBSTANCE mappings, supplier runs use the pool engine).')
+    parser.add_argument('--tfidf-top-k', type=int, default=tfidf_engine.DEFAULT_TOP_K, help='TF-IDF engine: source 2 neighbours scored per source 1 item (python -m checks.check_tfidf_recall measures the recall of a value).')
+    parser.add_argument('--tfidf-block-rows', type=int, default=tfidf_engine.DEFAULT_BLOCK_ROWS, help='TF-IDF engine: source 1 rows per sparse matrix product, at most (one pool task per product, --cores processes).')
+    parser.add_argument('--tfidf-max-df', type=float, default=tfidf_engine.DEFAULT_MAX_DF, help='TF-IDF engine: trigrams found in more than this share of the source 2 names are ignored.')
+    parser.add_argument('--token-shortlist', type=int, default=None, help='Pool engine: only score source 2 items sharing a rare token (up to this many) or the first word with the source 1 item.')
+    parser.add_argument('--lsh', action='store_true', help='Pool engine: only score the source 2 items sharing a MinHash-LSH bucket (token shingles of the aggressively cleaned names) with the source 1 item.')
+    parser.add_argument('--lsh-bands', type=int, default=minhash_lsh.DEFAULT_BANDS, help='MinHash-LSH: bands of the signature (more bands, more candidates).')
+    parser.add_argument('--lsh-rows', type=int, default=minhash_lsh.DEFAULT_ROWS, help='MinHash-LSH: rows per band (more rows, fewer candidates).')
+    parser.add_argument('--lsh-shingle-size', type=int, default=minhash_lsh.DEFAULT_SHINGLE_SIZE, help='MinHash-LSH: words (or characters with --lsh-shingle-kind char) per shingle.')
+    parser.add_argument('--lsh-shingle-kind', choices=minhash_lsh.SHINGLE_KINDS, default=minhash_lsh.DEFAULT_SHINGLE_KIND, help='MinHash-LSH: word or character shingles.')
+    parser.add_argument('--lsh-max-df', type=float, default=minhash_lsh.DEFAULT_MAX_DF, help='MinHash-LSH: shingles found in more than this share of the source 2 names are left out (they would make huge buckets).')
+    parser.add_argument('--tile-memory-mb', type=int, default=256, help='Memory budget per score-matrix tile for the cdist engine.')
+    parser.add_argument('--no-exact-match', action='store_true', help='Do not accept the pairs of identical canonical keys (aggressively cleaned names, supplier core names) without LLM request.')
+    parser.add_argument('--no-form-rules', action='store_true', help='SUBSTANCE mappings: send the pairs of the same base to the LLM instead of answering them with the salt / hydrate rules.')
+    parser.add_argument('--no-verdict-cache', action='store_true', help='Send every candidate pair to the batch API, even the ones answered in previous runs.')
+    parser.add_argument('--upload-workers', type=int, default=batch_gen_util.UPLOAD_WORKERS, help='Batch files uploaded at the same time while the next ones are written.')
+    parser.add_argument('--retrieval-workers', type=int, default=batch_ret_util.RETRIEVAL_WORKERS, help='Batches retrieved and downloaded at the same time by -p.')
+    parser.add_argument('--incremental', action='store_true', help='With -p: ingest the batches completed so far and append their verdicts to the mapping output.')
+    parser.add_argument('--watch', action='store_true', help='With -p: ingest batches as they complete until all of them are done (implies --incremental).')
+    parser.add_argument('--track-memory', action='store_true', help='Record RSS and tracemalloc peaks of each stage (and of the pool workers) in the run report. Slows the run down.')
+    parser.add_argument('--profile', action='store_true', help='Profile -g / -p with cProfile, pool workers included, and write the merged stats and a top-N summary to the run folder.')
+    parser.add_argument('--profile-top', type=int, default=pool_profiler.DEFAULT_TOP, help='Number of functions of the --profile summary.')
+    parser.add_argument('--openai-backend', choices=['openai', 'local'], default=None, help='Batch API backend: OpenAI, or the offline stand-in of utils/local_openai.py (default: OPENAI_BACKEND or openai).')
 
     try:
         args = parser.parse_args()
@@ -376,9 +862,19 @@ if __name__ == "__main__":
         # Catch SystemExit to prevent script termination on --help or error in some environments
         print(f"Argparse exited with code {e.code}")
         sys.exit(e.code)
+
+    if args.openai_backend is not None:
+        os.environ[local_openai.BACKEND_ENV] = args.openai_backend
         
     mapping_config = config.get_mapping_config(args.mapping_name)
 
+    parent_profiler = None
+    worker_profile_folder = None
+    if args.profile:
+        worker_profile_folder = tempfile.mkdtemp(prefix='mapping_profile_')
+        parent_profiler = cProfile.Profile()
+        parent_profiler.enable()
+
     if args.generate:
         print(f"Starting mapping generation for: {args.mapping_name}")
         if args.dry_run:
@@ -387,13 +883,15 @@ if __name__ == "__main__":
 
         if mapping_config.mapping_type in [config.MappingType.SUPPLIER, config.MappingType.SUBSTANCE]:
 
+            run_report = run_report_util.RunReport(args.mapping_name, 'generate', track_memory=args.track_memory)
+            run_report.start_stage('load_sources')
             # check if the file exist in the inputs folder
             print(f"Loading files for mapping: {args.mapping_name} 1")
             if os.path.exists(f'inputs/{mapping_config.source_1_filename}'):
                 df_source_1 = pd.read_csv(f'inputs/{mapping_config.source_1_filename}')
             elif os.path.exists(f'outputs/{mapping_config.source_1_filename}'):
                 df_source_1 = pd.read_csv(f'outputs/{mapping_config.source_1_filename}')
-            # df_source_1[mapping_config.source_1_id_cleaned] = df_source_1[mapping_config.source_1_id].apply(str_processing.cleaning_id)
+            # df_source_1[mapping_config.source_1_id_cleaned] = str_processing.cleaning_id_series(df_source_1[mapping_config.source_1_id])
             df_source_1 = df_source_1[df_source_1[mapping_config.source_1_id_cleaned].notna() & df_source_1[mapping_config.source_1_id_cleaned] != '']
 
             print(f"Loading files for mapping: {args.mapping_name} 2")
@@ -403,7 +901,7 @@ if __name__ == "__main__":
             elif os.path.exists(f'outputs/{mapping_config.source_2_filename}'):
                 df_source_2 = pd.read_csv(f'outputs/{mapping_config.source_2_filename}')
             
-            # df_source_2[mapping_config.source_2_id_cleaned] = df_source_2[mapping_config.source_2_id].apply(str_processing.cleaning_id)
+            # df_source_2[mapping_config.source_2_id_cleaned] = str_processing.cleaning_id_series(df_source_2[mapping_config.source_2_id])
             df_source_2 = df_source_2[df_source_2[mapping_config.source_2_id_cleaned].notna() & df_source_2[mapping_config.source_2_id_cleaned] != '']
 
 
@@ -416,7 +914,11 @@ if __name__ == "__main__":
         print(f"Processing batch files for: {args.mapping_name}")
         if mapping_config.mapping_type in [config.MappingType.SUPPLIER, config.MappingType.SUBSTANCE]:
             # process_batch(df_source_1, df_source_2, mapping_config)
-            process_batch(None, None, mapping_config)
+            run_report = run_report_util.RunReport(args.mapping_name, 'process', track_memory=args.track_memory)
+            if args.incremental or args.watch:
+                process_batch_incremental(mapping_config, watch=args.watch)
+            else:
+                process_batch(None, None, mapping_config)
         elif mapping_config.mapping_type == config.MappingType.MERGE:
             print("No batch files to process for merge type.")
         pass
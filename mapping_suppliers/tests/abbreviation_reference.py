@@ -0,0 +1,66 @@
+"""
+Seeded corpus of substance names and previous implementation of fuzzy_matching.clean_product_name_aggressively_pharma
+(one regex scan per SUBSTANCE_ABBREVIATIONS key), the reference of test_abbreviation_rewriter.py and of
+checks/check_abbreviation_rewriter.py.
+"""
+import random
+import re
+
+from utils import fuzzy_matching
+
+# Words the corpus is built from: every abbreviation key (single and multi word), their replacements,
+# regular substance words and tokens that exercise the word boundaries / case folding.
+_ABBREVIATION_WORDS = [p[2:-2] for p in fuzzy_matching.SUBSTANCE_ABBREVIATIONS]
+_REPLACEMENT_WORDS = [r for r in fuzzy_matching.SUBSTANCE_ABBREVIATIONS.values() if r]
+_BASE_WORDS = [
+    'amiodarone', 'naproxen', 'docetaxel', 'pemetrexed', 'zoledronic', 'acid', 'urea', 'adenosine',
+    'ibuprofen', 'ketorolac', 'acidum', 'picrinicum', 'd4', '13c', 'xe-133', 'l-cysteine', 'for',
+    'injection', 'homoeopathic', 'preparations', 'intermediate', 'salt', 'base', 'grade', 'ph', 'eur',
+    'int', 'mono', 'di', 'tri', 'hydrate', 'naproxeno', 'sódica', 'kräuter', 'ſulfate', 'K', 'İnj',
+    'na2', 'hcl2', 'usp_', '_bp', 'sol.', 'caps,', 'nh4+', 'Ph', 'EUR', 'HCl', 'NA', 'USP',
+]
+_SEPARATORS = [' ', ' ', ' ', '  ', '-', '/', ',', ', ', '.', '(', ')', ' (', ') ', '_', ';', '+']
+
+
+def generate_names(size, seed):
+    rng = random.Random(seed)
+    vocabulary = _ABBREVIATION_WORDS * 2 + _REPLACEMENT_WORDS + _BASE_WORDS * 3
+    names = []
+    for _ in range(size):
+        word_count = rng.randint(1, 7)
+        parts = []
+        for i in range(word_count):
+            if i > 0:
+                parts.append(rng.choice(_SEPARATORS))
+            word = rng.choice(vocabulary)
+            if rng.random() < 0.2:
+                word = word.upper()
+            parts.append(word)
+        names.append(''.join(parts))
+    return names
+
+
+# --- Previous implementation (reference) ---
+_reference_abbrs = [
+    (re.compile(p, flags=re.IGNORECASE), fuzzy_matching.SUBSTANCE_ABBREVIATIONS[p])
+    for p in fuzzy_matching._sorted_abbr_keys
+]
+
+
+def reference_rewrite(name):
+    for pattern, replacement in _reference_abbrs:
+        name = pattern.sub(replacement, name)
+    return name
+
+
+def reference_clean_product_name(name):
+    if not isinstance(name, str):
+        return ""
+    name = name.lower()
+    name = name.replace('(', ' ').replace(')', ' ')
+    name = name.replace('y', 'i')
+    name = reference_rewrite(name)
+    name = fuzzy_matching._sep_regex.sub(' ', name)
+    name = fuzzy_matching._punctuation_regex.sub('', name)
+    name = fuzzy_matching._extra_whitespace_regex.sub(' ', name).strip()
+    return name
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported as the scripts do, from the mapping_suppliers folder ("from utils import ...")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
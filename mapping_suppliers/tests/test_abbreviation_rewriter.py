@@ -0,0 +1,33 @@
+"""
+Differential test of fuzzy_matching.clean_product_name_aggressively_pharma against the previous
+implementation (one regex scan per SUBSTANCE_ABBREVIATIONS key), on the seeded corpus of
+abbreviation_reference.py.
+"""
+import pytest
+
+from abbreviation_reference import generate_names, reference_clean_product_name, reference_rewrite
+from utils import fuzzy_matching
+
+
+@pytest.mark.parametrize("seed", [42, 7])
+def test_cleaning_matches_reference(seed):
+    names = generate_names(20000, seed)
+    mismatches = [
+        name for name in names
+        if fuzzy_matching.clean_product_name_aggressively_pharma(name) != reference_clean_product_name(name)
+    ]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("name", [
+    None, 12, "", "   ", "AMIODARONE HCL BP (INJ)", "dd AMIODARONE HYDROCHLORIDE USP (for injection) 50mg",
+    "Ph Eur Ph Helv", "naproxen na mono hydrate", "İnj ſulfate K", "hcl2 usp_ _bp nh4+", "a.b/c-d\x1c e f",
+])
+def test_edge_cases_match_reference(name):
+    assert fuzzy_matching.clean_product_name_aggressively_pharma(name) == reference_clean_product_name(name)
+
+
+def test_rewrite_matches_reference_on_raw_case():
+    # The rewriter is case-insensitive on its own, without the lowering of the cleaning
+    for name in generate_names(5000, 3):
+        assert fuzzy_matching.rewrite_substance_abbreviations(name) == reference_rewrite(name)
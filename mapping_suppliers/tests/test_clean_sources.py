@@ -0,0 +1,57 @@
+"""
+clean_sources.py cleans a source chunk by chunk: its output must be the one of a whole-file read.
+"""
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+import clean_sources
+
+MIXED_ROWS = 23
+
+
+def write_mixed_cep(path):
+    """cep_raw.csv with columns whose inferred type changes from one chunk of 5 rows to another."""
+    rows = []
+    for i in range(MIXED_ROWS):
+        rows.append({
+            'certificateHolder': f"Holder {i} Pharma Ltd",
+            'englishName': f"Substance {i} hydrochloride",
+            'code': f"00{i % 10}" if i < 12 else f"X{i}", # digits only in the first chunks
+            'count': i if i != 17 else None, # missing value in one chunk only
+            'flag': i % 2 == 0,
+            'note': None if i < 10 else f"note {i}", # empty in the first chunks
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with multiprocessing.Pool(processes=2) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 7, 100])
+def test_chunked_output_equals_whole_file_output(tmp_path, pool, chunksize):
+    inputs_folder = tmp_path / "inputs"
+    outputs_folder = tmp_path / "outputs"
+    inputs_folder.mkdir()
+    outputs_folder.mkdir()
+    input_filename, output_filename, clean_chunk = clean_sources.SOURCES['cep']
+    write_mixed_cep(inputs_folder / input_filename)
+
+    clean_sources.clean_source('cep', pool, chunksize, 2, str(inputs_folder), str(outputs_folder))
+
+    expected = clean_chunk(pd.read_csv(inputs_folder / input_filename)).to_csv(index=False)
+    assert (outputs_folder / output_filename).read_text() == expected
+    assert pd.read_csv(outputs_folder / output_filename, dtype=str)['code'][7] == "007"
+
+
+def test_header_only_source_writes_the_cleaned_header(tmp_path, pool):
+    input_filename, output_filename, clean_chunk = clean_sources.SOURCES['cep']
+    (tmp_path / input_filename).write_text("certificateHolder,englishName,code\n")
+
+    clean_sources.clean_source('cep', pool, 5, 2, str(tmp_path), str(tmp_path))
+
+    assert (tmp_path / output_filename).read_text() == "certificateHolder,englishName,code,certificateHolder_cleaned,englishName_cleaned\n"
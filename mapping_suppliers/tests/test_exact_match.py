@@ -0,0 +1,49 @@
+"""
+The exact pre-pass answers the pairs of identical canonical keys locally, and leaves their items out of the fuzzy engine.
+"""
+from utils import config
+from utils import exact_match
+from utils import fuzzy_matching
+
+
+def supplier_data(names):
+    return {'orig_list': names, 'cleaned_list': [fuzzy_matching.clean_supplier_name_aggressively_pharma(name) for name in names]}
+
+
+def test_supplier_core_pairs_without_site_designator_are_the_same_company():
+    mapping_config = config.get_mapping_config("supplier_public_to_qf")
+    verdicts, pairs, positions_1, positions_2 = exact_match.resolve_exact_pairs(
+        supplier_data(["ALKALOIDS CORP", "Pfizer Site B"]), supplier_data(["Alkaloids Private Limited", "PFIZER SITE B."]), mapping_config
+    )
+    assert pairs == {("ALKALOIDS CORP", "Alkaloids Private Limited"), ("Pfizer Site B", "PFIZER SITE B.")}
+    company, site = verdicts[exact_match.CORE_KEY_PROVENANCE]
+    assert (company['is_item_1_supplier_site'], company['is_item_2_supplier_site']) == (False, False)
+    assert (company['confidence_score_match_site_level'], company['confidence_score_are_part_of_same_company']) == (0.0, 1.0)
+    assert (site['is_item_1_supplier_site'], site['is_item_2_supplier_site']) == (True, True)
+    assert site['confidence_score_match_site_level'] == 1.0
+    assert positions_1 == {0, 1} and positions_2 == {0, 1}
+
+
+def test_supplier_core_pairs_of_different_sites_stay_for_the_llm():
+    mapping_config = config.get_mapping_config("supplier_public_to_qf")
+    # Same core name "alkaloids" (digits and site designators stripped), the unit numbers need the LLM
+    verdicts, pairs, positions_1, positions_2 = exact_match.resolve_exact_pairs(
+        supplier_data(["Alkaloids Ltd Unit 1", "Alkaloids Corp"]), supplier_data(["Alkaloids Unit 2"]), mapping_config
+    )
+    assert pairs == set() and verdicts == {}
+    # "Alkaloids Corp" / "Alkaloids Unit 2" is a site and a company: the item of source 2 stays in the engine
+    assert positions_1 == set() and positions_2 == set()
+
+
+def test_substance_exact_pairs_leave_both_items_out_of_the_engine():
+    mapping_config = config.get_mapping_config("substance_orange_book_to_usdmf")
+    names_1 = ["AMIODARONE HCL", "ASPIRIN"]; names_2 = ["Paracetamol", "Amiodarone hydrochloride"]
+    clean = fuzzy_matching.clean_product_name_aggressively_pharma
+    verdicts, pairs, positions_1, positions_2 = exact_match.resolve_exact_pairs(
+        {'orig_list': names_1, 'cleaned_list': [clean(name) for name in names_1]},
+        {'orig_list': names_2, 'cleaned_list': [clean(name) for name in names_2]},
+        mapping_config
+    )
+    assert pairs == {("AMIODARONE HCL", "Amiodarone hydrochloride")}
+    assert verdicts[exact_match.EXACT_PROVENANCE][0]['have_same_form'] is True
+    assert positions_1 == {0} and positions_2 == {1}
@@ -0,0 +1,32 @@
+"""
+The form rules answer the pairs of the same base locally and leave the others to the LLM.
+"""
+import pytest
+
+from utils import substance_forms
+
+
+@pytest.mark.parametrize("item_1, item_2, expected", [
+    ("AMIODARONE HCL USP", "Amiodarone hydrochloride", (True, True, False)),
+    ("Naproxeno HYDROCHLORIDE", "Naproxeno NA", (True, False, False)),
+    ("Hydrogen peroxide", "HYDROGEN PEROXIDE USP", (True, True, False)),
+])
+def test_same_base_pairs_are_resolved(item_1, item_2, expected):
+    verdict = substance_forms.SubstanceFormResolver().resolve(item_1, item_2)
+    assert (verdict['have_same_base'], verdict['have_same_form'], verdict['is_diluted']) == expected
+
+
+@pytest.mark.parametrize("item_1, item_2", [
+    # 'hydrogen' is part of the base, not a form of peroxide
+    ("Hydrogen peroxide", "Peroxide"),
+    ("Clopidogrel hydrogen sulfate", "Clopidogrel sulfate"),
+    ("Ethyl acetate", "Ethyl chloride"),
+    ("NAPROXEN SODIUM", "Naproxen base"),
+])
+def test_other_pairs_are_left_to_the_llm(item_1, item_2):
+    assert substance_forms.SubstanceFormResolver().resolve(item_1, item_2) is None
+
+
+def test_hydrogen_is_a_base_token():
+    base, forms, ambiguous = substance_forms.split_forms("hidrogen peroxide")
+    assert base == ("hidrogen", "peroxide") and forms == frozenset() and not ambiguous
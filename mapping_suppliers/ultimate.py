@@ -6,8 +6,8 @@ final_file = "outputs/final_output.csv"
 
 df_final = pd.read_csv(final_file)
 # add cleaned columns
-df_final["supplier_name" + cleaned_suffix] = df_final["supplier_name"].apply(str_processing.cleaning_id)
-df_final["qf_supplier_site_name" + cleaned_suffix] = df_final["qf_supplier_site_name"].apply(str_processing.cleaning_id)
+df_final["supplier_name" + cleaned_suffix] = str_processing.cleaning_id_series(df_final["supplier_name"])
+df_final["qf_supplier_site_name" + cleaned_suffix] = str_processing.cleaning_id_series(df_final["qf_supplier_site_name"])
 print(f"Loaded {final_file} with {df_final.shape[0]} rows")
 
 # cep_supplier_name,is_cep_supplier_name_supplier_site,ceapp_supplier_site_name,is_ceapp_supplier_site_name_supplier_site,confidence_score_match_site_level,confidence_score_are_part_of_same_company
@@ -51,8 +51,8 @@ df_mapping = pd.concat([df_eu_mapping, df_usa_mapping], ignore_index=True)
 print(f"Union of {eu_mapping} and {usa_mapping} with {df_mapping.shape[0]} rows")
 
 # clean the mapping
-df_mapping["supplier_name" + cleaned_suffix] = df_mapping["supplier_name_mapping"].apply(str_processing.cleaning_id)
-df_mapping["qf_supplier_site_name" + cleaned_suffix] = df_mapping["qf_supplier_site_name_mapping"].apply(str_processing.cleaning_id)
+df_mapping["supplier_name" + cleaned_suffix] = str_processing.cleaning_id_series(df_mapping["supplier_name_mapping"])
+df_mapping["qf_supplier_site_name" + cleaned_suffix] = str_processing.cleaning_id_series(df_mapping["qf_supplier_site_name_mapping"])
 
 # df_intermediate -> left join with df_mapping on source, supplier_name 
 print(f"Merging {final_file} with {usa_mapping} and {eu_mapping}")
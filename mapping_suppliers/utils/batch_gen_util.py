@@ -1,18 +1,49 @@
+import hashlib
+import json
+import time
 import uuid
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from utils.local_openai import get_client
 
 from dotenv import load_dotenv
 
+# Batch API limits per input file (requests per batch, file size), kept with some margin
+BATCH_MAX_LINES = 50000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_ATTEMPTS = 4
+UPLOAD_RETRY_DELAY = 2.0
+# Batches created since this many seconds before the session started are searched before re-creating one
+BATCH_LOOKUP_MARGIN = 300
+BATCH_FILE_METADATA_KEY = "batch_file"
+
+
+class BatchUploadError(RuntimeError):
+    """Some batch files could not be uploaded or their batch created, the others are in the recap."""
+
 
 class BatchGenUtil:
-    def __init__(self, main_folder, batch_size=1000, dry_run=False):
+    def __init__(self, main_folder, batch_size=1000, dry_run=False, max_lines=BATCH_MAX_LINES, max_bytes=BATCH_MAX_BYTES,
+                 client=None, upload_workers=UPLOAD_WORKERS, max_attempts=UPLOAD_MAX_ATTEMPTS, retry_delay=UPLOAD_RETRY_DELAY):
         load_dotenv()
         self.batch_size = batch_size
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
         self.main_folder = main_folder
         self.batches = []
-        self.client = OpenAI()
+        self.manifests = []
+        # Any object with the files.create / batches.create API of the OpenAI client
+        self.client = client if client is not None else get_client()
         self.dry_run = dry_run
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Completed files are uploaded in the background while the next ones are being written
+        self.uploader = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix='batch-upload')
+        self.pending_uploads = []
+        self.failed_uploads = []
+        self.session_start = time.time()
 
         self.create_batch_file()
 
@@ -20,42 +51,152 @@ class BatchGenUtil:
     def create_batch_file(self):
         self.current_file_path = f"{self.main_folder}/{uuid.uuid4()}.jsonl"
         self.current_count = 0
-        with open(self.current_file_path, 'a'):
-            os.utime(self.current_file_path, None)
+        self.current_lines = 0
+        self.current_bytes = 0
+        self.current_sha256 = hashlib.sha256()
+        # One buffered writer per file, kept open until the file is rotated
+        self.current_file = open(self.current_file_path, 'wb', buffering=WRITE_BUFFER_SIZE)
+
+    def close_batch_file(self):
+        """Flushes and closes the current file and writes its manifest next to it."""
+        if self.current_file is None:
+            return
+        self.current_file.close()
+        self.current_file = None
+        manifest = {
+            "file": os.path.basename(self.current_file_path),
+            "lines": self.current_lines,
+            "bytes": self.current_bytes,
+            "items": self.current_count,
+            "sha256": self.current_sha256.hexdigest(),
+        }
+        with open(f"{os.path.splitext(self.current_file_path)[0]}.manifest.json", 'w') as f:
+            json.dump(manifest, f, indent=4)
+        self.manifests.append(manifest)
 
     def add_to_batch(self, data, increment=1):
-        if self.current_count >= self.batch_size:
+        line = (data + "\n").encode('utf-8')
+        if len(line) > self.max_bytes:
+            raise ValueError(f"A single request line ({len(line)} bytes) is larger than the batch file limit ({self.max_bytes} bytes).")
+
+        if self.current_lines > 0 and (
+            self.current_count >= self.batch_size
+            or self.current_lines + 1 > self.max_lines
+            or self.current_bytes + len(line) > self.max_bytes
+        ):
             self.call_batch_api()
             self.create_batch_file()
 
-        with open(self.current_file_path, 'a') as f:
-            f.write(data + "\n")
-
+        self.current_file.write(line)
+        self.current_sha256.update(line)
+        self.current_lines += 1
+        self.current_bytes += len(line)
         self.current_count += increment
 
     def call_batch_api(self):
+        self.close_batch_file()
         if self.dry_run:
             return
-            
-        batch_input_file = self.client.files.create(
-            file=open(self.current_file_path, "rb"),
-            purpose="batch"
-        )
-        batch = self.client.batches.create(
-            input_file_id=batch_input_file.id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h"
-        )
-        self.batches.append({
+
+        upload = self.uploader.submit(self.upload_batch_file, self.current_file_path)
+        upload.file_path = self.current_file_path
+        self.pending_uploads.append(upload)
+
+    def with_retries(self, description, function, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return function(**kwargs)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                print(f"{description} failed (attempt {attempt} / {self.max_attempts}): {e}. Retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def find_created_batch(self, batch_file):
+        """Batch of this session created for batch_file (metadata), if a failed batches.create call did create it."""
+        for batch in self.client.batches.list(limit=100):
+            if batch.created_at < self.session_start - BATCH_LOOKUP_MARGIN:
+                break # Listed from the most recent
+            if (batch.metadata or {}).get(BATCH_FILE_METADATA_KEY) == batch_file:
+                return batch
+        return None
+
+    def create_batch(self, input_file_id, batch_file):
+        """
+        batches.create is not idempotent (a call timing out may still have created the batch): before each retry,
+        the batches are searched for the one tagged with batch_file.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self.client.batches.create(
+                    input_file_id=input_file_id,
+                    endpoint="/v1/chat/completions",
+                    completion_window="24h",
+                    metadata={BATCH_FILE_METADATA_KEY: batch_file}
+                )
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                print(f"Batch creation for {batch_file} failed (attempt {attempt} / {self.max_attempts}): {e}. Retrying in {delay:.1f}s")
+                time.sleep(delay)
+                batch = self.with_retries(f"Batch lookup for {batch_file}", self.find_created_batch, batch_file=batch_file)
+                if batch is not None:
+                    print(f"Batch {batch.id} for {batch_file} was created by the failed call")
+                    return batch
+
+    def upload_batch_file(self, file_path):
+        """Runs in the uploader threads: uploads the file (retried) then creates its batch (retried after a lookup)."""
+        def create_file():
+            with open(file_path, "rb") as f:
+                return self.client.files.create(file=f, purpose="batch")
+
+        try:
+            batch_input_file = self.with_retries(f"Upload of {os.path.basename(file_path)}", create_file)
+            batch = self.create_batch(batch_input_file.id, os.path.basename(file_path))
+        except Exception as e:
+            # Reported as soon as it happens, the session goes on with the other files
+            print(f"ERROR: no batch for {os.path.basename(file_path)}: {e}")
+            raise
+        print(f"Created batch {batch.id} for {os.path.basename(file_path)}")
+        return {
             "batch_id": batch.id,
             "batch_input_file_id": batch_input_file.id,
-            "batch_input_file_path": self.current_file_path
-        })
+            "batch_input_file_path": file_path
+        }
 
-    def conclude_session(self):
+    def conclude_session(self, recap_path=None):
+        """
+        Waits for the uploads and returns the batches, in the order the files were written. With recap_path the
+        batch recap is written there, with every batch created, before BatchUploadError is raised for the files
+        left without batch (listed under failed_files).
+        """
         if self.current_count > 0:
             self.call_batch_api()
+        else:
+            self.close_batch_file()
 
-        return self.batches
+        # Wait for the queue to drain, one upload at a time so that a failure does not hide the created batches
+        self.batches = []
+        try:
+            for upload in self.pending_uploads:
+                try:
+                    self.batches.append(upload.result())
+                except Exception as e:
+                    self.failed_uploads.append({"batch_input_file_path": upload.file_path, "error": str(e)})
+        finally:
+            self.uploader.shutdown(wait=True)
 
-        
\ No newline at end of file
+        if recap_path is not None:
+            batch_recap = {"batches": self.batches}
+            if self.failed_uploads:
+                batch_recap["failed_files"] = self.failed_uploads
+            with open(recap_path, 'w') as f:
+                json.dump(batch_recap, f, indent=4)
+        if self.failed_uploads:
+            raise BatchUploadError(
+                f"{len(self.failed_uploads)} batch files without batch ({len(self.batches)} batches created): "
+                f"{', '.join(os.path.basename(failed['batch_input_file_path']) for failed in self.failed_uploads)}"
+            )
+        return self.batches
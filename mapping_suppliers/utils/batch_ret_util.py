@@ -1,6 +1,7 @@
 import uuid
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from utils.local_openai import get_client
 import json
 
 from dotenv import load_dotenv
@@ -9,10 +10,68 @@ import datetime
 import time
 
 
+def parse_mappings_content(content: str):
+    """
+    Parses the content of a response choice. Truncated contents are cut after the last complete mapping.
+    Returns (parsed json, is_corrupted), parsed json is None when the content can't be recovered.
+    """
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        try:
+            last_brace_index = content.rfind(',{')
+            return json.loads(content[:last_brace_index] + ']}'), True
+        except json.JSONDecodeError as e:
+            print(f"Biig Parsing error: {e}")
+            return None, True
+
+
+RETRIEVAL_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Batches in these states won't change anymore (expired / cancelled batches keep the requests they completed)
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+CHECKPOINT_FILENAME = "ingestion_checkpoint.json"
+
+
+def iter_jsonl(path: str):
+    """Plain JSON Lines reader: one parsed line at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class IngestionCheckpoint:
+    """Batch IDs and custom_ids of a run already written to the mapping output (incremental -p)."""
+    def __init__(self, path: str):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+        self.batch_ids = set(data.get('batch_ids', []))
+        self.custom_ids = set(data.get('custom_ids', []))
+        self.local_verdicts = data.get('local_verdicts', False)
+
+    def save(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({
+                'batch_ids': sorted(self.batch_ids),
+                'custom_ids': sorted(self.custom_ids),
+                'local_verdicts': self.local_verdicts,
+            }, f)
+        os.replace(temporary_path, self.path)
+
+
 class BatchRetUtil:
-    def __init__(self, batches_folder: str):
+    def __init__(self, batches_folder: str, workers=RETRIEVAL_WORKERS, client=None, require_completed=True):
         load_dotenv()
-        self.client = OpenAI()
+        # Any object with the batches.retrieve / files.content API of the OpenAI client
+        self.client = client if client is not None else get_client()
+        self.workers = max(workers, 1)
+        # When False (incremental mode), batches still running don't raise
+        self.require_completed = require_completed
 
         self.batch_datas = self.get_latest_batch_datas(batches_folder)
         self.batches_plus = self.get_batch_details()
@@ -40,12 +99,13 @@ class BatchRetUtil:
     
     def get_batch_details(self):
         batches_plus = []
-        for batch_data in self.batch_datas:
-            batch = self.client.batches.retrieve(batch_data['batch_id'])
-            batches_plus.append({
-                'batch': batch,
-                'batch_input_file_path': batch_data['batch_input_file_path']
-            })
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batches = executor.map(lambda batch_data: self.client.batches.retrieve(batch_data['batch_id']), self.batch_datas)
+            for batch_data, batch in zip(self.batch_datas, batches):
+                batches_plus.append({
+                    'batch': batch,
+                    'batch_input_file_path': batch_data['batch_input_file_path']
+                })
 
         latest_batch = None
         # count the number of non completed batches
@@ -61,8 +121,16 @@ class BatchRetUtil:
                 if latest_batch is None or (batch.completed_at > latest_batch.completed_at):
                     latest_batch = batch
         
+        if non_completed_batches > 0 and not self.require_completed:
+            print(f"{len(batches_plus) - non_completed_batches} / {len(batches_plus)} batches are completed.")
+            return batches_plus
         if non_completed_batches > 0:
             raise Exception(f"There are {non_completed_batches} / {len(batches_plus)} non completed batches. Wait for them to be completed before running this script.")
+
+        if latest_batch is None:
+            # Every pair of the run was answered locally (verdict cache), no batch was sent
+            print("No batches were sent for this run.")
+            return batches_plus
         
         latest_batch_completed_at = datetime.datetime.fromtimestamp(latest_batch.completed_at, datetime.timezone.utc).astimezone()
 
@@ -72,76 +140,83 @@ class BatchRetUtil:
 
         return batches_plus
     
-    def get_contents(self):
-        contents = []
-        contents_as_json = []
+    def refresh_batch_details(self, skip_batch_ids=()):
+        """Retrieves again the batches not in skip_batch_ids and not in a terminal state."""
+        to_refresh = [
+            batch_plus for batch_plus in self.batches_plus
+            if batch_plus['batch'].id not in skip_batch_ids and batch_plus['batch'].status not in TERMINAL_BATCH_STATUSES
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batches = executor.map(lambda batch_plus: self.client.batches.retrieve(batch_plus['batch'].id), to_refresh)
+            for batch_plus, batch in zip(to_refresh, batches):
+                batch_plus['batch'] = batch
+
+    def download_output(self, batch):
+        """Streams the output file of a batch to outputs/{batch.id}.jsonl and returns its path."""
+        output_path = os.path.join(self.latest_batch_path, f"outputs/{batch.id}.jsonl")
+        temporary_path = f"{output_path}.part"
+        try:
+            with self.client.files.with_streaming_response.content(batch.output_file_id) as response:
+                with open(temporary_path, 'wb') as f:
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        except AttributeError:
+            # Clients without streaming responses
+            response = self.client.files.content(batch.output_file_id)
+            with open(temporary_path, 'wb') as f:
+                f.write(response.read())
+        os.replace(temporary_path, output_path)
+        return output_path
+
+    def iter_contents(self, stats=None, checkpoint=None):
+        """
+        Yields the parsed content of every response choice of the completed batches, in batch order.
+        Outputs are downloaded concurrently, each file is then read one line at a time.
+        stats (dict) receives the 'total' and 'corrupted' counts. checkpoint(label), when given, is called
+        after the first download and after each batch is parsed (memory tracking of the run report).
+        """
+        if stats is None:
+            stats = {}
+        completed = [batch_plus for batch_plus in self.batches_plus if batch_plus['batch'].status == "completed"]
+        current_batch_id = None
+        for batch_id, _, contents in self.iter_batch_contents(completed, stats):
+            if batch_id != current_batch_id:
+                if checkpoint is not None:
+                    checkpoint(f"iter_contents: {current_batch_id} parsed" if current_batch_id else "iter_contents: first output downloaded")
+                current_batch_id = batch_id
+            yield from contents
+        if checkpoint is not None and current_batch_id:
+            checkpoint(f"iter_contents: {current_batch_id} parsed")
+
+    def iter_batch_contents(self, batches_plus, stats):
+        """
+        Yields (batch id, custom_id, list of parsed contents) for every output line of the given batches,
+        batch after batch. The output files are downloaded concurrently.
+        """
+        stats.setdefault('total', 0)
+        stats.setdefault('corrupted', 0)
         os.makedirs(os.path.join(self.latest_batch_path, "outputs"), exist_ok=True)
-
-        corrupted_contents = []
-        total_content_count = 0
-
-        for batch_plus in self.batches_plus:
-            batch = batch_plus['batch']
-            if batch.status == "completed":
-                response_file = self.client.files.content(batch.output_file_id)
-
-                json_response =  pd.read_json(path_or_buf=response_file, lines=True)
-
-                # delete the file if it exists
-                if os.path.exists(os.path.join(self.latest_batch_path, f"outputs/{batch.id}.jsonl")):
-                    os.remove(os.path.join(self.latest_batch_path, f"outputs/{batch.id}.jsonl"))
-                with open(os.path.join(self.latest_batch_path, f"outputs/{batch.id}.jsonl"), 'a') as f:
-                    f.write(json_response.to_json(orient="records", lines=True))
-
-                for i, row in json_response.iterrows():
-                    total_content_count += len(row['response']['body'])
-                    for choice in row['response']['body']['choices']:
-                        # print(f"Choice: {choice}")
-
-                        # dump the choice to a json file
-
-
-                        # gg = choice.replace(',{"item_1":"Kukje Pharmaceutical Ind Co Ltd Seongnam-City KR","is_item_1_supplier_site":true,"item_2":"', "}]")
-                        # result = json.loads(gg)
-
-
-                        contents.append({
-                            'batch_input_file_path': batch_plus['batch_input_file_path'],
-                            'custom_id': row['custom_id'],
-                            'content': choice['message']['content']
-                        })
-
-        for item in contents:
-            content = item['content']
-            try:
-                content_json = json.loads(content)
-                contents_as_json.append(content_json)
-            except json.JSONDecodeError as e:
-                try:
-                    last_brace_index = content.rfind(',{')
-                    current_content_as_json = json.loads(content[:last_brace_index]+']}')
-                    contents_as_json.append(current_content_as_json)
-
-                    corrupted_contents.append({
-                        'batch_input_file_path': item['batch_input_file_path'],
-                        'custom_id': item['custom_id'],
-                        'parsed_content': current_content_as_json
-                    })
-                except json.JSONDecodeError as e:
-                    print(f"Biig Parsing error: {e}")
-
-        print(f"Corrupted JSON count: {len(corrupted_contents)} / {total_content_count}")
-
-
-        # for corrupted_content in corrupted_contents:
-        #     # read the jsonl file and find the request in the original batch input file
-        #     with open(corrupted_content['batch_input_file_path'], "r") as f:
-        #         for line in f:
-        #             if corrupted_content['custom_id'] in line:
-        #                 for mapping in corrupted_content['parsed_content']['mappings']:
-        #                     new_line = ''
-                        
-            
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            output_paths = executor.map(lambda batch_plus: self.download_output(batch_plus['batch']), batches_plus)
+            for batch_plus, output_path in zip(batches_plus, output_paths):
+                for row in iter_jsonl(output_path):
+                    body = (row.get('response') or {}).get('body') or {}
+                    contents = []
+                    for choice in body.get('choices', []):
+                        stats['total'] += 1
+                        content_json, is_corrupted = parse_mappings_content(choice['message']['content'])
+                        if is_corrupted:
+                            stats['corrupted'] += 1
+                        if content_json is not None:
+                            contents.append(content_json)
+                    yield batch_plus['batch'].id, row.get('custom_id'), contents
+
+    def get_contents(self, stats=None, checkpoint=None):
+        """Parsed contents of every completed batch, as a list (iter_contents keeps one output line in memory)."""
+        if stats is None:
+            stats = {}
+        contents_as_json = list(self.iter_contents(stats, checkpoint))
+        print(f"Corrupted JSON count: {stats['corrupted']} / {stats['total']}")
         return contents_as_json
                     
 
@@ -130,6 +130,16 @@ class SupplierMappings(BaseModel):
     mappings: list[SupplierMapping]
 
 
+# Completion tokens a model can produce per request
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4o-mini": 16384,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+# Share of the model output limit given to the answer of a packed request by default
+DEFAULT_OUTPUT_BUDGET_SHARE = 0.5
+
+
 class MappingType(Enum):
     SUBSTANCE = "Substance"
     SUPPLIER = "Supplier"
@@ -141,7 +151,9 @@ class MappingConfig:
         source_1_filename: str, source_1_id: str, source_1_prefix: str, source_1_separator: str,
         source_2_filename: str, source_2_id: str, source_2_prefix: str, source_2_separator: str,
         mapping_name: str, mapping_type: MappingType, fuzzy_match_threshold: float,
-        cleaned_fuzzy_match_threshold: float, request_item_size: int, batch_size: int
+        cleaned_fuzzy_match_threshold: float, request_item_size: int, batch_size: int,
+        model: str = "gpt-4o", temperature: float = 0, request_token_budget: int = None,
+        request_output_token_budget: int = None
     ):
         self.source_1_filename = source_1_filename
         self.source_1_id = source_1_id
@@ -160,15 +172,33 @@ class MappingConfig:
         self.fuzzy_match_threshold = fuzzy_match_threshold
         self.cleaned_fuzzy_match_threshold = cleaned_fuzzy_match_threshold
         self.request_item_size = request_item_size
+        # Estimated input + output tokens of the pairs of one request (system prompt excluded),
+        # requests are packed up to it. None: fixed chunks of request_item_size pairs
+        self.request_token_budget = request_token_budget
         self.batch_size = batch_size
+        self.model = model
+        # Completion tokens of one packed request: the packer keeps the estimated answer within it and it is
+        # sent as max_tokens. Defaults to a share of the output limit of the model
+        max_output_tokens = MODEL_MAX_OUTPUT_TOKENS.get(model, DEFAULT_MAX_OUTPUT_TOKENS)
+        if request_output_token_budget is None:
+            request_output_token_budget = int(max_output_tokens * DEFAULT_OUTPUT_BUDGET_SHARE)
+        if request_output_token_budget > max_output_tokens:
+            raise ValueError(f"{mapping_name}: request_output_token_budget ({request_output_token_budget}) is over the output limit of {model} ({max_output_tokens} tokens).")
+        self.request_output_token_budget = request_output_token_budget
+        self.temperature = temperature
         if mapping_type == MappingType.SUBSTANCE:
             self.system_prompt = SUBSTANCE_PROMPT
             self.response_format = SubstanceMappings
+            # Keys of the pair in a response mapping
+            self.response_item_1_key = "active_substance_1"
+            self.response_item_2_key = "active_substance_2"
             self.source_1_mapping_column = f"{source_1_prefix}_mapped_substance"
             self.source_2_mapping_column = f"{source_2_prefix}_mapped_substance"
         elif mapping_type == MappingType.SUPPLIER:
             self.system_prompt = SUPPLIER_PROMPT
             self.response_format = SupplierMappings
+            self.response_item_1_key = "item_1"
+            self.response_item_2_key = "item_2"
             self.source_1_mapping_column = f"{source_1_prefix}_mapped_supplier"
             self.source_1_is_supplier_site_column = f"{source_1_prefix}_is_supplier_site"
             self.source_2_mapping_column = f"{source_2_prefix}_mapped_supplier"
@@ -200,6 +230,7 @@ possible_mappings : list[MappingConfig] = [
         cleaned_fuzzy_match_threshold=80,
         request_item_size=100,
         batch_size=5000,
+        request_token_budget=10000,
     ),
     MappingConfig(
         source_1_filename="a57_cleaned.csv",
@@ -216,6 +247,7 @@ possible_mappings : list[MappingConfig] = [
         cleaned_fuzzy_match_threshold=80,
         request_item_size=100,
         batch_size=5000,
+        request_token_budget=10000,
     ),
     MappingConfig(
         source_1_filename="public_manufacturer_required_apis.csv",
@@ -232,6 +264,7 @@ possible_mappings : list[MappingConfig] = [
         cleaned_fuzzy_match_threshold=80,
         request_item_size=50,
         batch_size=5000,
+        request_token_budget=10000,
     ),
     MappingConfig(
         source_1_filename="public_supplier_names.csv",
@@ -248,6 +281,7 @@ possible_mappings : list[MappingConfig] = [
         cleaned_fuzzy_match_threshold=50,
         request_item_size=100,
         batch_size=5000,
+        request_token_budget=10000,
     )
 ]
 
@@ -0,0 +1,103 @@
+import re
+
+from utils import config
+
+# --- Exact / canonical-key pre-pass ---
+# SUBSTANCE pairs whose aggressively cleaned names are identical ("AMIODARONE HCL USP" / "Amiodarone hydrochloride"
+# both give "amiodarone hidrochloride" as key) are accepted without fuzzy scoring nor LLM request, with the "exact" provenance.
+# SUPPLIER pairs are joined on the core name (the supplier cleaning strips the legal suffixes and the site designators):
+# an identical core name is the "virtually identical" case of the prompt (same company). A local verdict, with the
+# "exact_core" provenance, is only written when the site flags are grounded too: neither name has a site designator, or
+# both names are the same up to case and punctuation. The other core pairs ("Alkaloids - Unit I" / "Alkaloids Unit II")
+# go through the fuzzy engine and the LLM.
+
+EXACT_PROVENANCE = "exact"
+CORE_KEY_PROVENANCE = "exact_core"
+
+# Terms that make a supplier name a site in the prompt definitions
+SITE_DESIGNATORS = ['site', 'unit', 'plant', 'plot', 'facility', 'factory', 'location']
+_site_designator_pattern = re.compile(r'\b(' + '|'.join(SITE_DESIGNATORS) + r')\b', flags=re.IGNORECASE)
+_non_word_regex = re.compile(r'[\W_]+')
+
+
+def canonical_key(cleaned_name, mapping_type: config.MappingType):
+    """Key of an aggressively cleaned name."""
+    if mapping_type == config.MappingType.SUBSTANCE:
+        # clean_product_name_aggressively_pharma turns 'y' into 'i' before expanding the abbreviations,
+        # "hcl" gives "hydrochloride" while "hydrochloride" gives "hidrochloride"
+        return cleaned_name.replace('y', 'i')
+    return cleaned_name
+
+
+def find_exact_pairs(source_1_data, source_2_data, mapping_type: config.MappingType):
+    """
+    Hash join of the two sources on the canonical key of the aggressively cleaned name (cleaned_list of the
+    source data dicts). Returns the (index_1, index_2) positions of the pairs, in source_1 order.
+    """
+    s2_positions_by_key = {}
+    for index_2, cleaned_name in enumerate(source_2_data['cleaned_list']):
+        if cleaned_name:
+            s2_positions_by_key.setdefault(canonical_key(cleaned_name, mapping_type), []).append(index_2)
+
+    exact_pairs = []
+    for index_1, cleaned_name in enumerate(source_1_data['cleaned_list']):
+        key = canonical_key(cleaned_name, mapping_type) if cleaned_name else None
+        for index_2 in s2_positions_by_key.get(key, ()):
+            exact_pairs.append((index_1, index_2))
+    return exact_pairs
+
+
+def is_site_name(name):
+    """Whether a supplier name carries a site designator ('Plant', 'Site', 'Unit'...)."""
+    return bool(_site_designator_pattern.search(name))
+
+
+def get_exact_verdict(item_1, item_2, mapping_config: config.MappingConfig):
+    """
+    (provenance, verdict) of a pair of identical canonical keys, or None when the pair needs the LLM
+    (supplier names with a site designator that differ by more than case and punctuation).
+    """
+    if mapping_config.mapping_type == config.MappingType.SUBSTANCE:
+        return EXACT_PROVENANCE, {
+            'active_substance_1': item_1,
+            'active_substance_2': item_2,
+            'have_same_base': True,
+            'have_same_form': True,
+            'is_diluted': False,
+        }
+
+    is_site_1 = is_site_name(item_1); is_site_2 = is_site_name(item_2)
+    same_name = _non_word_regex.sub(' ', item_1.lower()).strip() == _non_word_regex.sub(' ', item_2.lower()).strip()
+    if (is_site_1 or is_site_2) and not same_name:
+        return None
+    return CORE_KEY_PROVENANCE, {
+        'item_1': item_1,
+        'is_item_1_supplier_site': is_site_1,
+        'item_2': item_2,
+        'is_item_2_supplier_site': is_site_2,
+        # Same physical site only when both names are the same site
+        'confidence_score_match_site_level': 1.0 if is_site_1 and is_site_2 else 0.0,
+        'confidence_score_are_part_of_same_company': 1.0,
+    }
+
+
+def resolve_exact_pairs(source_1_data, source_2_data, mapping_config: config.MappingConfig):
+    """
+    Local verdicts of the exact pairs of the two sources. Returns ({provenance: verdicts}, resolved (item_1, item_2) pairs,
+    source_1 positions, source_2 positions): the positions are the items whose exact pairs were all resolved, to be left
+    out of the fuzzy engine (an item with an exact pair left to the LLM stays in).
+    """
+    verdicts_by_provenance = {}
+    resolved_pairs = set()
+    resolved_1, resolved_2, unresolved_1, unresolved_2 = set(), set(), set(), set()
+    for index_1, index_2 in find_exact_pairs(source_1_data, source_2_data, mapping_config.mapping_type):
+        item_1 = source_1_data['orig_list'][index_1]; item_2 = source_2_data['orig_list'][index_2]
+        exact_verdict = get_exact_verdict(item_1, item_2, mapping_config)
+        if exact_verdict is None:
+            unresolved_1.add(index_1); unresolved_2.add(index_2)
+            continue
+        provenance, verdict = exact_verdict
+        verdicts_by_provenance.setdefault(provenance, []).append(verdict)
+        resolved_pairs.add((item_1, item_2))
+        resolved_1.add(index_1); resolved_2.add(index_2)
+    return verdicts_by_provenance, resolved_pairs, resolved_1 - unresolved_1, resolved_2 - unresolved_2
@@ -12,6 +12,8 @@ _punctuation_regex = re.compile(r'[^\w\s-]')
 _digits_regex = re.compile(r'\d+')
 _extra_whitespace_regex = re.compile(r'\s+')
 _sep_regex = re.compile(r'[/-]')
+# ASCII characters removed by _punctuation_regex, deleted with bytes.translate for ASCII names
+_ascii_punctuation = bytes(c for c in range(128) if _punctuation_regex.match(chr(c)))
 
 # --- Supplier Name Cleaning ---
 SUPPLIER_NAME_SUFFIXES = [
@@ -100,11 +102,59 @@ SUBSTANCE_ABBREVIATIONS = {
 # Compile substance abbreviations regex
 # Sort keys by length descending to avoid partial replacements
 _sorted_abbr_keys = sorted(SUBSTANCE_ABBREVIATIONS.keys(), key=len, reverse=True)
-_compiled_substance_abbrs = {
-    re.compile(p, flags=re.IGNORECASE): SUBSTANCE_ABBREVIATIONS[p]
-    for p in _sorted_abbr_keys
-}
 
+# Single-pass rewriter, same output as applying every pattern of _sorted_abbr_keys one after the other:
+# - single-word keys match whole words only, can't overlap and no replacement is itself a key
+#   (except 'sulfate' -> 'sulfate'), so each word of the name is looked up once in a dictionary;
+# - multi-word keys can overlap each other ('ph eur' / 'eur ph'), they keep the sequential order but
+#   only run when their phrase is present.
+_single_word_abbr_keys = [p for p in _sorted_abbr_keys if ' ' not in p]
+_multi_word_abbr_keys = [p for p in _sorted_abbr_keys if ' ' in p]
+_single_word_abbrs = {p[2:-2]: SUBSTANCE_ABBREVIATIONS[p] for p in _single_word_abbr_keys}
+_compiled_multi_word_abbrs = [
+    (p[2:-2], re.compile(p, flags=re.IGNORECASE), SUBSTANCE_ABBREVIATIONS[p])
+    for p in _multi_word_abbr_keys
+]
+_word_regex = re.compile(r'\w+')
+# Alternating separators and words, the words at the odd positions
+_word_split_regex = re.compile(r'(\w+)')
+# A multi-word key can only match when its last word is a word of the name
+_multi_word_abbr_last_words = {phrase.split()[-1] for phrase, _, _ in _compiled_multi_word_abbrs}
+# Non-ASCII characters that re.IGNORECASE matches with an ASCII letter
+_abbr_case_folds = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u212a': 'k', '\u017f': 's'})
+
+
+def _abbr_lookup_key(word):
+    return word.translate(_abbr_case_folds).lower()
+
+
+def _replace_abbr_word(match):
+    word = match.group(0)
+    return _single_word_abbrs.get(_abbr_lookup_key(word), word)
+
+
+def rewrite_substance_abbreviations(name):
+    """Applies SUBSTANCE_ABBREVIATIONS (case-insensitive, whole words) in a single pass."""
+    folded = name.lower() if name.isascii() else _abbr_lookup_key(name)
+    folded_parts = _word_split_regex.split(folded)
+    if not _multi_word_abbr_last_words.isdisjoint(folded_parts[1::2]):
+        for phrase, pattern, replacement in _compiled_multi_word_abbrs:
+            if phrase in folded:
+                name = pattern.sub(replacement, name)
+                folded = _abbr_lookup_key(name)
+        folded_parts = _word_split_regex.split(folded)
+    if len(folded) != len(name):
+        # A case fold changed the length, words are looked up one by one
+        return _word_regex.sub(_replace_abbr_word, name)
+    # The words of the name are split once and looked up in the dictionary with their folded spelling
+    parts = folded_parts if folded == name else _word_split_regex.split(name)
+    words = parts[1::2]
+    keys = folded_parts[1::2]
+    replaced = list(map(_single_word_abbrs.get, keys, words))
+    if replaced == words:
+        return name
+    parts[1::2] = replaced
+    return ''.join(parts)
 
 
 def clean_product_name_aggressively_pharma(name):
@@ -123,18 +173,20 @@ def clean_product_name_aggressively_pharma(name):
     # if paren_pos > 3:
     #     name = _parentheses_regex.sub('', name) # Remove content within parentheses
 
-    # Apply normalization/removal rules using pre-compiled regex
-    for pattern, replacement in _compiled_substance_abbrs.items():
-        name = pattern.sub(replacement, name)
+    # Apply normalization/removal rules in a single pass
+    name = rewrite_substance_abbreviations(name)
 
     # Sep normalization
-    name = _sep_regex.sub(' ', name)
+    name = name.replace('/', ' ').replace('-', ' ')
 
     # Remove punctuation AFTER abbreviation expansion
-    name = _punctuation_regex.sub('', name)
+    if name.isascii():
+        name = name.encode('ascii').translate(None, _ascii_punctuation).decode('ascii')
+    else:
+        name = _punctuation_regex.sub('', name)
 
-    # Remove extra whitespace and strip
-    name = _extra_whitespace_regex.sub(' ', name).strip()
+    # Remove extra whitespace and strip (str.split splits on the same characters as \s)
+    name = ' '.join(name.split())
 
     # Return empty string if name is too short after cleaning, might indicate over-cleaning
     # if len(name) < 3:
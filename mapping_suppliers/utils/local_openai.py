@@ -0,0 +1,308 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from openai import OpenAI
+from openai.types import Batch, FileObject
+from rapidfuzz import fuzz
+
+# --- Offline stand-in for the OpenAI Files / Batches API ---
+# Selected with OPENAI_BACKEND=local (environment or .env) or main.py --openai-backend local.
+# Files and batches are kept under LOCAL_OPENAI_FOLDER, so a -g run and the following -p run
+# (separate processes) see the same batches. A batch completes LOCAL_OPENAI_LATENCY seconds after
+# its creation, its answers are synthesized from the response_format schema of each request:
+# the names are copied from the pairs, the verdicts depend on how similar the names are.
+#
+# Injected faults (rates between 0 and 1, drawn from LOCAL_OPENAI_SEED):
+#   LOCAL_OPENAI_API_FAILURE_RATE    files.create / batches.create raise LocalAPIError (transient, retried by the uploader)
+#   LOCAL_OPENAI_BATCH_FAILURE_RATE  a batch ends "failed", without output file
+#   LOCAL_OPENAI_FAILURE_RATE        a request of a batch gets a 500 response without choices
+#   LOCAL_OPENAI_TRUNCATION_RATE     an answer is cut (finish_reason "length"), as when the output limit is hit
+
+BACKEND_ENV = "OPENAI_BACKEND"
+DEFAULT_FOLDER = ".local_openai"
+
+
+class LocalAPIError(Exception):
+    pass
+
+
+def get_client():
+    """OpenAI client, or the local stand-in when OPENAI_BACKEND is "local"."""
+    if os.environ.get(BACKEND_ENV, "openai").lower() == "local":
+        return LocalOpenAI()
+    return OpenAI()
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class _Content:
+    """files.content response: the whole file in memory."""
+    def __init__(self, data: bytes):
+        self.content = data
+
+    def read(self):
+        return self.content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+
+class _StreamedContent:
+    """files.with_streaming_response.content response (context manager)."""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'rb')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def iter_bytes(self, chunk_size=None):
+        while True:
+            chunk = self.file.read(chunk_size or 1024 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _Files:
+    def __init__(self, backend):
+        self.backend = backend
+        self.with_streaming_response = _StreamingFiles(backend)
+
+    def create(self, file, purpose):
+        return self.backend.create_file(file, purpose)
+
+    def content(self, file_id):
+        return _Content(self.backend.read_file(file_id))
+
+
+class _StreamingFiles:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def content(self, file_id):
+        return _StreamedContent(self.backend.file_path(file_id))
+
+
+class _Batches:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create(self, input_file_id, endpoint, completion_window, metadata=None):
+        return self.backend.create_batch(input_file_id, endpoint, completion_window, metadata)
+
+    def retrieve(self, batch_id):
+        return self.backend.retrieve_batch(batch_id)
+
+    def list(self, limit=20):
+        return self.backend.list_batches()
+
+
+class LocalOpenAI:
+    def __init__(self, folder=None, latency=None, truncation_rate=None, failure_rate=None,
+                 api_failure_rate=None, batch_failure_rate=None, seed=None):
+        self.folder = folder or os.environ.get("LOCAL_OPENAI_FOLDER", DEFAULT_FOLDER)
+        self.latency = latency if latency is not None else _env_float("LOCAL_OPENAI_LATENCY", 0)
+        self.truncation_rate = truncation_rate if truncation_rate is not None else _env_float("LOCAL_OPENAI_TRUNCATION_RATE", 0)
+        self.failure_rate = failure_rate if failure_rate is not None else _env_float("LOCAL_OPENAI_FAILURE_RATE", 0)
+        self.api_failure_rate = api_failure_rate if api_failure_rate is not None else _env_float("LOCAL_OPENAI_API_FAILURE_RATE", 0)
+        self.batch_failure_rate = batch_failure_rate if batch_failure_rate is not None else _env_float("LOCAL_OPENAI_BATCH_FAILURE_RATE", 0)
+        self.seed = seed if seed is not None else int(os.environ.get("LOCAL_OPENAI_SEED", 0))
+        self.random = random.Random(self.seed)
+        # The uploader and the retrieval use several threads
+        self.lock = threading.Lock()
+        self.batch_lock = threading.Lock()
+        os.makedirs(os.path.join(self.folder, "files"), exist_ok=True)
+        os.makedirs(os.path.join(self.folder, "batches"), exist_ok=True)
+
+        self.files = _Files(self)
+        self.batches = _Batches(self)
+
+    # --- Storage ---
+
+    def file_path(self, file_id):
+        return os.path.join(self.folder, "files", file_id)
+
+    def batch_path(self, batch_id):
+        return os.path.join(self.folder, "batches", f"{batch_id}.json")
+
+    def _write(self, path, data: bytes):
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+    def _draw(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def _maybe_fail(self, operation):
+        if self._draw(self.api_failure_rate):
+            raise LocalAPIError(f"Injected failure of {operation}")
+
+    # --- Files ---
+
+    def create_file(self, file, purpose):
+        self._maybe_fail("files.create")
+        data = file.read()
+        file_id = f"file-{uuid.uuid4().hex}"
+        self._write(self.file_path(file_id), data)
+        return FileObject(
+            id=file_id, bytes=len(data), created_at=int(time.time()), filename=os.path.basename(getattr(file, 'name', file_id)),
+            object="file", purpose=purpose, status="processed"
+        )
+
+    def read_file(self, file_id):
+        with open(self.file_path(file_id), 'rb') as f:
+            return f.read()
+
+    # --- Batches ---
+
+    def create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        self._maybe_fail("batches.create")
+        if not os.path.exists(self.file_path(input_file_id)):
+            raise LocalAPIError(f"No such file: {input_file_id}")
+        batch = Batch(
+            id=f"batch_{uuid.uuid4().hex}", object="batch", endpoint=endpoint, input_file_id=input_file_id,
+            completion_window=completion_window, status="validating", created_at=int(time.time()), metadata=metadata,
+        )
+        data = batch.model_dump()
+        # Exact creation time, the completion is due latency seconds later
+        data["_created_at"] = time.time()
+        self._write(self.batch_path(batch.id), json.dumps(data).encode('utf-8'))
+        return batch
+
+    def list_batches(self):
+        """Every batch, the most recent first (as the paginated list of the API)."""
+        batches = []
+        for filename in os.listdir(os.path.join(self.folder, "batches")):
+            if filename.endswith(".json"):
+                # Stored state, listing does not run the batches
+                with open(os.path.join(self.folder, "batches", filename), 'r') as f:
+                    data = json.load(f)
+                data.pop("_created_at", None)
+                batches.append(Batch.model_validate(data))
+        return sorted(batches, key=lambda batch: batch.created_at, reverse=True)
+
+    def retrieve_batch(self, batch_id):
+        with self.batch_lock:
+            with open(self.batch_path(batch_id), 'r') as f:
+                data = json.load(f)
+            if data["status"] in ("validating", "in_progress"):
+                elapsed = time.time() - data.pop("_created_at")
+                if elapsed >= self.latency:
+                    data = self._complete_batch(data)
+                else:
+                    data["status"] = "in_progress"
+                    data["in_progress_at"] = data["in_progress_at"] or int(time.time())
+        data.pop("_created_at", None)
+        return Batch.model_validate(data)
+
+    def _complete_batch(self, data):
+        """Runs the requests of a batch (once: the result is saved) and returns its final state."""
+        now = int(time.time())
+        batch_random = random.Random(f"{self.seed}-{data['id']}")
+        if batch_random.random() < self.batch_failure_rate:
+            data.update(status="failed", failed_at=now, errors={"object": "list", "data": [{"code": "injected_failure", "message": "Injected batch failure"}]})
+        else:
+            lines = []
+            completed = failed = 0
+            for line in self.read_file(data["input_file_id"]).decode('utf-8').splitlines():
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                response = self._answer(request, batch_random)
+                if response["response"]["status_code"] == 200:
+                    completed += 1
+                else:
+                    failed += 1
+                lines.append(json.dumps(response))
+            output_file_id = f"file-{uuid.uuid4().hex}"
+            self._write(self.file_path(output_file_id), ("\n".join(lines) + "\n").encode('utf-8'))
+            data.update(
+                status="completed", output_file_id=output_file_id, in_progress_at=data["in_progress_at"] or now,
+                finalizing_at=now, completed_at=now,
+                request_counts={"total": completed + failed, "completed": completed, "failed": failed},
+            )
+        self._write(self.batch_path(data["id"]), json.dumps(data).encode('utf-8'))
+        return data
+
+    # --- Synthesized answers ---
+
+    def _answer(self, request, batch_random):
+        body = request["body"]
+        response_id = f"batch_req_{uuid.uuid4().hex}"
+        if batch_random.random() < self.failure_rate:
+            return {
+                "id": response_id, "custom_id": request["custom_id"],
+                "response": {"status_code": 500, "request_id": uuid.uuid4().hex, "body": {"error": {"message": "Injected request failure", "type": "server_error"}}},
+                "error": None,
+            }
+
+        # Compact, as the structured outputs of the API
+        content = json.dumps(synthesize_answer(request, self.seed), separators=(",", ":"))
+        finish_reason = "stop"
+        if batch_random.random() < self.truncation_rate:
+            # Cut somewhere after the first mapping, as an answer that reached the output limit
+            first_mapping_end = content.find('}') + 1
+            content = content[:batch_random.randint(first_mapping_end, max(first_mapping_end, len(content) - 2))]
+            finish_reason = "length"
+
+        return {
+            "id": response_id, "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200, "request_id": uuid.uuid4().hex,
+                "body": {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                    "usage": {
+                        "prompt_tokens": sum(len(message["content"]) for message in body["messages"]) // 4,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": (sum(len(message["content"]) for message in body["messages"]) + len(content)) // 4,
+                    },
+                },
+            },
+            "error": None,
+        }
+
+
+def synthesize_answer(request, seed=0):
+    """
+    Answer matching the response_format schema of the request: one mapping per pair, the first two string
+    properties get item_1 and item_2, booleans and floats follow the similarity of the names.
+    """
+    # Imported here: verdict_cache depends on batch_ret_util, which depends on this module
+    from utils import verdict_cache
+    parsed = verdict_cache.parse_request(request)
+    pairs = parsed[1] if parsed is not None else []
+    schema = request["body"]["response_format"]["json_schema"]["schema"]
+    mapping_schema = schema["properties"]["mappings"]["items"]
+    if "$ref" in mapping_schema:
+        mapping_schema = schema["$defs"][mapping_schema["$ref"].split("/")[-1]]
+
+    mappings = []
+    for item_1, item_2 in pairs:
+        pair_random = random.Random(f"{seed}-{item_1}-{item_2}")
+        similarity = fuzz.token_set_ratio(item_1.lower(), item_2.lower()) / 100
+        names = iter((item_1, item_2))
+        mapping = {}
+        for name, field in mapping_schema["properties"].items():
+            if field.get("type") == "string":
+                mapping[name] = next(names, "")
+            elif field.get("type") == "boolean":
+                mapping[name] = pair_random.random() < similarity ** 2
+            elif field.get("type") in ("number", "integer"):
+                mapping[name] = round(min(max(similarity + pair_random.uniform(-0.1, 0.1), 0), 1), 2)
+        mappings.append(mapping)
+    return {"mappings": mappings}
@@ -0,0 +1,159 @@
+import zlib
+
+import numpy as np
+
+# --- MinHash-LSH blocking index over cleaned source_2 names ---
+# Supplier names share generic tokens with thousands of other entries ("chongqing", "zhejiang"...), scoring
+# every pair is expensive and yields many useless candidates. Each aggressively cleaned name is reduced to
+# its set of token shingles (word n-grams), the MinHash signature of that set is cut into bands of rows and
+# every band is a bucket key: two names land in a common bucket with probability 1 - (1 - J^rows)^bands,
+# J being the Jaccard similarity of their shingle sets. process_source1_item only scores the names of the
+# buckets of the source_1 item.
+# Word shingles shared by thousands of names (cities, "pharma"...) would put all of them in one bucket:
+# shingles found in more than max_df of the names are left out before hashing, a name made of frequent
+# shingles only keeps its rarest one. Cleaned supplier names then come down to one or two distinctive words,
+# two rows per band only match names agreeing on both. On synthetic names (python -m checks.check_lsh_recall)
+# the defaults keep all the labelled positives of the exhaustive scan with blocks (names sharing a bucket
+# with an item) of mean 2 / max 13 at 20k names and 5 / 21 at 60k, against 758 / 3346 and 1397 / 6860
+# without max_df. Character shingles (shingle_kind 'char') lose 10 to 45% of the positives at any setting.
+# Hashing is deterministic (crc32 of the shingles, seeded permutation coefficients): the index built in the
+# parent process gives the same buckets for the queries of every pool worker. Its bucket arrays go to the
+# shared corpus of the pool (arrays()), workers rebuild the index on them with from_arrays.
+
+DEFAULT_BANDS = 16
+DEFAULT_ROWS = 2
+DEFAULT_SHINGLE_SIZE = 1
+DEFAULT_SHINGLE_KIND = 'word'
+DEFAULT_MAX_DF = 0.005
+DEFAULT_SEED = 0
+SHINGLE_KINDS = ('word', 'char')
+ARRAYS = ('sorted_keys', 'sorted_positions', 'frequent_hashes', 'frequent_counts')
+
+_PRIME = (1 << 31) - 1 # Mersenne prime, (a * x + b) stays under 2^63 for a, x, b < 2^31
+_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_SIGNATURE_CHUNK = 4096 # Names per vectorized signature computation
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def token_shingles(name, shingle_size=DEFAULT_SHINGLE_SIZE):
+    """Set of word n-grams of the name, the whole name when it has fewer words than shingle_size."""
+    tokens = name.lower().split() if isinstance(name, str) else []
+    if len(tokens) <= shingle_size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+
+
+def char_shingles(name, shingle_size):
+    """Set of character n-grams of the lowered name (words joined by one space), the whole name when shorter."""
+    text = ' '.join(name.lower().split()) if isinstance(name, str) else ''
+    if len(text) <= shingle_size:
+        return {text} if text else set()
+    return {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+
+
+class MinHashLSHIndex:
+    def __init__(self, names, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, shingle_size=DEFAULT_SHINGLE_SIZE,
+                 shingle_kind=DEFAULT_SHINGLE_KIND, max_df=DEFAULT_MAX_DF, seed=DEFAULT_SEED):
+        """
+        names: the cleaned source_2 names, positions in this list are the ones returned by the lookups.
+        max_df: shingles found in more than this share of the names are left out of the signatures
+        (a name made of frequent shingles only keeps its rarest one).
+        """
+        self._init_hashing(bands, rows, shingle_size, shingle_kind, seed)
+        name_hashes = [self._shingle_hashes(name) for name in names]
+        self.frequent_hashes = np.zeros(0, dtype=np.int64)
+        self.frequent_counts = np.zeros(0, dtype=np.int64)
+        if max_df is not None and name_hashes:
+            hashes, counts = np.unique(np.fromiter((value for hashes in name_hashes for value in hashes), dtype=np.int64), return_counts=True)
+            frequent = counts > max(max_df * len(names), 1)
+            self.frequent_hashes = hashes[frequent]
+            self.frequent_counts = counts[frequent]
+        positions = [position for position, hashes in enumerate(name_hashes) if hashes]
+        keys = self._band_keys(self._signatures([self._filter(name_hashes[position]) for position in positions]))
+        positions = np.asarray(positions, dtype=np.int32)
+        # One sorted key array per band, the bucket of a key is a slice found with np.searchsorted
+        order = np.argsort(keys, axis=0, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, order, axis=0).T.copy()
+        self.sorted_positions = positions[order].T.copy()
+
+    def _init_hashing(self, bands, rows, shingle_size, shingle_kind, seed):
+        if shingle_kind not in SHINGLE_KINDS:
+            raise ValueError(f"Unknown shingle kind {shingle_kind!r}, expected one of {', '.join(SHINGLE_KINDS)}")
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        self.shingle_kind = shingle_kind
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=bands * rows, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=bands * rows, dtype=np.uint64)
+
+    def params(self):
+        """Arguments rebuilding the hashing of the index, see from_arrays."""
+        return {'bands': self.bands, 'rows': self.rows, 'shingle_size': self.shingle_size, 'shingle_kind': self.shingle_kind, 'seed': self.seed}
+
+    def arrays(self):
+        """The bucket and frequent shingle arrays, e.g. to put them in shared memory (utils/shared_corpus.py)."""
+        return {part: getattr(self, part) for part in ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, params, arrays):
+        """Index on the params and arrays of an existing one, the arrays are used without copy."""
+        index = cls.__new__(cls)
+        index._init_hashing(**params)
+        for part in ARRAYS:
+            setattr(index, part, arrays[part])
+        return index
+
+    def _shingle_hashes(self, name):
+        shingles = token_shingles(name, self.shingle_size) if self.shingle_kind == 'word' else char_shingles(name, self.shingle_size)
+        return [zlib.crc32(shingle.encode('utf-8')) % _PRIME for shingle in shingles]
+
+    def _filter(self, hashes):
+        """Shingle hashes without the frequent ones, the rarest one when all of them are frequent."""
+        if not len(self.frequent_hashes):
+            return hashes
+        hashes = np.asarray(hashes, dtype=np.int64)
+        found = np.searchsorted(self.frequent_hashes, hashes)
+        found[found == len(self.frequent_hashes)] = 0
+        frequent = self.frequent_hashes[found] == hashes
+        if frequent.all():
+            return [int(hashes[np.argmin(self.frequent_counts[found])])]
+        return hashes[~frequent].tolist()
+
+    def _signatures(self, hashes):
+        """(len(hashes), bands * rows) MinHash signatures of non-empty lists of shingle hashes."""
+        signatures = np.empty((len(hashes), len(self.a)), dtype=np.uint64)
+        for start in range(0, len(hashes), _SIGNATURE_CHUNK):
+            chunk = hashes[start:start + _SIGNATURE_CHUNK]
+            flat = np.fromiter((value for name_hashes in chunk for value in name_hashes), dtype=np.uint64)
+            offsets = np.cumsum([0] + [len(name_hashes) for name_hashes in chunk[:-1]])
+            permuted = (self.a[:, None] * flat[None, :] + self.b[:, None]) % np.uint64(_PRIME)
+            signatures[start:start + len(chunk)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return signatures
+
+    def _band_keys(self, signatures):
+        """(len(signatures), bands) bucket keys, the rows of each band folded into one 64-bit value."""
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        banded = signatures.reshape(len(signatures), self.bands, self.rows)
+        with np.errstate(over='ignore'):
+            for row in range(self.rows):
+                keys = keys * _KEY_MULTIPLIER + banded[:, :, row]
+        return keys
+
+    def candidates(self, name):
+        """Sorted positions of the names sharing at least one bucket with name."""
+        hashes = self._shingle_hashes(name)
+        if not hashes:
+            return _EMPTY
+        keys = self._band_keys(self._signatures([self._filter(hashes)]))[0]
+        buckets = []
+        for band, key in enumerate(keys):
+            band_keys = self.sorted_keys[band]
+            start = np.searchsorted(band_keys, key, side='left')
+            end = np.searchsorted(band_keys, key, side='right')
+            if end > start:
+                buckets.append(self.sorted_positions[band, start:end])
+        if not buckets:
+            return _EMPTY
+        return np.unique(np.concatenate(buckets))
@@ -0,0 +1,68 @@
+import cProfile
+import glob
+import io
+import os
+import pstats
+from multiprocessing import util
+
+# --- Profiling of pool workers (--profile) ---
+# cProfile on the parent only sees it waiting for the pool. Each worker starts a profiler in the pool
+# initializer and dumps it to profile_folder/worker_<pid>.pstats when it exits (multiprocessing.util.Finalize
+# runs when the worker process ends normally: the pool must be closed and joined, not terminated).
+# merge_profiles then adds the worker files (and the parent profile) into one pstats file.
+
+WORKER_PROFILE_PATTERN = "worker_*.pstats"
+DEFAULT_TOP = 30
+
+
+def _dump_profile(profiler, path):
+    profiler.disable()
+    profiler.dump_stats(path)
+
+
+def start_worker_profiler(profile_folder):
+    """Pool initializer part: profiles the worker until it exits."""
+    profiler = cProfile.Profile()
+    # exitpriority: run with the other finalizers of the worker exit (util._exit_function)
+    util.Finalize(None, _dump_profile, args=(profiler, os.path.join(profile_folder, f"worker_{os.getpid()}.pstats")), exitpriority=10)
+    profiler.enable()
+    return profiler
+
+
+def merge_profiles(profile_folder, output_path, parent_profiler=None):
+    """Adds the worker profiles of profile_folder (and the parent profiler) into output_path. Returns the pstats.Stats or None."""
+    paths = sorted(glob.glob(os.path.join(profile_folder, WORKER_PROFILE_PATTERN)))
+    stats = None
+    for path in paths:
+        if stats is None:
+            stats = pstats.Stats(path)
+        else:
+            stats.add(path)
+    if parent_profiler is not None:
+        parent_profiler.disable()
+        if stats is None:
+            stats = pstats.Stats(parent_profiler)
+        else:
+            stats.add(parent_profiler)
+    if stats is None:
+        print("Profiling: no profile to merge (did the pool workers exit normally?).")
+        return None
+    stats.dump_stats(output_path)
+    print(f"Profiling: {len(paths)} worker profiles{' and the parent profile' if parent_profiler is not None else ''} merged into {output_path}")
+    return stats
+
+
+def write_top_summary(stats: pstats.Stats, output_path, top=DEFAULT_TOP):
+    """Top functions by own time and by cumulative time, printed and written to output_path."""
+    stream = io.StringIO()
+    stats.stream = stream
+    # Not the list of the (temporary) worker files in the header of each table
+    stats.files = []
+    for sort_key in ('tottime', 'cumulative'):
+        stream.write(f"--- Top {top} functions by {sort_key} ---\n")
+        stats.sort_stats(sort_key).print_stats(top)
+    summary = stream.getvalue()
+    with open(output_path, 'w') as f:
+        f.write(summary)
+    print(summary)
+    print(f"Profiling summary written to {output_path}")
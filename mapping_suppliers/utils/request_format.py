@@ -0,0 +1,105 @@
+import json
+
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from utils import config
+
+# --- Request layout ---
+# system message: the prompt of the mapping followed by the description of the pair rows. It is the same
+#                 for every request of a mapping, so the provider can cache it as a prefix.
+# user message:   the pairs, one numbered row per pair: "<number>\t<item_1>\t<item_2>".
+# The names are cleaned ids (cleaning_id collapses every whitespace), they never contain tabs or new lines.
+
+PAIRS_FORMAT_MARKER = "\nThe mappings are in the user message, one per line"
+
+
+def get_pairs_format_instructions(mapping_config: config.MappingConfig) -> str:
+    item_1_key, item_2_key = mapping_config.response_item_1_key, mapping_config.response_item_2_key
+    return (
+        f"{PAIRS_FORMAT_MARKER}: the mapping number, {item_1_key} and {item_2_key}, separated by tabs.\n"
+        f"Answer every mapping, in the same order, copying {item_1_key} and {item_2_key} exactly as written.\n"
+    )
+
+
+def get_system_content(mapping_config: config.MappingConfig) -> str:
+    return mapping_config.system_prompt + get_pairs_format_instructions(mapping_config)
+
+
+def encode_pairs(pairs) -> str:
+    """Numbered rows of the pairs ({"item_1", "item_2"} dicts), the content of the user message."""
+    rows = []
+    for number, pair in enumerate(pairs, start=1):
+        item_1, item_2 = str(pair['item_1']), str(pair['item_2'])
+        if any(character in item for item in (item_1, item_2) for character in '\t\n\r'):
+            raise ValueError(f"Names sent to the model can't contain tabs or new lines: {item_1!r}, {item_2!r}")
+        rows.append(f"{number}\t{item_1}\t{item_2}")
+    return '\n'.join(rows)
+
+
+def decode_pairs(content: str):
+    """Inverse of encode_pairs: list of (item_1, item_2)."""
+    pairs = []
+    for row in content.split('\n'):
+        if not row:
+            continue
+        _, item_1, item_2 = row.split('\t')
+        pairs.append((item_1, item_2))
+    return pairs
+
+
+def get_messages(mapping_config: config.MappingConfig, pairs):
+    return [
+        {"role": "system", "content": get_system_content(mapping_config)},
+        {"role": "user", "content": encode_pairs(pairs)},
+    ]
+
+
+class RequestTemplate:
+    """
+    Batch API request line of a mapping, serialized once: model, temperature, response_format schema and
+    system message are static, render only splices the custom_id and the rows of the pairs in.
+    """
+    _CUSTOM_ID_SLOT = "\x00custom_id\x00"
+    _PAIRS_SLOT = "\x00pairs\x00"
+
+    def __init__(self, mapping_config: config.MappingConfig):
+        self.system_content = get_system_content(mapping_config)
+        envelope = {
+            "custom_id": self._CUSTOM_ID_SLOT,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": mapping_config.model,
+                "temperature": mapping_config.temperature,
+                "messages": [
+                    {"role": "system", "content": self.system_content},
+                    {"role": "user", "content": self._PAIRS_SLOT},
+                ],
+                "response_format": type_to_response_format_param(mapping_config.response_format),
+            }
+        }
+        if mapping_config.request_token_budget is not None:
+            # Packed requests: the answer is budgeted against the output limit (utils/request_packer.py)
+            envelope["body"]["max_tokens"] = mapping_config.request_output_token_budget
+        self.envelope = envelope
+        serialized = json.dumps(envelope)
+        self.head, rest = serialized.split(json.dumps(self._CUSTOM_ID_SLOT))
+        self.middle, self.tail = rest.split(json.dumps(self._PAIRS_SLOT))
+
+    def render(self, custom_id: str, pairs_content: str, max_tokens: int = None) -> str:
+        """
+        Same string as json.dumps of the full request, pairs_content being encode_pairs(pairs). A max_tokens
+        other than the one of the template (a pair with a long answer, RequestPacker.request_max_tokens) is
+        serialized in full.
+        """
+        if max_tokens is not None and max_tokens != self.envelope["body"].get("max_tokens"):
+            body = dict(self.envelope["body"], max_tokens=max_tokens)
+            body["messages"] = [body["messages"][0], {"role": "user", "content": pairs_content}]
+            return json.dumps(dict(self.envelope, custom_id=custom_id, body=body))
+        return f"{self.head}{json.dumps(custom_id)}{self.middle}{json.dumps(pairs_content)}{self.tail}"
+
+
+def get_previous_layout_content(mapping_config: config.MappingConfig, pairs) -> str:
+    """Single system message of the previous layout (prompt + indented JSON of the pairs), for the dry-run comparison."""
+    pairs_json = json.dumps(list(pairs), indent=4).replace('\n', ' ')
+    return f"\n{mapping_config.system_prompt}\nHere are the mappings (in JSON format):\n{pairs_json}\n"
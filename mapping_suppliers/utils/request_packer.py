@@ -0,0 +1,145 @@
+import json
+import math
+
+from utils import config, request_format
+
+# --- Token-budget request packing ---
+# Candidates are grouped into requests by estimated size instead of a fixed number of pairs:
+# short names get more pairs per request, long names fewer, so requests are fuller and
+# the answer of a request stays far from the output limit (no truncated JSON to salvage).
+# Estimates use the usual ~4 characters per token of English text, no tokenizer needed.
+# The answer is also budgeted on its own: supplier answers are much longer than their input, the estimated
+# answer of a request stays under request_output_token_budget / OUTPUT_ESTIMATE_MARGIN, the budget being
+# the max_tokens of the request (utils/request_format.py).
+# A pair whose answer alone is over that limit is sent alone with a larger max_tokens (request_max_tokens, up to
+# the output limit of the model); a pair whose answer can't fit in the output limit of the model is not sent
+# (skipped pairs of pack, listed by main.py).
+
+CHARS_PER_TOKEN = 4
+# An answer up to this much longer than estimated still fits in max_tokens
+OUTPUT_ESTIMATE_MARGIN = 1.25
+# Pairs not sent (answer over the output limit of the model), in the inputs folder of the batch
+SKIPPED_PAIRS_FILENAME = "skipped_pairs.csv"
+# Placeholder values of the answer fields, used to measure the fixed part of an answer
+_SAMPLE_VALUES = {str: "", bool: False, float: 0.95, int: 0}
+
+
+def estimate_tokens(characters: int) -> int:
+    return math.ceil(characters / CHARS_PER_TOKEN)
+
+
+def get_answer_template_length(mapping_config: config.MappingConfig) -> int:
+    """Characters of one answer mapping of response_format, names excluded."""
+    mapping_model = mapping_config.response_format.model_fields['mappings'].annotation.__args__[0]
+    sample = {name: _SAMPLE_VALUES.get(field.annotation, "") for name, field in mapping_model.model_fields.items()}
+    # ", " between the mappings of the answer
+    return len(json.dumps(sample)) + 2
+
+
+class RequestPacker:
+    def __init__(self, mapping_config: config.MappingConfig):
+        self.token_budget = mapping_config.request_token_budget
+        self.output_token_budget = mapping_config.request_output_token_budget
+        self.output_token_limit = math.floor(self.output_token_budget / OUTPUT_ESTIMATE_MARGIN)
+        self.model_output_tokens = config.MODEL_MAX_OUTPUT_TOKENS.get(mapping_config.model, config.DEFAULT_MAX_OUTPUT_TOKENS)
+        self.answer_template_length = get_answer_template_length(mapping_config)
+
+    def estimate_pair_tokens(self, candidate: dict, row_number=1):
+        """(input tokens, expected output tokens) of one candidate pair, row_number-th pair of its request."""
+        # The pairs are sent as numbered rows "<number>\t<item_1>\t<item_2>\n" (utils/request_format.py)
+        input_length = len(str(row_number)) + len(str(candidate['item_1'])) + len(str(candidate['item_2'])) + 3
+        # The answer repeats both names next to the verdict fields
+        names_length = sum(len(json.dumps(str(value))) for value in (candidate['item_1'], candidate['item_2']))
+        return estimate_tokens(input_length), estimate_tokens(self.answer_template_length + names_length)
+
+    def request_max_tokens(self, request: list):
+        """max_tokens of a request: the output budget, or more for a pair whose answer alone is over the output limit."""
+        output_tokens = sum(self.estimate_pair_tokens(pair)[1] for pair in request)
+        if output_tokens <= self.output_token_limit:
+            return self.output_token_budget
+        return min(self.model_output_tokens, max(self.output_token_budget, math.ceil(output_tokens * OUTPUT_ESTIMATE_MARGIN)))
+
+    def pack(self, candidates: list):
+        """
+        Splits the candidates (in order) into requests whose estimated input plus output tokens stay within
+        the budget and whose estimated output stays within the output limit. A pair over either on its own
+        gets its own request (see request_max_tokens), a pair whose answer can't fit in the output limit of
+        the model is skipped. Returns (list of requests, list of skipped pairs, stats).
+        """
+        requests = []
+        skipped_pairs = []
+        stats = {'pairs': len(candidates), 'input_tokens': 0, 'output_tokens': 0, 'oversized_pairs': 0, 'max_output_tokens': 0,
+                 'output_bound_requests': 0, 'output_token_budget': self.output_token_budget, 'raised_max_tokens_requests': 0,
+                 'skipped_pairs': 0}
+        current = []
+        current_tokens = 0
+        current_output_tokens = 0
+
+        def close_request():
+            requests.append(current)
+            stats['max_output_tokens'] = max(stats['max_output_tokens'], current_output_tokens)
+            if current_output_tokens > self.output_token_limit:
+                stats['raised_max_tokens_requests'] += 1
+
+        for candidate in candidates:
+            if self.estimate_pair_tokens(candidate)[1] * OUTPUT_ESTIMATE_MARGIN > self.model_output_tokens:
+                skipped_pairs.append(candidate)
+                stats['skipped_pairs'] += 1
+                continue
+            input_tokens, output_tokens = self.estimate_pair_tokens(candidate, len(current) + 1)
+            over_output = current_output_tokens + output_tokens > self.output_token_limit
+            if current and (current_tokens + input_tokens + output_tokens > self.token_budget or over_output):
+                if over_output and current_tokens + input_tokens + output_tokens <= self.token_budget:
+                    stats['output_bound_requests'] += 1
+                close_request()
+                current = []
+                current_tokens = 0
+                current_output_tokens = 0
+                input_tokens, output_tokens = self.estimate_pair_tokens(candidate)
+            pair_tokens = input_tokens + output_tokens
+            if pair_tokens > self.token_budget or output_tokens > self.output_token_limit:
+                stats['oversized_pairs'] += 1
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            current.append(candidate)
+            current_tokens += pair_tokens
+            current_output_tokens += output_tokens
+        if current:
+            close_request()
+
+        stats['requests'] = len(requests)
+        return requests, skipped_pairs, stats
+
+
+def print_packing_report(stats: dict, token_budget: int, request_item_size: int):
+    """Packing efficiency: budget fill rate and requests saved against fixed request_item_size chunks."""
+    if stats['skipped_pairs']:
+        print(f"WARNING: {stats['skipped_pairs']} pairs have an answer over the output limit of the model on their own and were not sent.")
+    if stats['requests'] == 0:
+        print("Request packing: no pairs to send.")
+        return
+    used_tokens = stats['input_tokens'] + stats['output_tokens']
+    fixed_requests = math.ceil(stats['pairs'] / request_item_size)
+    print(
+        f"Request packing: {stats['pairs']} pairs in {stats['requests']} requests "
+        f"({stats['pairs'] / stats['requests']:.1f} pairs / request, {fixed_requests} with {request_item_size} pairs / request), "
+        f"budget fill {used_tokens / (stats['requests'] * token_budget) * 100:.1f}% of {token_budget} tokens, "
+        f"estimated {stats['input_tokens']} input + {stats['output_tokens']} output tokens, "
+        f"largest answer ~{stats['max_output_tokens']} tokens (max_tokens {stats['output_token_budget']}, "
+        f"{stats['output_bound_requests']} requests closed by the output limit)."
+    )
+    if stats['oversized_pairs']:
+        print(f"Request packing: {stats['oversized_pairs']} pairs exceed the budget on their own and were sent alone "
+              f"({stats['raised_max_tokens_requests']} with a larger max_tokens for their answer).")
+
+
+def print_layout_report(stats: dict, system_content: str):
+    """Dry run: input tokens per pair of the previous single-message layout and of the current one."""
+    if stats['pairs'] == 0:
+        return
+    pairs = stats['pairs']
+    print(
+        f"Request layout: input tokens per pair {estimate_tokens(stats['previous_chars']) / pairs:.1f} before, "
+        f"{estimate_tokens(stats['system_chars'] + stats['user_chars']) / pairs:.1f} now "
+        f"({estimate_tokens(stats['user_chars']) / pairs:.1f} once the static prefix of ~{estimate_tokens(len(system_content))} tokens is cached)."
+    )
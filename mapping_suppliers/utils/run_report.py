@@ -0,0 +1,227 @@
+import datetime
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# --- Run instrumentation ---
+# RunReport records the duration of each stage of a main.py run and a few throughput counters,
+# it is written as JSON next to batch_recap.json (inputs/run_report.json of the run folder):
+# one section per command ("generate", "process"), so -g and -p of the same run share the file.
+
+RUN_REPORT_FILENAME = "run_report.json"
+# Key of the memory sample a pool worker adds to the stats of its results (--track-memory)
+WORKER_MEMORY_KEY = "worker_memory"
+
+
+def format_duration(seconds):
+    return time.strftime("%H:%M:%S", time.gmtime(max(0, min(seconds, 86400 * 99))))
+
+
+# --- Memory (--track-memory) ---
+# RSS comes from /proc/self/status on Linux. Its high-water mark (VmHWM) is reset at each stage start
+# (write "5" to /proc/self/clear_refs), so the peak of a stage is its own. Elsewhere the peak is the
+# one of the whole process so far (getrusage). tracemalloc peaks (Python and numpy allocations) are
+# reset at each stage start too.
+
+def _read_proc_status_kb(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_bytes():
+    rss_kb = _read_proc_status_kb('VmRSS')
+    return rss_kb * 1024 if rss_kb is not None else None
+
+
+def peak_rss_bytes():
+    hwm_kb = _read_proc_status_kb('VmHWM')
+    if hwm_kb is not None:
+        return hwm_kb * 1024
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+
+def reset_peak_rss():
+    """Resets the RSS high-water mark of the process, returns False when the platform does not allow it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _mb(value):
+    return round(value / 1024 ** 2, 1) if value is not None else None
+
+
+def memory_sample():
+    """RSS and tracemalloc figures of the current process, in MB."""
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    return {
+        'rss_mb': _mb(current_rss_bytes()),
+        'peak_rss_mb': _mb(peak_rss_bytes()),
+        'traced_mb': _mb(traced),
+        'traced_peak_mb': _mb(traced_peak),
+    }
+
+
+def start_memory_tracking():
+    """Starts tracemalloc and resets the peaks of the current process (run report, pool workers)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return reset_peak_rss()
+
+
+class ProgressMeter:
+    """Prints done / total, rate and ETA of a loop at most every interval seconds (and at the end)."""
+    def __init__(self, total, label, interval=5.0):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.start_time = time.time()
+        self.last_print = None
+
+    def update(self, count=1):
+        self.done += count
+        now = time.time()
+        if self.last_print is None or now - self.last_print >= self.interval or self.done >= self.total:
+            self.last_print = now
+            elapsed = now - self.start_time
+            rate = self.done / elapsed if elapsed > 0 else 0
+            eta = format_duration((self.total - self.done) / rate) if rate > 0 and self.done < self.total else "N/A"
+            print(f"{self.label}: {self.done}/{self.total} ({self.done / max(self.total, 1) * 100:.1f}%) | Rate: {rate:.2f} items/sec | ETA: {eta}")
+
+
+class RunReport:
+    def __init__(self, mapping_name, command, track_memory=False):
+        self.mapping_name = mapping_name
+        self.command = command
+        self.started_at = datetime.datetime.now()
+        self.start_time = time.time()
+        self.stages = []
+        self.counters = {}
+        self.current_stage = None
+        self.track_memory = track_memory
+        self.memory_checkpoints = []
+        self.worker_memory = []
+        self.stage_peak_rss = False
+        if track_memory:
+            self.stage_peak_rss = start_memory_tracking()
+
+    def start_stage(self, name):
+        """Starts a stage, the current one (if any) ends here."""
+        self.end_stage()
+        if self.track_memory:
+            start_memory_tracking()
+        self.current_stage = (name, time.time())
+
+    def end_stage(self):
+        if self.current_stage is None:
+            return
+        name, start_time = self.current_stage
+        self.current_stage = None
+        seconds = time.time() - start_time
+        stage = {'name': name, 'seconds': round(seconds, 3)}
+        memory_text = ''
+        if self.track_memory:
+            stage['memory'] = memory_sample()
+            memory_text = f" | RSS {stage['memory']['rss_mb']} MB, peak {stage['memory']['peak_rss_mb']} MB, traced peak {stage['memory']['traced_peak_mb']} MB"
+        self.stages.append(stage)
+        print(f"[{name}] {seconds:.2f}s{memory_text}")
+
+    def checkpoint(self, label):
+        """Memory sample inside the current stage (peaks since the stage start), no-op without --track-memory."""
+        if not self.track_memory:
+            return
+        sample = {'label': label, 'stage': self.current_stage[0] if self.current_stage else None, **memory_sample()}
+        self.memory_checkpoints.append(sample)
+
+    def add_worker_memory(self, worker_samples):
+        """Last memory sample of each pool worker of the current stage, by pid."""
+        stage = self.current_stage[0] if self.current_stage else None
+        for pid, sample in sorted(worker_samples.items()):
+            self.worker_memory.append({'stage': stage, 'pid': pid, **sample})
+        if worker_samples:
+            print(f"Pool workers: {len(worker_samples)}, largest peak RSS {max(sample['peak_rss_mb'] or 0 for sample in worker_samples.values())} MB, "
+                  f"largest traced peak {max(sample['traced_peak_mb'] or 0 for sample in worker_samples.values())} MB")
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block as one stage of the run."""
+        self.start_stage(name)
+        try:
+            yield
+        finally:
+            self.end_stage()
+
+    def add(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def add_all(self, counters):
+        for counter, value in counters.items():
+            self.add(counter, value)
+
+    def to_dict(self):
+        total_seconds = time.time() - self.start_time
+        report = {
+            'mapping_name': self.mapping_name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_seconds': round(total_seconds, 3),
+            'stages': self.stages,
+            'counters': self.counters,
+            'throughput': {
+                f"{counter}_per_second": round(value / total_seconds, 1)
+                for counter, value in self.counters.items() if total_seconds > 0 and isinstance(value, (int, float))
+            },
+        }
+        if self.track_memory:
+            report['memory'] = {
+                'peak_rss_scope': 'stage' if self.stage_peak_rss else 'process',
+                'checkpoints': self.memory_checkpoints,
+                'workers': self.worker_memory,
+            }
+        return report
+
+    def write(self, run_inputs_folder):
+        """Adds (or replaces) the section of this command in the run report of the run folder."""
+        self.end_stage()
+        path = os.path.join(run_inputs_folder, RUN_REPORT_FILENAME)
+        report = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                report = json.load(f)
+        report[self.command] = self.to_dict()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=4)
+        self.print_summary()
+        print(f"Run report written to {path}")
+
+    def print_summary(self):
+        total_seconds = time.time() - self.start_time
+        print(f"--- {self.command} stages ({total_seconds:.2f}s in total) ---")
+        for stage in self.stages:
+            memory_text = ''
+            if 'memory' in stage:
+                memory_text = f" | peak RSS {stage['memory']['peak_rss_mb']:>9} MB, traced peak {stage['memory']['traced_peak_mb']:>9} MB"
+            print(f"{stage['name']:<24} {stage['seconds']:>10.2f}s {stage['seconds'] / total_seconds * 100 if total_seconds > 0 else 0:5.1f}%{memory_text}")
+        for counter, value in self.counters.items():
+            print(f"{counter:<24} {value:>10}")
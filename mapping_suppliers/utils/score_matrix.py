@@ -0,0 +1,116 @@
+import numpy as np
+import rapidfuzz.process as process
+
+# --- Tiled all-pairs candidate engine ---
+# Computes the same candidate set as main.process_source1_item (cleaned match + original post-filter,
+# with the first-word fallback) but scores whole blocks of pairs at once with rapidfuzz.process.cdist.
+
+# Rough number of bytes held per (source_1, source_2) cell of a tile:
+# one float64 score matrix plus a handful of boolean masks.
+_BYTES_PER_CELL = 8 + 4
+
+
+def _first_token_ids(names, vocabulary):
+    """Maps the lowered first token of each name to an integer id (-1 when the name is empty)."""
+    ids = np.full(len(names), -1, dtype=np.int64)
+    for i, name in enumerate(names):
+        tokens = name.split()
+        if tokens:
+            ids[i] = vocabulary.setdefault(tokens[0].lower(), len(vocabulary))
+    return ids
+
+
+def get_tile_shape(source_1_length, source_2_length, tile_memory_mb):
+    """Returns (rows, cols) so that one tile stays within the tile_memory_mb budget."""
+    tile_cells = max(1, int(tile_memory_mb * 1024 * 1024) // _BYTES_PER_CELL)
+    tile_cols = max(1, min(source_2_length, tile_cells))
+    tile_rows = max(1, min(source_1_length, tile_cells // tile_cols))
+    return tile_rows, tile_cols
+
+
+def _score_mask(queries, choices, scorer, threshold, workers):
+    scores = process.cdist(queries, choices, scorer=scorer, score_cutoff=threshold, dtype=np.float64, workers=workers)
+    return scores >= threshold
+
+
+def _orig_postfilter(pending, s1_orig_lower, s2_orig_lower, rows, cols, scorers_orig, threshold_orig, workers):
+    """Applies the original-name scorers to the pending pairs of a tile, shrinking the block after each scorer."""
+    passed = np.zeros_like(pending)
+    for scorer in scorers_orig:
+        remaining = pending & ~passed
+        sub_rows = np.flatnonzero(remaining.any(axis=1))
+        sub_cols = np.flatnonzero(remaining.any(axis=0))
+        if len(sub_rows) == 0:
+            break
+        block = _score_mask(
+            [s1_orig_lower[rows[r]] for r in sub_rows],
+            [s2_orig_lower[cols[c]] for c in sub_cols],
+            scorer, threshold_orig, workers
+        )
+        passed[np.ix_(sub_rows, sub_cols)] |= block
+    return passed & pending
+
+
+def generate_candidates(source_1_data, source_2_data, threshold_orig, threshold_cleaned, filter_intermediate,
+                        scorers_cleaned, scorers_orig, tile_memory_mb=256, workers=-1):
+    """
+    Generates the candidate mappings of the "Combined" approach for all source_1 x source_2 pairs.
+    source_1_data / source_2_data are dicts with 'orig_list', 'cleaned_list' and 'has_intermediate_list'.
+    A pair is kept when it passes a cleaned scorer and an original scorer, or when it fails every cleaned
+    scorer but both cleaned names share their first word.
+    Returns the candidates as a list of {"item_1", "item_2"} dicts.
+    """
+    s1_orig = source_1_data['orig_list']
+    s1_cleaned = source_1_data['cleaned_list']
+    s2_orig = source_2_data['orig_list']
+    s2_cleaned = source_2_data['cleaned_list']
+
+    # Only source_1 / source_2 items with a cleaned name take part in the matching
+    s1_rows = np.array([i for i, name in enumerate(s1_cleaned) if name], dtype=np.int64)
+    s2_cols = np.array([j for j, name in enumerate(s2_cleaned) if name], dtype=np.int64)
+    if len(s1_rows) == 0 or len(s2_cols) == 0:
+        return []
+
+    s1_orig_lower = [name.lower() for name in s1_orig]
+    s2_orig_lower = [name.lower() for name in s2_orig]
+    s1_has_intermediate = np.asarray(source_1_data['has_intermediate_list'], dtype=bool)
+    s2_has_intermediate = np.asarray(source_2_data['has_intermediate_list'], dtype=bool)
+
+    vocabulary = {}
+    s1_first_token = _first_token_ids(s1_cleaned, vocabulary)
+    s2_first_token = _first_token_ids(s2_cleaned, vocabulary)
+
+    tile_rows, tile_cols = get_tile_shape(len(s1_rows), len(s2_cols), tile_memory_mb)
+
+    candidates = []
+    for row_start in range(0, len(s1_rows), tile_rows):
+        rows = s1_rows[row_start:row_start + tile_rows]
+        queries = [s1_cleaned[i] for i in rows]
+
+        for col_start in range(0, len(s2_cols), tile_cols):
+            cols = s2_cols[col_start:col_start + tile_cols]
+            choices = [s2_cleaned[j] for j in cols]
+
+            if filter_intermediate:
+                valid = s1_has_intermediate[rows][:, None] == s2_has_intermediate[cols][None, :]
+            else:
+                valid = np.ones((len(rows), len(cols)), dtype=bool)
+
+            # Step 1: any cleaned scorer reaches the CLEANED threshold
+            cleaned_passed = np.zeros_like(valid)
+            for scorer in scorers_cleaned:
+                cleaned_passed |= _score_mask(queries, choices, scorer, threshold_cleaned, workers)
+            cleaned_passed &= valid
+
+            # Step 2: post-filter with the ORIGINAL names and ORIGINAL threshold
+            orig_passed = _orig_postfilter(cleaned_passed, s1_orig_lower, s2_orig_lower, rows, cols, scorers_orig, threshold_orig, workers)
+
+            # Fallback: no cleaned scorer passed but the first words are the same (names without a word,
+            # id -1, never share one)
+            first_token_equal = (s1_first_token[rows][:, None] == s2_first_token[cols][None, :]) & (s1_first_token[rows][:, None] >= 0)
+            accepted = orig_passed | (valid & ~cleaned_passed & first_token_equal)
+
+            for r, c in zip(*np.nonzero(accepted)):
+                candidates.append({"item_1": s1_orig[rows[r]], "item_2": s2_orig[cols[c]]})
+
+    return candidates
@@ -0,0 +1,117 @@
+import numpy as np
+import rapidfuzz.fuzz as fuzz
+import rapidfuzz.process as process
+
+# --- Cutoff-aware scoring cascade ---
+# A pair passes when ANY scorer reaches the threshold, so scorers run from the cheapest to the most
+# expensive, each with score_cutoff=threshold, and the cascade stops at the first one that passes.
+# ratio and token_sort_ratio are Indel based: their score can't exceed 2 * min(len) / (len_1 + len_2) * 100,
+# which lets us skip pairs whose lengths are too far apart without calling the scorer at all.
+
+_SCORER_COST = {
+    fuzz.ratio: 0,
+    fuzz.token_sort_ratio: 1,
+    fuzz.token_set_ratio: 2,
+    fuzz.partial_ratio: 3,
+}
+_LENGTH_BOUNDED_SCORERS = {fuzz.ratio, fuzz.token_sort_ratio}
+# Keeps the bound on the safe side of floating point rounding
+_BOUND_EPSILON = 1e-9
+
+
+def token_length(name):
+    """Length of the name once its tokens are joined by single spaces (what token_sort_ratio compares)."""
+    tokens = name.split()
+    return sum(len(token) for token in tokens) + max(len(tokens) - 1, 0)
+
+
+def length_upper_bound(length_1, length_2):
+    """Upper bound of an Indel normalized similarity for two strings of the given lengths."""
+    total = length_1 + length_2
+    if total == 0:
+        return 100.0
+    return 200.0 * min(length_1, length_2) / total
+
+
+def length_upper_bounds(length_1, lengths_2):
+    """Vectorized length_upper_bound of one length against an array of lengths (all > 0)."""
+    return 200.0 * np.minimum(length_1, lengths_2) / (length_1 + lengths_2)
+
+
+class ScoringCascade:
+    def __init__(self, scorers, threshold):
+        self.scorers = sorted(scorers, key=lambda scorer: _SCORER_COST.get(scorer, len(_SCORER_COST)))
+        self.threshold = threshold
+        self.calls_made = 0
+        self.calls_avoided = 0
+
+    def _length(self, scorer, name):
+        return token_length(name) if scorer is fuzz.token_sort_ratio else len(name)
+
+    def passes(self, name_1, name_2):
+        """Same result as any(scorer(name_1, name_2) >= threshold for scorer in scorers)."""
+        calls = 0
+        passed = False
+        for scorer in self.scorers:
+            if scorer in _LENGTH_BOUNDED_SCORERS:
+                bound = length_upper_bound(self._length(scorer, name_1), self._length(scorer, name_2))
+                if bound < self.threshold - _BOUND_EPSILON:
+                    continue
+            calls += 1
+            if scorer(name_1, name_2, score_cutoff=self.threshold) >= self.threshold:
+                passed = True
+                break
+
+        self.calls_made += calls
+        self.calls_avoided += len(self.scorers) - calls
+        return passed
+
+    def _scores(self, query, choices, scorer):
+        return process.cdist([query], choices, scorer=scorer, score_cutoff=self.threshold, dtype=np.float64)[0]
+
+    def extract_passing(self, query, choices, choice_token_lengths=None):
+        """
+        Positions of the non-empty choices for which any scorer reaches the threshold.
+        Each scorer only sees the choices not accepted by a cheaper one and within its length bound.
+        choice_token_lengths (token_length of each choice) can be precomputed once per run.
+        """
+        if choice_token_lengths is None:
+            choice_token_lengths = np.fromiter((token_length(choice) for choice in choices), dtype=np.int64, count=len(choices))
+        else:
+            choice_token_lengths = np.asarray(choice_token_lengths, dtype=np.int64)
+
+        remaining = np.flatnonzero(choice_token_lengths > 0)
+        exhaustive_calls = len(remaining) * len(self.scorers)
+        query_length = token_length(query)
+        calls = 0
+        passed = set()
+        for scorer in self.scorers:
+            if len(remaining) == 0:
+                break
+            to_score = remaining
+            if scorer is fuzz.token_sort_ratio and query_length > 0:
+                bounds = length_upper_bounds(query_length, choice_token_lengths[remaining])
+                to_score = remaining[bounds >= self.threshold - _BOUND_EPSILON]
+            if len(to_score) == 0:
+                continue
+
+            if len(to_score) * 2 > len(choices):
+                # Cheaper to score the whole list than to copy most of it
+                scores = self._scores(query, choices, scorer)
+                calls += len(choices)
+                newly_passed = to_score[scores[to_score] >= self.threshold]
+            else:
+                scores = self._scores(query, [choices[i] for i in to_score], scorer)
+                calls += len(to_score)
+                newly_passed = to_score[scores >= self.threshold]
+            if len(newly_passed):
+                passed.update(newly_passed.tolist())
+                remaining = remaining[~np.isin(remaining, newly_passed)]
+
+        self.calls_made += calls
+        self.calls_avoided += max(exhaustive_calls - calls, 0)
+        return passed
+
+    def add_stats(self, stats):
+        stats['scorer_calls_made'] = stats.get('scorer_calls_made', 0) + self.calls_made
+        stats['scorer_calls_avoided'] = stats.get('scorer_calls_avoided', 0) + self.calls_avoided
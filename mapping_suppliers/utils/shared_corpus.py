@@ -0,0 +1,196 @@
+import contextlib
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# --- Shared corpus for multiprocessing pools ---
+# String columns are stored as one UTF-8 buffer plus an int64 offsets array, flag columns as uint8 arrays,
+# array columns (token lengths, index arrays) as they are. Everything lives in a single shared-memory block that workers attach to once
+# (pool initializer), so tasks only need to carry integer positions.
+# Workers read string columns through SharedStrings, which decodes a string when it is accessed: a worker
+# scoring shortlists (token shortlist, LSH buckets) holds no copy of source_2, and the exhaustive scan decodes
+# source_2 one tile at a time (tiles), so a worker never holds more than TILE_SIZE strings of a column.
+
+_ALIGNMENT = 8
+# Strings decoded at once by tiles
+TILE_SIZE = 8192
+
+
+def _aligned(size):
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+_register_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _untracked_shared_memory():
+    """
+    Before 3.13, SharedMemory(name=...) registers the block with the resource tracker, which unlinks it (with a
+    leak warning) once a worker exits. The tracker process is shared with the parent and keeps one entry per name,
+    unregistering after the attach would drop the parent's entry too: the shared_memory registration is skipped
+    while the block is opened, resource_tracker.register is restored on exit (the lock keeps concurrent attaches
+    from restoring each other's patch).
+    """
+    with _register_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None if rtype == "shared_memory" else register(name, rtype)
+        try:
+            yield
+        finally:
+            resource_tracker.register = register
+
+
+class SharedCorpus:
+    def __init__(self, shm, layout, owner=False):
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+        self._views = []
+
+    @classmethod
+    def create(cls, string_columns: dict, flag_columns: dict = None, array_columns: dict = None):
+        """
+        Builds the shared block from {column: list of str}, {column: list of bool} and {column: numpy array}.
+        The layout (column -> offsets in the block) is small and is what gets sent to the workers.
+        """
+        flag_columns = flag_columns or {}
+        array_columns = {column: np.ascontiguousarray(values) for column, values in (array_columns or {}).items()}
+        encoded = {}
+        layout = {}
+        size = 0
+        for column, values in string_columns.items():
+            parts = [value.encode('utf-8') for value in values]
+            offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(part) for part in parts])
+            encoded[column] = (offsets, b''.join(parts))
+            layout[column] = {
+                'kind': 'strings',
+                'count': len(parts),
+                'offsets_start': size,
+                'data_start': size + _aligned(offsets.nbytes),
+                'data_size': int(offsets[-1]),
+            }
+            size += _aligned(offsets.nbytes) + _aligned(int(offsets[-1]))
+        for column, values in flag_columns.items():
+            layout[column] = {'kind': 'flags', 'count': len(values), 'start': size}
+            size += _aligned(len(values))
+        for column, values in array_columns.items():
+            layout[column] = {'kind': 'array', 'dtype': values.dtype.str, 'shape': values.shape, 'start': size}
+            size += _aligned(values.nbytes)
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        corpus = cls(shm, layout, owner=True)
+        for column, (offsets, data) in encoded.items():
+            spec = layout[column]
+            corpus._offsets(column)[:] = offsets
+            shm.buf[spec['data_start']:spec['data_start'] + spec['data_size']] = data
+        for column, values in flag_columns.items():
+            corpus.flags(column)[:] = np.asarray(values, dtype=bool)
+        for column, values in array_columns.items():
+            corpus.array(column)[...] = values
+        return corpus
+
+    @classmethod
+    def attach(cls, name, layout):
+        """Attaches to an existing block from a worker process."""
+        # The parent owns the block, workers must not unlink it on exit
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            with _untracked_shared_memory():
+                shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, layout)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __len__(self):
+        return max((spec['count'] for spec in self.layout.values()), default=0)
+
+    def _offsets(self, column):
+        spec = self.layout[column]
+        return np.ndarray((spec['count'] + 1,), dtype=np.int64, buffer=self.shm.buf, offset=spec['offsets_start'])
+
+    def string(self, column, i):
+        """Decodes a single string without materializing the whole column."""
+        spec = self.layout[column]
+        offsets = self._offsets(column)
+        start, end = spec['data_start'] + int(offsets[i]), spec['data_start'] + int(offsets[i + 1])
+        return bytes(self.shm.buf[start:end]).decode('utf-8')
+
+    def lazy_strings(self, column):
+        """Sequence view of a string column, decoding on access."""
+        return SharedStrings(self, column)
+
+    def flags(self, column):
+        """Returns a zero-copy boolean view on a flag column."""
+        spec = self.layout[column]
+        return np.ndarray((spec['count'],), dtype=bool, buffer=self.shm.buf, offset=spec['start'])
+
+    def array(self, column):
+        """Returns a zero-copy view on an array column."""
+        spec = self.layout[column]
+        return np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=self.shm.buf, offset=spec['start'])
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SharedStrings:
+    """Read-only sequence over a string column of a SharedCorpus, strings are decoded when accessed."""
+    def __init__(self, corpus: SharedCorpus, column):
+        self.corpus = corpus
+        self.column = column
+        spec = corpus.layout[column]
+        self.count = spec['count']
+        # Plain memoryviews: indexing them is much cheaper than a numpy view per access
+        self._offsets = corpus.shm.buf[spec['offsets_start']:spec['offsets_start'] + (self.count + 1) * 8].cast('q')
+        self._data = corpus.shm.buf[spec['data_start']:spec['data_start'] + spec['data_size']]
+        corpus._views.extend((self._offsets, self._data))
+        self._offsets_array = corpus._offsets(column)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return str(self._data[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def take(self, positions):
+        """Strings at positions (array of int), the offsets are looked up at once."""
+        positions = np.asarray(positions, dtype=np.int64)
+        data = self._data
+        return [str(data[start:end], 'utf-8') for start, end in zip(self._offsets_array[positions].tolist(), self._offsets_array[positions + 1].tolist())]
+
+
+def tiles(strings, positions, tile_size=TILE_SIZE):
+    """
+    (start, list of str) tiles of the strings at positions (array of int), start being the position in positions
+    of the first string of the tile. A SharedStrings column is decoded tile by tile, a list is given in one tile.
+    """
+    if isinstance(strings, SharedStrings):
+        for start in range(0, len(positions), tile_size):
+            yield start, strings.take(positions[start:start + tile_size])
+    elif len(positions) == len(strings):
+        yield 0, strings
+    else:
+        yield 0, [strings[i] for i in positions]
@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache, partial
+import numpy as np
 import pandas as pd
 from unidecode import unidecode
 import string
@@ -17,111 +19,121 @@ _compiled_misspelled_abbrs = {
     re.compile(p, flags=re.IGNORECASE): MISSPELLED[p]
     for p in _sorted_abbr_keys
 }
+# Cheap pre-check: the patterns above only run on the (rare) names that contain one of them
+_any_misspelled_regex = re.compile('|'.join(_sorted_abbr_keys), flags=re.IGNORECASE)
+
+# Specific replacements (including symbols like R, C, TM, ss, dashes)
+# Every key is a single character and no replacement introduces another key, so one str.translate
+# gives the same result as replacing them one after the other.
+_REPLACEMENTS = {
+    # Provided
+    '®': ' _r_ ', '©': ' _c_ ', '™': ' _tm_ ',
+    'ß': 'ss',
+    'α': ' _alpha_ ', 'β': ' _beta_ ', 'γ': ' _gamma_ ',
+    'δ': ' _delta_ ', 'ε': ' _epsilon_ ', 'ζ': ' _zeta_ ',
+    'η': ' _eta_ ', 'θ': ' _theta_ ', 'ι': ' _iota_ ',
+    'κ': ' _kappa_ ', 'λ': ' _lambda_ ', 'μ': ' _mu_ ',
+    'ν': ' _nu_ ', 'ξ': ' _xi_ ', 'ο': ' _omicron_ ',
+    'π': ' _pi_ ', 'ρ': ' _rho_ ', 'σ': ' _sigma_ ',
+    'τ': ' _tau_ ', 'υ': ' _upsilon_ ', 'φ': ' _phi_ ',
+    'χ': ' _chi_ ', 'ψ': ' _psi_ ', 'ω': ' _omega_ ',
+    '–': '-', '—': '-',
+    '\x00': ' ', # Null byte
+    '\u001d': ' ', # Group Separator
+    '\u200b': ' ', # Zero Width Space
+    '\u001c': ' ', # File Separator
+    '': ' ', # File Separator
+    '': ' ', # Group Separator
+    '': ' ', # Device Control 2
+    '': ' ', # Device Control 3
+    # Ligatures (examples)
+    'æ': 'ae', 'œ': 'oe',
+    # Symbols with common text equivalents or standardization
+    '&': ' and ', # Or just ' '
+    '×': 'x',
+    '±': '+-', # Or '+-'
+    # Standardize or remove quotes/apostrophes (Option: Remove all)
+    '"': '"', '‘': "'", '’': "'", '“': '"', '”': '"', '`': '', '´': '', "'": "'",
+    # Standalone diacritics (if not handled by normalization)
+    '¨': '',
+    # parentheses type
+    '{': '(', '}': ')',
+    '[': '(', ']': ')'
+}
+_replacements_table = str.maketrans(_REPLACEMENTS)
 
-def cleaning_id(id_str):
-    # 0. Handle None or non-string input
-    if id_str is None:
-        return None # Or return empty string '' depending on desired output for None
-    if not isinstance(id_str, str):
-        id_str = str(id_str)
+# Escape punctuation characters that are special in regex (like ., *, +, ?)
+_escaped_punctuation = re.escape(string.punctuation)
+# Add space AFTER punctuation if followed by a word character
+_punctuation_before_word_regex = re.compile(rf'([{_escaped_punctuation}])(\w)')
+# Add space BEFORE punctuation if preceded by a word character
+_punctuation_after_word_regex = re.compile(rf'(\w)([{_escaped_punctuation}])')
+_underscores_regex = re.compile(r'_{2,}')
+
+# Source columns repeat the same names a lot (holders, substances), cleaned values are memoized
+CLEANING_ID_CACHE_SIZE = 2 ** 16
 
-    
 
+@lru_cache(maxsize=CLEANING_ID_CACHE_SIZE)
+def _cleaning_id_str(id_str):
     # Apply normalization/removal rules using pre-compiled regex
-    for pattern, replacement in _compiled_misspelled_abbrs.items():
-        id_str = pattern.sub(replacement, id_str)
-
-    id_str = unidecode(id_str) # Convert to ASCII, removing diacritics
-    # 1. Initial Unicode Normalization (Optional but recommended for complex text)
-    # NFKD decomposes characters (e.g., 'é' -> 'e' + '´') and handles ligatures.
-    # The encode/decode trick attempts to remove combining diacritics.
-    # try:
-    #    # Decompose and remove combining marks
-    #    nfkd_form = unicodedata.normalize('NFKD', id_str)
-    #    cleaned_name = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-    # except Exception:
-    #    # Fallback if normalization fails
-    #    cleaned_name = id_str
-    cleaned_name = id_str # Using simpler replacements without full normalization for now
-
-    # # 2. Convert to lowercase
-    # cleaned_name = cleaned_name.lower()
-
-    # 3. Specific replacements (including symbols like R, C, TM, ss, dashes)
-    replacements = {
-        # Provided
-        '®': ' _r_ ', '©': ' _c_ ', '™': ' _tm_ ',
-        'ß': 'ss',
-        'α': ' _alpha_ ', 'β': ' _beta_ ', 'γ': ' _gamma_ ',
-        'δ': ' _delta_ ', 'ε': ' _epsilon_ ', 'ζ': ' _zeta_ ',
-        'η': ' _eta_ ', 'θ': ' _theta_ ', 'ι': ' _iota_ ',
-        'κ': ' _kappa_ ', 'λ': ' _lambda_ ', 'μ': ' _mu_ ',
-        'ν': ' _nu_ ', 'ξ': ' _xi_ ', 'ο': ' _omicron_ ',
-        'π': ' _pi_ ', 'ρ': ' _rho_ ', 'σ': ' _sigma_ ',
-        'τ': ' _tau_ ', 'υ': ' _upsilon_ ', 'φ': ' _phi_ ',
-        'χ': ' _chi_ ', 'ψ': ' _psi_ ', 'ω': ' _omega_ ',
-        '–': '-', '—': '-',
-        '\x00': ' ', # Null byte
-        '\u001d': ' ', # Group Separator
-        '\u200b': ' ', # Zero Width Space
-        '\u001c': ' ', # File Separator
-        '': ' ', # File Separator
-        '': ' ', # Group Separator
-        '': ' ', # Device Control 2
-        '': ' ', # Device Control 3
-        # Ligatures (examples)
-        'æ': 'ae', 'œ': 'oe',
-        # Symbols with common text equivalents or standardization
-        '&': ' and ', # Or just ' '
-        '×': 'x',
-        '±': '+-', # Or '+-'
-        # Standardize or remove quotes/apostrophes (Option: Remove all)
-        '"': '"', '‘': "'", '’': "'", '“': '"', '”': '"', '`': '', '´': '', "'": "'",
-        # Standalone diacritics (if not handled by normalization)
-        '¨': '',
-        # parentheses type
-        '{': '(', '}': ')',
-        '[': '(', ']': ')'
-    }
-    for old, new in replacements.items():
-        cleaned_name = cleaned_name.replace(old, new)
-
-    # # 4. Replace brackets with parentheses (Optional: or remove, or just normalize space)
-    # cleaned_name = cleaned_name.replace('[', '(').replace(']', ')')
-    # cleaned_name = cleaned_name.replace('{', '(').replace('}', ')')
-
-    # 5. Normalize spacing inside parentheses (do after potential bracket replacement)
+    if _any_misspelled_regex.search(id_str):
+        for pattern, replacement in _compiled_misspelled_abbrs.items():
+            id_str = pattern.sub(replacement, id_str)
+
+    # Convert to ASCII, removing diacritics (unidecode leaves ASCII input unchanged)
+    if not id_str.isascii():
+        id_str = unidecode(id_str)
+
+    cleaned_name = id_str.translate(_replacements_table)
+
+    # Normalize spacing inside parentheses
     cleaned_name = cleaned_name.replace('( ', '(').replace(' )', ')')
 
-    # 6. Replace remaining non-alphanumeric characters (excluding '.', '-', '(', ')') with space
-    # Keep period '.', hyphen '-', parentheses '()' as they might be significant
-    # Characters to replace with space: '#$%*+/\\:;<=>?@_\|~• (and any quotes if not removed above)
+    # Separate punctuation from words: "Let'sgo-fast V2.0" -> "Let ' sgo - fast V 2 . 0"
+    cleaned_name = _punctuation_before_word_regex.sub(r'\1 \2', cleaned_name)
+    cleaned_name = _punctuation_after_word_regex.sub(r'\1 \2', cleaned_name)
 
-    # cleaned_name = re.sub(r'[#\$%\*\+/\\:;<=>\?@_\|~•]', ' ', cleaned_name)
+    # Collapse multiple whitespace characters (including spaces from replacements) into one, strip the ends
+    cleaned_name = ' '.join(cleaned_name.split())
+    # collapsed multiple _ to single _
+    if '__' in cleaned_name:
+        cleaned_name = _underscores_regex.sub('_', cleaned_name)
 
-    # Escape punctuation characters that are special in regex (like ., *, +, ?)
-    escaped_punctuation = re.escape(string.punctuation)
-    # Pattern 1: Add space AFTER punctuation if followed by a word character
-    cleaned_name = re.sub(rf'([{escaped_punctuation}])(\w)', r'\1 \2', cleaned_name)
-    # Result so far: "Hello! Howareyou? Let'sgo-fast... V2.0"
+    return cleaned_name
 
-    # Pattern 2: Add space BEFORE punctuation if preceded by a word character
-    cleaned_name = re.sub(rf'(\w)([{escaped_punctuation}])', r'\1 \2', cleaned_name)
-    # Result: "Hello ! Howareyou ? Let ' sgo - fast ... V 2 . 0"
 
+def cleaning_id(id_str):
+    # Handle None or non-string input
+    if id_str is None:
+        return None # Or return empty string '' depending on desired output for None
+    if not isinstance(id_str, str):
+        id_str = str(id_str)
+    return _cleaning_id_str(id_str)
 
-    # 7. Collapse multiple whitespace characters (including spaces from replacements) into one
-    cleaned_name = re.sub(r'\s+', ' ', cleaned_name)
-    # collapsed multiple _ to single _
-    cleaned_name = re.sub(r'_{2,}', '_', cleaned_name)
 
-    # 8. Remove leading/trailing whitespace
-    cleaned_name = cleaned_name.strip()
+def cleaning_id_series(series: pd.Series) -> pd.Series:
+    """
+    Same result as series.apply(cleaning_id), but each distinct value is cleaned only once.
+    """
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        # Mixed values: factorize would merge 1, 1.0 and True, which don't give the same string
+        return series.map(cleaning_id)
 
-    # 9. Aggressive final option: Remove all non alphanumeric except space and hyphen
-    # cleaned_name = re.sub(r'[^a-z0-9 \-]', '', cleaned_name)
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    cleaned_uniques = np.empty(len(uniques), dtype=object)
+    cleaned_uniques[:] = [cleaning_id(value) for value in uniques]
+
+    values = np.empty(len(series), dtype=object)
+    found = codes >= 0
+    values[found] = cleaned_uniques[codes[found]]
+    # Missing values (None, NaN, NA) are cleaned individually, they don't all give the same result
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        originals = series.to_numpy(dtype=object)
+        values[missing] = [cleaning_id(originals[i]) for i in missing]
+    return pd.Series(values, index=series.index, name=series.name)
 
-    return cleaned_name
 
 def remove_chars_in_match(match, separator=None):
   # Get the content captured inside the parentheses (group 1)
@@ -207,6 +219,49 @@ def get_splitted_rows(df: pd.DataFrame, item_column: str, prefix: str, separator
 
     return result
 
+
+# --- Vectorized splitting (pandas str operations + explode) ---
+
+def split_items(values: pd.Series, separator: str) -> pd.Series:
+    """
+    Vectorized get_splitted_items: one entry per item, indexed by the row it comes from.
+    Separators and pipes inside parentheses are removed, then values are split on '|' and on
+    separator followed by whitespace; empty items are dropped.
+    """
+    values = values.dropna()
+    if values.empty:
+        return values.astype(object)
+    cleaned = values.str.replace(r'\((.*?)\)', partial(remove_chars_in_match, separator=separator), regex=True)
+    segments = cleaned.str.split('|', regex=False).explode().str.strip()
+    segments = segments[segments != '']
+    items = segments.str.split(rf'{separator}\s+', regex=True).explode().str.strip()
+    return items[items != '']
+
+
+def get_unique_items_df(df: pd.DataFrame, item_column: str, separator = None) -> pd.DataFrame:
+    """Vectorized get_unique_items: one row per distinct item (first seen first) in column item_column."""
+    if separator is not None:
+        items = split_items(df[item_column], separator)
+    else:
+        items = df[item_column].dropna()
+    return pd.DataFrame({item_column: items.unique()})
+
+
+def get_splitted_rows_df(df: pd.DataFrame, item_column: str, prefix: str, separator = None) -> pd.DataFrame:
+    """
+    Vectorized get_splitted_rows: every row is repeated once per item of item_column (rows without a value
+    are dropped) and, when prefix is set, every column name gets the f"{prefix}_" prefix.
+    """
+    rows = df.reset_index(drop=True)
+    rows = rows[rows[item_column].notna()]
+    if separator is not None:
+        items = split_items(rows[item_column], separator)
+        rows = rows.loc[items.index]
+        rows[item_column] = items.to_numpy()
+    if prefix is not None:
+        rows = rows.add_prefix(f"{prefix}_")
+    return rows.reset_index(drop=True)
+
 if __name__ == "__main__":
 
     # --- Example Usage ---
@@ -0,0 +1,128 @@
+import re
+
+from utils import exact_match
+from utils import fuzzy_matching
+from utils import config
+
+# --- Deterministic substance form resolver ---
+# The aggressively cleaned name is split into base tokens and form tokens (salts / counter-ions and
+# hydration states). The form lexicon is derived from SUBSTANCE_ABBREVIATIONS: the replacements of its
+# salt and hydration entries, plus the few counter-ions and hydrates it does not list. Pharmacopeias,
+# dosage forms and routes are already removed by the cleaning.
+# A pair is answered locally only when both names have the same (non-empty) base tokens and no token that
+# needs judgment (free base, dilutions, intermediates, other languages give different bases anyway):
+#   same base, same forms      -> have_same_base, have_same_form, not is_diluted
+#   same base, different forms -> have_same_base, not have_same_form, not is_diluted
+# The base must name an active substance: a base made only of alkyl / element words ("ethyl acetate" vs
+# "ethyl chloride", where the "form" is the substance) or a one-word base with forms on one side only is
+# left to the LLM, as everything else. 'hydrogen' is a weak base word, not a form: "hydrogen peroxide" and
+# "peroxide" get different bases, and so do the "hydrogen sulfate" / "sulfate" salts of a substance.
+
+RULES_PROVENANCE = "rules"
+
+# SUBSTANCE_ABBREVIATIONS replacements that are not a salt or a hydration state
+_NON_FORM_REPLACEMENTS = {'aqueous', 'dilute', 'saturated', 'recombinant', 'veterinary'}
+EXTRA_FORM_TOKENS = {
+    'hydrate', 'disodium', 'dipotassium', 'maleate', 'fumarate', 'tartrate', 'bitartrate', 'citrate',
+    'phosphate', 'acetate', 'succinate', 'chloride', 'bromide', 'nitrate',
+    'lactate', 'gluconate', 'carbonate', 'bicarbonate', 'oxalate', 'malate', 'stearate', 'palmitate', 'propionate',
+}
+# Grade words left by the cleaning, neither base nor form
+GRADE_TOKENS = {'micronized', 'micronised', 'sterile', 'api'}
+# Tokens the rules can't judge: the pair goes to the LLM
+AMBIGUOUS_TOKENS = {
+    'base', 'free', 'intermediate', 'for', 'in', 'homoeopathic', 'homeopathic', 'trituration', 'mother', 'tincture',
+    'solution', 'dilution', 'salt', 'form', 'polymorph', 'crystalline', 'amorphous', 'racemic', 'ester',
+} | _NON_FORM_REPLACEMENTS
+# Alkyl groups and elements: not an active substance on their own
+WEAK_BASE_TOKENS = {
+    'methyl', 'ethyl', 'propyl', 'isopropyl', 'butyl', 'benzyl', 'phenyl', 'amyl', 'hydrogen', 'oxygen', 'nitrogen',
+    'ferric', 'ferrous', 'cupric', 'cuprous', 'stannous', 'mercuric', 'iron', 'copper', 'zinc',
+}
+# Homeopathic potencies (D4, C30), percentages and ratios
+_ambiguous_token_regex = re.compile(r'^(?:[dc]\d+|\d+x|.*%.*|\d+:\d+)$')
+
+
+def _canonical(token):
+    return exact_match.canonical_key(token, config.MappingType.SUBSTANCE)
+
+# Abbreviations containing a 'y' (mesylate, besylate...) are not expanded by the cleaning, which folds
+# 'y' into 'i' first: their canonical spelling is mapped to the one of the replacement here
+FORM_SYNONYMS = {
+    _canonical(pattern[2:-2]): _canonical(replacement)
+    for pattern, replacement in fuzzy_matching.SUBSTANCE_ABBREVIATIONS.items()
+    if replacement and replacement not in _NON_FORM_REPLACEMENTS and ' ' not in pattern
+}
+FORM_TOKENS = set(FORM_SYNONYMS.values()) | {_canonical(token) for token in EXTRA_FORM_TOKENS}
+_WEAK_BASE_TOKENS = {_canonical(token) for token in WEAK_BASE_TOKENS}
+
+
+def split_forms(cleaned_name):
+    """
+    (base tokens, form tokens, ambiguous) of an aggressively cleaned substance name. The base is sorted
+    ("13c urea" / "urea 13c"), the forms are a set.
+    """
+    base = []
+    forms = set()
+    ambiguous = False
+    for token in _canonical(cleaned_name).split():
+        token = FORM_SYNONYMS.get(token, token)
+        if token in FORM_TOKENS:
+            forms.add(token)
+        elif token in GRADE_TOKENS:
+            continue
+        else:
+            if token in AMBIGUOUS_TOKENS or _ambiguous_token_regex.match(token):
+                ambiguous = True
+            base.append(token)
+    return tuple(sorted(base)), frozenset(forms), ambiguous
+
+
+class SubstanceFormResolver:
+    """Answers the SubstanceMapping fields of the obvious candidate pairs, counts what it resolves."""
+    def __init__(self):
+        self.splits = {}
+        self.stats = {'resolved_same_form': 0, 'resolved_other_form': 0, 'ambiguous': 0, 'other_base': 0, 'weak_base': 0}
+
+    def split(self, name):
+        split = self.splits.get(name)
+        if split is None:
+            split = split_forms(fuzzy_matching.clean_product_name_aggressively_pharma(name))
+            self.splits[name] = split
+        return split
+
+    def resolve(self, item_1, item_2):
+        """SubstanceMapping verdict of the pair, or None when the LLM has to answer."""
+        base_1, forms_1, ambiguous_1 = self.split(item_1)
+        base_2, forms_2, ambiguous_2 = self.split(item_2)
+        if ambiguous_1 or ambiguous_2:
+            self.stats['ambiguous'] += 1
+            return None
+        if not base_1 or base_1 != base_2:
+            self.stats['other_base'] += 1
+            return None
+        if all(token in _WEAK_BASE_TOKENS for token in base_1) or (len(base_1) == 1 and bool(forms_1) != bool(forms_2)):
+            # The leftover base may not be the substance, or the "form" of one side may be part of its name
+            self.stats['weak_base'] += 1
+            return None
+        same_form = forms_1 == forms_2
+        self.stats['resolved_same_form' if same_form else 'resolved_other_form'] += 1
+        return {
+            'active_substance_1': item_1,
+            'active_substance_2': item_2,
+            'have_same_base': True,
+            'have_same_form': same_form,
+            'is_diluted': False,
+        }
+
+    def resolve_candidates(self, mappings_candidate):
+        """Returns (verdicts resolved locally, candidates left for the LLM)."""
+        verdicts = []
+        left = []
+        for mapping in mappings_candidate:
+            verdict = self.resolve(mapping['item_1'], mapping['item_2'])
+            if verdict is None:
+                left.append(mapping)
+            else:
+                verdicts.append(verdict)
+        return verdicts, left
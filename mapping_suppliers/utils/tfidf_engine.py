@@ -0,0 +1,113 @@
+import numpy as np
+import scipy.sparse as sparse
+
+# --- Character n-gram TF-IDF nearest neighbours ---
+# Alternative to the all-pairs scan: each cleaned name becomes a sparse vector of its character trigrams
+# (TF-IDF weights, L2 normalized rows), the top-k cosine neighbours of the source_1 names are found with
+# sparse matrix products over blocks of source_1 rows. The rapidfuzz checks of process_source1_item then
+# only run on those neighbours (and the first-word matches of the fallback).
+# Trigrams found in more than max_df of the source_2 names (" ph", "pha", "arm"...) are left out: they
+# barely move the cosine and would make every block product almost dense.
+# The blocks of source_1 rows are independent, main.py dispatches them to its process pool (--cores).
+# SUBSTANCE mappings only (python -m checks.check_tfidf_recall): top 1000 with max_df 0.2 finds 100.0% of the
+# candidates of the exhaustive scan on 20k and 60k synthetic names (11 missed out of 23812 at 60k), 12x faster
+# and ~100 MB per block product at 60k; top 300 with max_df 0.02 only found 83%. Supplier names have no
+# such neighbourhood: the exhaustive scan keeps ~4% of source_2 per item (weak pairs sharing generic words),
+# top 3000 with max_df 1.0 finds 94% of them at 20k but 61% at 60k, main.py runs the default engine instead.
+
+NGRAM_SIZE = 3
+DEFAULT_TOP_K = 1000
+DEFAULT_BLOCK_ROWS = 512
+DEFAULT_MAX_DF = 0.2
+CSR_PARTS = ('data', 'indices', 'indptr')
+
+
+def char_ngrams(name, n=NGRAM_SIZE):
+    """Character n-grams of the lowered name, padded with a space on both sides."""
+    padded = f" {name.lower()} "
+    if len(padded) <= n:
+        return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+class TfidfIndex:
+    def __init__(self, names, n=NGRAM_SIZE, max_df=DEFAULT_MAX_DF):
+        """names: the cleaned source_2 names, row positions are the ones returned by the neighbour lookups."""
+        self.n = n
+        self.vocabulary = {}
+        counts = self._count_matrix(names, grow=True)
+        document_frequency = np.bincount(counts.indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + len(names)) / (1 + document_frequency)) + 1).astype(np.float32)
+        if max_df is not None and len(names):
+            # Dropped n-grams keep their vocabulary entry with a zero weight
+            self.idf[document_frequency > max_df * len(names)] = 0
+        self.matrix = self._weight(counts)
+        # Transposed once: the block products are source_1 block x (n-grams x source_2)
+        self.matrix_t = self.matrix.T.tocsr()
+
+    def _count_matrix(self, names, grow):
+        indptr = [0]
+        indices = []
+        data = []
+        for name in names:
+            row = {}
+            for gram in char_ngrams(name, self.n) if name else ():
+                column = self.vocabulary.get(gram)
+                if column is None:
+                    if not grow:
+                        continue
+                    column = self.vocabulary[gram] = len(self.vocabulary)
+                row[column] = row.get(column, 0) + 1
+            indices.extend(row.keys())
+            data.extend(row.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(names), len(self.vocabulary))
+        )
+
+    def _weight(self, counts):
+        counts.data *= self.idf[counts.indices]
+        counts.eliminate_zeros()
+        return _normalize_rows(counts).tocsr()
+
+    def transform(self, names):
+        """TF-IDF rows of other names (source_1), n-grams unknown to source_2 are ignored."""
+        return self._weight(self._count_matrix(names, grow=False))
+
+    def neighbours(self, query_matrix, top_k=DEFAULT_TOP_K, block_rows=DEFAULT_BLOCK_ROWS):
+        """
+        Yields (query row, source_2 positions) of the top_k cosine neighbours of every query row
+        (fewer when fewer source_2 names share an n-gram), one block of rows per sparse product.
+        """
+        for start in range(0, query_matrix.shape[0], block_rows):
+            for row, columns in block_neighbours(query_matrix[start:start + block_rows], self.matrix_t, top_k):
+                yield start + row, columns
+
+
+def block_neighbours(query_block, matrix_t, top_k=DEFAULT_TOP_K):
+    """Yields (row of the block, source_2 positions) of the top_k neighbours of the rows of one query block (one sparse product)."""
+    similarities = (query_block @ matrix_t).tocsr()
+    for row in range(similarities.shape[0]):
+        row_start, row_end = similarities.indptr[row], similarities.indptr[row + 1]
+        columns = similarities.indices[row_start:row_end]
+        if len(columns) > top_k:
+            best = np.argpartition(-similarities.data[row_start:row_end], top_k - 1)[:top_k]
+            columns = columns[best]
+        yield row, np.sort(columns).astype(np.int64)
+
+
+def csr_arrays(matrix):
+    """{'data', 'indices', 'indptr'} arrays of a CSR matrix, to put it in shared memory (utils/shared_corpus.py)."""
+    return {part: getattr(matrix, part) for part in CSR_PARTS}
+
+
+def csr_from_arrays(arrays, shape):
+    """CSR matrix on the arrays of csr_arrays, without copying them."""
+    return sparse.csr_matrix(tuple(arrays[part] for part in CSR_PARTS), shape=shape, copy=False)
@@ -0,0 +1,61 @@
+import numpy as np
+
+# --- Inverted token index over cleaned source_2 names ---
+# Built once per run in the parent process and handed to the pool workers.
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class TokenIndex:
+    def __init__(self, names):
+        """names: the cleaned source_2 names, positions in this list are the ones returned by the lookups."""
+        self.size = len(names)
+        postings = {}
+        first_tokens = {}
+        for position, name in enumerate(names):
+            tokens = name.lower().split() if isinstance(name, str) else []
+            if not tokens:
+                continue
+            first_tokens.setdefault(tokens[0], []).append(position)
+            for token in set(tokens):
+                postings.setdefault(token, []).append(position)
+
+        self.postings = {token: np.asarray(positions, dtype=np.int32) for token, positions in postings.items()}
+        self.first_tokens = {token: np.asarray(positions, dtype=np.int32) for token, positions in first_tokens.items()}
+
+    def document_frequency(self, token):
+        return len(self.postings.get(token, _EMPTY))
+
+    def first_token_matches(self, name):
+        """Positions of the names whose first word is the first word of name."""
+        tokens = name.lower().split()
+        if not tokens:
+            return _EMPTY
+        return self.first_tokens.get(tokens[0], _EMPTY)
+
+    def shortlist(self, name, max_size):
+        """
+        Positions of the names sharing at least one rare token with name.
+        Tokens are taken from the rarest up while the shortlist stays under max_size;
+        the rarest token is always used so that a name made of common words still gets candidates.
+        """
+        tokens = sorted(
+            (token for token in set(name.lower().split()) if token in self.postings),
+            key=self.document_frequency
+        )
+        selected = []
+        total = 0
+        for token in tokens:
+            postings = self.postings[token]
+            if selected and total + len(postings) > max_size:
+                break
+            selected.append(postings)
+            total += len(postings)
+
+        if not selected:
+            return _EMPTY
+        return np.unique(np.concatenate(selected))
+
+    def candidates(self, name, max_size):
+        """Shortlist plus the first-word matches, which are always needed by the first-word fallback."""
+        return np.union1d(self.shortlist(name, max_size), self.first_token_matches(name))
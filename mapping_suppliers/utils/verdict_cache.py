@@ -0,0 +1,215 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from utils import config, request_format
+from utils.batch_ret_util import parse_mappings_content
+
+# --- Persistent LLM verdict cache ---
+# Verdicts are keyed by (item_1, item_2, hash of the system prompt, model, hash of the response_format schema),
+# so a change of prompt, model or schema never serves a verdict produced under other conditions.
+# The layout of the request (utils/request_format.py or the previous single system message) isn't part of the key.
+# The cache is filled from the outputs of the previous runs (<mapping_name>/batches/*/outputs), each verdict
+# is checked against the request it answers (same run inputs/*.jsonl) before being stored.
+
+LOCAL_VERDICTS_FILENAME = "local_verdicts.jsonl"
+MAPPINGS_HEADER = "\nHere are the mappings (in JSON format):\n"
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_schema(response_format: dict) -> str:
+    return hash_text(json.dumps(response_format, sort_keys=True))
+
+
+def get_cache_context(mapping_config: config.MappingConfig):
+    """(prompt hash, model, schema hash) of the requests the current configuration would send."""
+    return (
+        hash_text(mapping_config.system_prompt),
+        mapping_config.model,
+        hash_schema(type_to_response_format_param(mapping_config.response_format)),
+    )
+
+
+def parse_request(request: dict):
+    """
+    Returns (cache context, list of (item_1, item_2)) for a request line of a batch input file,
+    or None when the request doesn't have the expected shape.
+    """
+    body = request.get('body', {})
+    messages = body.get('messages') or []
+    if not messages or 'response_format' not in body:
+        return None
+    content = messages[0].get('content', '')
+    if len(messages) > 1:
+        # system: f"{system_prompt}{pairs format instructions}", user: numbered rows of the pairs
+        marker_position = content.find(request_format.PAIRS_FORMAT_MARKER)
+        if marker_position < 1:
+            return None
+        system_prompt = content[:marker_position]
+        try:
+            pairs = request_format.decode_pairs(messages[1].get('content', ''))
+        except ValueError:
+            return None
+    else:
+        # Previous layout, a single system message: f"\n{system_prompt}{MAPPINGS_HEADER}{mappings json}\n"
+        header_position = content.find(MAPPINGS_HEADER)
+        if header_position < 1:
+            return None
+        system_prompt = content[1:header_position]
+        try:
+            pairs = [(pair['item_1'], pair['item_2']) for pair in json.loads(content[header_position + len(MAPPINGS_HEADER):])]
+        except json.JSONDecodeError:
+            return None
+    context = (hash_text(system_prompt), body.get('model'), hash_schema(body['response_format']))
+    return context, pairs
+
+
+class VerdictCache:
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                item_1 TEXT NOT NULL,
+                item_2 TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                custom_id TEXT,
+                PRIMARY KEY (item_1, item_2, prompt_hash, model, schema_hash)
+            )
+        """)
+        # Output files already read, skipped by the next backfills unless they changed
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS ingested_outputs (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def put_many(self, verdicts):
+        """verdicts: iterable of (item_1, item_2, context, verdict dict, custom_id)."""
+        rows = [
+            (item_1, item_2, *context, json.dumps(verdict), custom_id)
+            for item_1, item_2, context, verdict, custom_id in verdicts
+        ]
+        self.connection.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+        return len(rows)
+
+    def lookup(self, pairs, context):
+        """Returns {(item_1, item_2): verdict} for the pairs already answered under the given context."""
+        wanted = set(pairs)
+        found = {}
+        rows = self.connection.execute(
+            "SELECT item_1, item_2, verdict FROM verdicts WHERE prompt_hash = ? AND model = ? AND schema_hash = ?",
+            context
+        )
+        for item_1, item_2, verdict in rows:
+            if (item_1, item_2) in wanted:
+                found[(item_1, item_2)] = json.loads(verdict)
+        return found
+
+    def _is_ingested(self, path):
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT size, mtime FROM ingested_outputs WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def _mark_ingested(self, path):
+        stat = os.stat(path)
+        self.connection.execute("INSERT OR REPLACE INTO ingested_outputs VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime))
+        self.connection.commit()
+
+    def backfill_from_batches(self, batches_folder: str, mapping_config: config.MappingConfig):
+        """
+        Stores the verdicts of every run folder of batches_folder. A verdict is kept only when its pair
+        is one of the pairs of the request it answers (custom_id found in the run input files).
+        """
+        item_1_key, item_2_key = mapping_config.response_item_1_key, mapping_config.response_item_2_key
+        stored = 0
+        rejected = 0
+        for run_folder in sorted(glob.glob(os.path.join(batches_folder, '*'))):
+            output_files = [path for path in sorted(glob.glob(os.path.join(run_folder, 'outputs', '*.jsonl'))) if not self._is_ingested(path)]
+            if not output_files:
+                continue
+
+            requests = {}
+            for input_file in glob.glob(os.path.join(run_folder, 'inputs', '*.jsonl')):
+                if os.path.basename(input_file) == LOCAL_VERDICTS_FILENAME:
+                    continue
+                with open(input_file, 'r') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        request = json.loads(line)
+                        parsed = parse_request(request)
+                        if parsed is not None:
+                            requests[request['custom_id']] = parsed
+
+            for output_file in output_files:
+                verdicts = []
+                with open(output_file, 'r') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        response = json.loads(line)
+                        request = requests.get(response.get('custom_id'))
+                        body = (response.get('response') or {}).get('body') or {}
+                        if request is None or not body.get('choices'):
+                            continue
+                        context, pairs = request
+                        pairs = set(pairs)
+                        for choice in body['choices']:
+                            content, _ = parse_mappings_content(choice['message']['content'])
+                            for mapping in (content or {}).get('mappings', []):
+                                pair = (mapping.get(item_1_key), mapping.get(item_2_key))
+                                if pair in pairs:
+                                    verdicts.append((*pair, context, mapping, response['custom_id']))
+                                else:
+                                    rejected += 1
+                stored += self.put_many(verdicts)
+                self._mark_ingested(output_file)
+
+        if stored or rejected:
+            print(f"Verdict cache: {stored} verdicts stored, {rejected} rejected (pair not found in the request).")
+        return stored
+
+    def close(self):
+        self.connection.close()
+
+
+def write_local_verdicts(path: str, verdicts, provenance: str):
+    """Verdicts served without calling the API for a run (appended), read back by process_batch."""
+    with open(path, 'a') as f:
+        for verdict in verdicts:
+            f.write(json.dumps({"provenance": provenance, "verdict": verdict}) + "\n")
+
+
+def read_local_verdicts(path: str):
+    """Returns the list of {"provenance", "verdict"} records written for a run (empty if none)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_local_contents(local_verdicts):
+    """Local verdicts as parsed response contents, one per provenance ({"mappings", "provenance"})."""
+    mappings_by_provenance = {}
+    for local_verdict in local_verdicts:
+        mappings_by_provenance.setdefault(local_verdict['provenance'], []).append(local_verdict['verdict'])
+    return [{'mappings': mappings, 'provenance': provenance} for provenance, mappings in mappings_by_provenance.items()]